@@ -0,0 +1,244 @@
+"""
+Interface for analyzing the execution plans of the recorded workload and advising secondary indexes
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import json
+import re
+import pymysql
+from catalog import SchemaCatalog
+from sqlcreator import SqlCreator, ddl_change
+from workload import WORKLOAD
+
+
+_system_databases = ('information_schema', 'mysql', 'performance_schema', 'sys')
+_table_pattern = re.compile(r'\bFROM\s+`?([\w$]+)`?\.`?([\w$]+)`?', re.IGNORECASE)
+_equality_pattern = re.compile(r'`?([\w$]+)`?\s*(?:=\s*%s|IN\s*\(|IS\s+NULL)', re.IGNORECASE)
+# LIKE uses an index only for a pattern without a leading wildcard, LIKE '%x%' scans anyway
+_range_pattern = re.compile(r"`?([\w$]+)`?\s*(?:<=|>=|<|>|BETWEEN\b|LIKE\s+(?!'[%_]))", re.IGNORECASE)
+_like_placeholder = re.compile(r'\bLIKE\s*$', re.IGNORECASE)
+_order_pattern = re.compile(r'\bORDER\s+BY\s+(.+?)(?:\s+LIMIT\b|;|$)', re.IGNORECASE)
+
+
+def _bind_like_patterns(sql, args):
+    """ the statement with the arguments of its LIKE placeholders written in, other placeholders are kept """
+    if not isinstance(args, (list, tuple)):
+        return sql
+    parts = sql.split('%s')
+    if len(parts) != len(args) + 1:
+        return sql
+    bound = parts[0]
+    for part, arg in zip(parts[1:], args):
+        if _like_placeholder.search(bound) and isinstance(arg, str):
+            bound += "'%s'" % arg.replace("'", "''")
+        else:
+            bound += '%s'
+        bound += part
+    return bound
+
+
+def _where_clause(sql):
+    match = re.search(r'\bWHERE\s+(.+?)(?:\s+ORDER\s+BY\b|\s+LIMIT\b|;|$)', sql, re.IGNORECASE)
+    return match.group(1) if match else ''
+
+
+class QueryAnalyzer(SchemaCatalog):
+    """ Run EXPLAIN FORMAT=JSON on statements and advise indexes for the recorded workload, subclass of SchemaCatalog
+
+    Interface for explaining one statement
+    Interface for explaining all recorded SELECT statements
+    Interface for recommending secondary indexes of frequently filtered or sorted columns
+    Interface for creating the recommended indexes
+
+    """
+
+    def explain(self, sql, args=None):
+        """ Interface for reading the execution plan of a SELECT statement
+
+        Parameters
+        ----------
+        sql: String
+            a SELECT statement, may contain %s placeholders
+        args: list
+            values bound to the placeholders of sql
+
+        Returns
+        -------
+        plan: dict
+            {"tables": [{"table": "table1", "access_type": "ALL", "rows_examined": 1000, "key": None,
+                         "possible_keys": [], "filtered": 10.0}],
+             "full_scan": True, "index_used": False, "using_filesort": True, "query_cost": 101.5}
+
+        """
+        cur = self.execute_sql('EXPLAIN FORMAT=JSON ' + sql.rstrip().rstrip(';'), args or None)
+        document = json.loads(list(cur.fetchone().values())[0])
+        block = document.get('query_block', {})
+        tables = []
+        using_filesort = [False]
+
+        def walk(node):
+            if isinstance(node, dict):
+                if node.get('using_filesort') is True:
+                    using_filesort[0] = True
+                if 'table_name' in node and 'access_type' in node:
+                    tables.append({'table': node['table_name'],
+                                   'access_type': node['access_type'],
+                                   'rows_examined': int(node.get('rows_examined_per_scan', 0)),
+                                   'key': node.get('key'),
+                                   'possible_keys': node.get('possible_keys', []),
+                                   'filtered': float(node.get('filtered', 100))})
+                for value in node.values():
+                    walk(value)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value)
+
+        walk(block)
+        cost = block.get('cost_info', {}).get('query_cost')
+        return {'tables': tables,
+                'full_scan': any(table['access_type'] == 'ALL' for table in tables),
+                'index_used': any(table['key'] for table in tables),
+                'using_filesort': using_filesort[0],
+                'query_cost': float(cost) if cost is not None else None}
+
+    def analyze_workload(self, min_count=1):
+        """ Interface for explaining every recorded SELECT statement on user tables
+
+        Parameters
+        ----------
+        min_count: int
+            only statements executed at least this many times are explained
+
+        Returns
+        -------
+        reports: list
+            the workload entries, each with the key "plan" set by explain() or "error" if it cannot be explained
+
+        """
+        reports = []
+        for entry in WORKLOAD.entries(min_count):
+            match = _table_pattern.search(entry['sql'])
+            if match is None or match.group(1) in _system_databases:
+                continue
+            entry['database'], entry['table'] = match.group(1), match.group(2)
+            try:
+                entry['plan'] = self.explain(entry['sql'], entry['args'])
+            except (pymysql.err.Error, ValueError) as error_info:
+                entry['error'] = str(error_info)
+            reports.append(entry)
+        return reports
+
+    def recommend_indexes(self, min_count=2, reports=None):
+        """ Interface for recommending secondary indexes for the recorded workload
+
+        Statements doing a full scan or a filesort are parsed for their filtered and sorted columns,
+        the recommended index puts equality columns first, then one range column, or the sort columns
+        Indexes whose columns are already a prefix of an existing index are not recommended
+
+        Parameters
+        ----------
+        min_count: int
+            only statements executed at least this many times are considered
+        reports: list
+            the result of analyze_workload, analyzed again if None
+
+        Returns
+        -------
+        recommendations: list
+            [{"database": "test", "table": "table1", "columns": ["name", "id"], "name": "idx_name_id",
+              "sql": "ALTER TABLE `test`.`table1` ADD INDEX `idx_name_id` (`name`, `id`);",
+              "queries": 12, "rows_examined": 120000}]
+
+        """
+        if reports is None:
+            reports = self.analyze_workload(min_count)
+        candidates = {}
+        for report in reports:
+            plan = report.get('plan')
+            if plan is None or report['count'] < min_count:
+                continue
+            if not plan['full_scan'] and not plan['using_filesort']:
+                continue
+            columns = self._index_columns(report['sql'], report.get('args'))
+            if not columns:
+                continue
+            key = (report['database'], report['table'], tuple(columns))
+            candidate = candidates.setdefault(key, {'queries': 0, 'rows_examined': 0})
+            candidate['queries'] += report['count']
+            candidate['rows_examined'] += report['count'] * sum(table['rows_examined'] for table in plan['tables'])
+
+        recommendations = []
+        for (database_name, table_name), group in self._group_by_table(candidates).items():
+            table = self.table(database_name, table_name)
+            if table is None:
+                continue
+            existing = [index['columns'] for index in table['indexes']]
+            known = set(column['name'] for column in table['columns'])
+            for columns, candidate in sorted(group, key=lambda item: item[1]['rows_examined'], reverse=True):
+                if not set(columns) <= known:
+                    continue
+                if any(index[:len(columns)] == list(columns) for index in existing):
+                    continue
+                name = ('idx_' + '_'.join(columns))[:64]
+                recommendations.append({
+                    'database': database_name, 'table': table_name, 'columns': list(columns), 'name': name,
+                    'sql': 'ALTER TABLE `%s`.`%s` ADD INDEX `%s` (%s);' % (
+                        database_name, table_name, name, ', '.join('`%s`' % column for column in columns)),
+                    'queries': candidate['queries'], 'rows_examined': candidate['rows_examined']})
+                existing.append(list(columns))
+        return recommendations
+
+    def create_indexes(self, recommendations):
+        """ Interface for creating recommended indexes
+
+        Parameters
+        ----------
+        recommendations: list
+            items returned by recommend_indexes
+
+        Returns
+        -------
+        status: String
+            The number of indexes created and total indexes: (<created>-<total>)
+
+        """
+        count = 0
+        for recommendation in recommendations:
+            try:
+                self.commit_sql(recommendation['sql'])
+                count = count + 1
+            except pymysql.err.Error:
+                print("Sql Error: %s 语句存在错误，并没有被执行！" % recommendation['sql'])
+                continue
+            # the catalog, table versions and profiles of the table are refreshed by the commit listeners
+            SqlCreator._notify_commit([ddl_change(recommendation['database'], recommendation['table'])])
+        return str(count) + '-' + str(len(recommendations))
+
+    @staticmethod
+    def _index_columns(sql, args=None):
+        where = _where_clause(_bind_like_patterns(sql, args))
+        # keyset conditions repeat the sort columns, they are covered by the ORDER BY part
+        where = re.sub(r'\(\(.*\)\)', '', where)
+        equality = []
+        for column in _equality_pattern.findall(where):
+            if column not in equality:
+                equality.append(column)
+        ranges = [column for column in _range_pattern.findall(where)
+                  if column not in equality and column.upper() not in ('AND', 'OR', 'NOT')]
+        columns = list(equality)
+        if ranges:
+            columns.append(ranges[0])
+        else:
+            match = _order_pattern.search(sql)
+            if match is not None:
+                for item in match.group(1).split(','):
+                    column = item.strip().split()[0].strip('`')
+                    if column not in columns:
+                        columns.append(column)
+        return columns[:5]
+
+    @staticmethod
+    def _group_by_table(candidates):
+        groups = {}
+        for (database_name, table_name, columns), candidate in candidates.items():
+            groups.setdefault((database_name, table_name), []).append((columns, candidate))
+        return groups
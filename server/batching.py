@@ -0,0 +1,142 @@
+"""
+Interface for sizing batched statements
+    The number of rows per statement follows the packet limit of the server and the observed commit latency
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import threading
+import metrics
+
+
+PACKET_TOO_LARGE = (1153, 1301)     # ER_NET_PACKET_TOO_LARGE, ER_WARN_ALLOWED_PACKET_OVERFLOWED
+LOCK_WAIT = (1205,)                 # ER_LOCK_WAIT_TIMEOUT
+DEADLOCK = (1213,)                  # ER_LOCK_DEADLOCK
+
+
+def error_code(error):
+    """ Returns the MySQL error number of a pymysql error, None if it has none """
+    if error.args and isinstance(error.args[0], int):
+        return error.args[0]
+    return None
+
+
+class AdaptiveBatcher:
+    """ Choose the number of rows of the batched statements of one table, AIMD-style
+
+    A statement committed within target_seconds grows the batch by step rows (additive increase),
+    a slower statement, a lock wait timeout or a deadlock halves it (multiplicative decrease),
+    so the batch settles near the largest size the table commits without stalling
+    The batch never holds more rows than fit in packet_fraction of max_allowed_packet,
+    judged by the average encoded size of the rows committed so far
+    A packet too large error halves the batch and the byte limit of the statements
+
+    Attributions:
+    size: the current number of rows of a batch
+    minimum, maximum: the bounds of size
+    step: the rows added after a fast statement
+    target_seconds: the commit latency of a statement above which the batch shrinks
+    packet_bytes: max_allowed_packet of the server, None until known
+    row_bytes: the moving average of the encoded size of a row, None until a statement is committed
+    backoffs: the number of decreases by reason, 'slow', 'lock_wait', 'deadlock' or 'packet'
+
+    """
+    packet_fraction = 0.8
+    _batchers = {}
+    _batchers_lock = threading.Lock()
+
+    def __init__(self, initial=1000, minimum=1, maximum=50000, step=None, target_seconds=0.5):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step or max(initial // 10, 1)
+        self.target_seconds = target_seconds
+        self.packet_bytes = None
+        self.row_bytes = None
+        self.backoffs = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, database_name, table_name, initial=1000):
+        """ Returns the batcher of a table, shared by every SqlCreator of the process """
+        key = (database_name, table_name)
+        with cls._batchers_lock:
+            batcher = cls._batchers.get(key)
+            if batcher is None:
+                batcher = cls(initial)
+                cls._batchers[key] = batcher
+            return batcher
+
+    def max_bytes(self):
+        """ Returns the byte limit of a statement, None if max_allowed_packet is unknown """
+        if self.packet_bytes is None:
+            return None
+        return int(self.packet_bytes * self.packet_fraction)
+
+    def rows(self):
+        """ Returns the number of rows of the next statement """
+        with self._lock:
+            size = self.size
+            limit = self.max_bytes()
+            if limit is not None and self.row_bytes:
+                size = min(size, int(limit / self.row_bytes))
+            return max(min(size, self.maximum), self.minimum)
+
+    def success(self, rows, seconds, statement_bytes=None):
+        """ record a committed statement of rows rows which took seconds and had statement_bytes bytes """
+        if rows <= 0:
+            return
+        with self._lock:
+            if statement_bytes:
+                row_bytes = statement_bytes / rows
+                self.row_bytes = row_bytes if self.row_bytes is None else 0.8 * self.row_bytes + 0.2 * row_bytes
+            if seconds <= self.target_seconds:
+                # only grow a batch which was actually full, a short tail says nothing about larger ones
+                if rows >= self.size:
+                    self.size = min(self.size + self.step, self.maximum)
+            else:
+                self._decrease('slow')
+
+    def failure(self, error, statement_bytes=None):
+        """ record a failed statement, returns the reason of the backoff or None if the error is unrelated
+
+        'lock_wait' and 'deadlock' can be retried after a pause, 'packet' only as smaller statements
+
+        """
+        code = error_code(error)
+        if code in LOCK_WAIT:
+            reason = 'lock_wait'
+        elif code in DEADLOCK:
+            reason = 'deadlock'
+        elif code in PACKET_TOO_LARGE:
+            reason = 'packet'
+        else:
+            return None
+        with self._lock:
+            self._decrease(reason)
+            if reason == 'packet' and statement_bytes:
+                limit = statement_bytes // 2
+                if self.packet_bytes is None or limit < self.packet_bytes * self.packet_fraction:
+                    self.packet_bytes = int(limit / self.packet_fraction)
+        return reason
+
+    def _decrease(self, reason):
+        self.size = max(self.size // 2, self.minimum)
+        self.backoffs[reason] = self.backoffs.get(reason, 0) + 1
+
+    @classmethod
+    def batch_stats(cls):
+        """ collector of the batchers for metrics.REGISTRY """
+        with cls._batchers_lock:
+            batchers = list(cls._batchers.items())
+        sizes, backoffs = [], []
+        for (database_name, table_name), batcher in batchers:
+            labels = {'database': database_name or '', 'table': table_name}
+            sizes.append((labels, batcher.rows()))
+            for reason, count in list(batcher.backoffs.items()):
+                backoffs.append((dict(labels, reason=reason), count))
+        return [
+            ('dmp_batch_rows', 'gauge', 'Rows per batched statement chosen for a table.', sizes),
+            ('dmp_batch_backoffs_total', 'counter', 'Batch size decreases by reason.', backoffs),
+        ]
+
+
+metrics.REGISTRY.register_collector(AdaptiveBatcher.batch_stats)
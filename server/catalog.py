@@ -0,0 +1,222 @@
+"""
+Interface for reading the schema of databases from information_schema in bulk
+    Results are cached per database to avoid one round-trip per table
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import threading
+import time
+from dbconn import DBConnector
+from sqlcreator import SqlCreator
+import metrics
+
+
+class SchemaCatalog(DBConnector):
+    """ Read databases, tables, columns, keys and indexes from information_schema, subclass of DBConnector
+
+    The database list is read by one query, the schema of a database by two queries,
+    no matter how many tables it contains
+    Results are shared by all instances and kept for _ttl seconds
+
+    Attributions:
+    _ttl: seconds a cached result stays valid
+    _cache: a dictionary of cached results, keyed by (ip, port, database name or None for the database list)
+    _stats: hit/miss/invalidation counters of the cache
+
+    """
+    _ttl = 60
+    _cache = {}
+    _cache_lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    _databases_sql = (
+        'SELECT s.SCHEMA_NAME AS database_name, s.DEFAULT_CHARACTER_SET_NAME AS charset, '
+        'COUNT(t.TABLE_NAME) AS table_count, COALESCE(SUM(t.TABLE_ROWS), 0) AS row_estimate, '
+        'COALESCE(SUM(t.DATA_LENGTH), 0) AS data_size, COALESCE(SUM(t.INDEX_LENGTH), 0) AS index_size '
+        'FROM information_schema.SCHEMATA s '
+        'LEFT JOIN information_schema.TABLES t ON t.TABLE_SCHEMA = s.SCHEMA_NAME '
+        'GROUP BY s.SCHEMA_NAME, s.DEFAULT_CHARACTER_SET_NAME ORDER BY s.SCHEMA_NAME;')
+    _tables_sql = (
+        'SELECT TABLE_NAME AS name, TABLE_TYPE AS type, ENGINE AS engine, TABLE_ROWS AS row_estimate, '
+        'DATA_LENGTH AS data_size, INDEX_LENGTH AS index_size, CREATE_TIME AS create_time, '
+        'UPDATE_TIME AS update_time, TABLE_COMMENT AS comment '
+        'FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME;')
+    _columns_sql = (
+        "SELECT 'column' AS kind, TABLE_NAME AS table_name, COLUMN_NAME AS column_name, "
+        'ORDINAL_POSITION AS position, COLUMN_TYPE AS detail, IS_NULLABLE AS nullable, COLUMN_KEY AS column_key, '
+        'COLUMN_DEFAULT AS default_value, EXTRA AS extra, NULL AS index_name, NULL AS non_unique '
+        'FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s '
+        'UNION ALL '
+        "SELECT 'index', TABLE_NAME, COLUMN_NAME, SEQ_IN_INDEX, INDEX_TYPE, NULLABLE, NULL, "
+        'NULL, NULL, INDEX_NAME, NON_UNIQUE '
+        'FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s '
+        'ORDER BY table_name, kind, index_name, position;')
+
+    @classmethod
+    def set_ttl(cls, seconds):
+        """ set the number of seconds a cached result stays valid, 0 disables the cache """
+        cls._ttl = seconds
+
+    @classmethod
+    def invalidate(cls, database_name=None):
+        """ drop cached results
+
+        Parameters
+        ----------
+        database_name: String
+            drop only the schema of this database and the database list, None drops everything
+
+        """
+        with cls._cache_lock:
+            if database_name is None:
+                cls._cache.clear()
+            else:
+                for key in list(cls._cache):
+                    if key[2] is None or key[2] == database_name:
+                        del cls._cache[key]
+            cls._stats['invalidations'] += 1
+
+    @classmethod
+    def cache_stats(cls):
+        """ collector of the cache statistics for metrics.REGISTRY """
+        with cls._cache_lock:
+            stats = dict(cls._stats)
+            size = len(cls._cache)
+        return [
+            ('dmp_catalog_cache_requests_total', 'counter', 'Schema catalog cache lookups by result.',
+             [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])]),
+            ('dmp_catalog_cache_invalidations_total', 'counter', 'Schema catalog cache invalidations.',
+             [({}, stats['invalidations'])]),
+            ('dmp_catalog_cache_entries', 'gauge', 'Databases currently cached by the schema catalog.',
+             [({}, size)]),
+        ]
+
+    @classmethod
+    def on_commit(cls, changes):
+        """ commit listener of SqlCreator, drops the schema of databases whose definition changed """
+        for database_name in set(change['database'] for change in changes if change['ddl']):
+            cls.invalidate(database_name)
+
+    def _cached(self, database_name, loader, refresh=False):
+        key = (self.ip, self.port, database_name)
+        now = time.time()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if not refresh and entry is not None and now - entry[0] < self._ttl:
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+        value = loader()
+        with self._cache_lock:
+            self._cache[key] = (now, value)
+        return value
+
+    def databases(self, refresh=False):
+        """ Interface for reading all databases with their table count and size
+
+        Parameters
+        ----------
+        refresh: Boolean
+            ignore the cached result and read information_schema again
+
+        Returns
+        -------
+        databases: list
+            [{"database_name": "test", "charset": "utf8mb4", "table_count": 3, "row_estimate": 120,
+              "data_size": 49152, "index_size": 16384}, ...]
+
+        """
+        def load():
+            rows = self.execute_sql(self._databases_sql).fetchall()
+            return [{'database_name': row['database_name'], 'charset': row['charset'],
+                     'table_count': int(row['table_count']), 'row_estimate': int(row['row_estimate']),
+                     'data_size': int(row['data_size']), 'index_size': int(row['index_size'])} for row in rows]
+
+        return self._cached(None, load, refresh)
+
+    def schema(self, database_name, refresh=False):
+        """ Interface for reading tables, columns, keys and indexes of a database
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        refresh: Boolean
+            ignore the cached result and read information_schema again
+
+        Returns
+        -------
+        tables: dict
+            a dictionary keyed by table name, refer to _load_schema for the content of a table
+
+        """
+        return self._cached(database_name, lambda: self._load_schema(database_name), refresh)
+
+    def _load_schema(self, database_name):
+        tables = {}
+        for row in self.execute_sql(self._tables_sql, (database_name,)).fetchall():
+            tables[row['name']] = {
+                'name': row['name'],
+                'type': row['type'],
+                'engine': row['engine'],
+                'row_estimate': int(row['row_estimate'] or 0),
+                'data_size': int(row['data_size'] or 0),
+                'index_size': int(row['index_size'] or 0),
+                'create_time': str(row['create_time']) if row['create_time'] is not None else None,
+                'update_time': str(row['update_time']) if row['update_time'] is not None else None,
+                'comment': row['comment'],
+                'columns': [],
+                'primary_key': [],
+                'indexes': [],
+            }
+
+        indexes = {}
+        for row in self.execute_sql(self._columns_sql, (database_name, database_name)).fetchall():
+            table = tables.get(row['table_name'])
+            if table is None:
+                continue
+            if row['kind'] == 'column':
+                table['columns'].append({'name': row['column_name'], 'type': row['detail'],
+                                         'nullable': row['nullable'] == 'YES', 'key': row['column_key'],
+                                         'default': row['default_value'], 'extra': row['extra']})
+            else:
+                index = indexes.get((row['table_name'], row['index_name']))
+                if index is None:
+                    index = {'name': row['index_name'], 'unique': int(row['non_unique']) == 0, 'columns': []}
+                    indexes[(row['table_name'], row['index_name'])] = index
+                    table['indexes'].append(index)
+                index['columns'].append(row['column_name'])
+                if row['index_name'] == 'PRIMARY':
+                    table['primary_key'].append(row['column_name'])
+        return tables
+
+    def table(self, database_name, table_name, refresh=False):
+        """ Interface for reading the schema of one table, None if the table does not exist """
+        return self.schema(database_name, refresh).get(table_name)
+
+    def update_time(self, database_name, table_name=None):
+        """ Interface for reading the last UPDATE_TIME of a table, or the latest of a database if table_name is None
+
+        The result is never cached, it is used to notice changes made by other clients
+
+        """
+        if table_name is None:
+            sql = 'SELECT MAX(UPDATE_TIME) AS update_time FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s;'
+            row = self.execute_sql(sql, (database_name,)).fetchone()
+        else:
+            sql = ('SELECT UPDATE_TIME AS update_time FROM information_schema.TABLES '
+                   'WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s;')
+            row = self.execute_sql(sql, (database_name, table_name)).fetchone()
+        if row is None or row['update_time'] is None:
+            return None
+        return row['update_time']
+
+    def column_names(self, database_name, table_name):
+        """ Interface for reading the column names of a table in their defined order """
+        table = self.table(database_name, table_name)
+        if table is None:
+            raise ReferenceError("表'%s.%s'不存在！" % (database_name, table_name))
+        return [column['name'] for column in table['columns']]
+
+
+metrics.REGISTRY.register_collector(SchemaCatalog.cache_stats)
+SqlCreator.add_commit_listener(SchemaCatalog.on_commit)
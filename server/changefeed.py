@@ -0,0 +1,129 @@
+"""
+Interface for pushing committed row changes to the clients viewing a table
+    Changes are published by SqlCreator.commit_all and streamed as Server-Sent Events
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import json
+import queue
+import threading
+from sqlcreator import SqlCreator
+from tableversion import TableVersions
+import metrics
+
+
+class _Subscriber(queue.Queue):
+    """ The queue of one subscriber, publishers put into it one at a time so an overflow is replaced atomically """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.publish_lock = threading.Lock()
+
+
+class ChangeBroker:
+    """ Fan out the row changes of every commit to the subscribers of the changed table
+
+    Each subscriber owns a bounded queue, a subscriber which does not keep up gets a single
+    'reload' event instead of the changes it missed, so a slow client never blocks a commit
+
+    Attributions:
+    max_rows: a commit changing more rows of a table is published as 'reload' instead of row by row
+    queue_size: the number of events buffered per subscriber
+    _subscribers: a dictionary of sets of subscriber queues, keyed by (database, table)
+
+    """
+    max_rows = 500
+    queue_size = 100
+    _subscribers = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def subscribe(cls, database_name, table_name):
+        """ Returns a new queue receiving the events of a table, pass it to unsubscribe when done """
+        subscriber = _Subscriber(cls.queue_size)
+        with cls._lock:
+            cls._subscribers.setdefault((database_name, table_name), set()).add(subscriber)
+        return subscriber
+
+    @classmethod
+    def unsubscribe(cls, database_name, table_name, subscriber):
+        with cls._lock:
+            subscribers = cls._subscribers.get((database_name, table_name))
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del cls._subscribers[(database_name, table_name)]
+
+    @classmethod
+    def on_commit(cls, changes):
+        """ commit listener of SqlCreator, publishes an event for every changed table with subscribers """
+        for change in changes:
+            with cls._lock:
+                if change['table'] is None:
+                    targets = [(key, set(subs)) for key, subs in cls._subscribers.items()
+                               if key[0] == change['database']]
+                else:
+                    targets = [((change['database'], change['table']),
+                                set(cls._subscribers.get((change['database'], change['table']), ())))]
+            for (database_name, table_name), subscribers in targets:
+                if not subscribers:
+                    continue
+                reload = change['ddl'] or not change['complete'] or len(change['rows']) > cls.max_rows
+                event = {'database': database_name, 'table': table_name,
+                         'version': TableVersions.version(database_name, table_name),
+                         'reload': reload, 'rows': [] if reload else change['rows']}
+                for subscriber in subscribers:
+                    cls._put(subscriber, event)
+
+    @staticmethod
+    def _put(subscriber, event):
+        # only the client takes events out while the lock is held, the queue cannot fill again after draining it
+        with subscriber.publish_lock:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # the client missed changes, replace everything it has not read by one reload
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(dict(event, reload=True, rows=[]))
+
+    @classmethod
+    def stream(cls, database_name, table_name, heartbeat=15):
+        """ generator of the Server-Sent Events of a table, ends when the client disconnects
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table of above database
+        heartbeat: int
+            seconds between keep-alive comments when nothing changes
+
+        """
+        subscriber = cls.subscribe(database_name, table_name)
+        try:
+            yield 'retry: 3000\nevent: ready\ndata: %s\n\n' % json.dumps(
+                {'version': TableVersions.version(database_name, table_name)})
+            while True:
+                try:
+                    event = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield 'event: change\ndata: %s\n\n' % json.dumps(event, ensure_ascii=False, default=str)
+        finally:
+            cls.unsubscribe(database_name, table_name, subscriber)
+
+    @classmethod
+    def subscriber_stats(cls):
+        """ collector of the subscribers for metrics.REGISTRY """
+        with cls._lock:
+            count = sum(len(subscribers) for subscribers in cls._subscribers.values())
+        return [('dmp_changefeed_subscribers', 'gauge', 'Clients listening to table changes.', [({}, count)])]
+
+
+metrics.REGISTRY.register_collector(ChangeBroker.subscriber_stats)
+SqlCreator.add_commit_listener(ChangeBroker.on_commit)
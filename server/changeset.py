@@ -0,0 +1,306 @@
+"""
+Interface for the pending change set of SqlCreator
+    Row changes are merged per table and primary key before they are committed
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+from collections import OrderedDict
+from pymysql.converters import escape_string
+
+
+def sql_literal(value):
+    """ convert a python value to a sql literal
+
+    Parameters
+    ----------
+    value: int, float, String or None
+        the value to convert
+
+    Returns
+    -------
+    literal: String
+        numbers are kept as they are, None becomes NULL, everything else is quoted and escaped
+
+    Examples
+    --------
+    >>> sql_literal("O'Neil")
+    "'O\\\\'Neil'"
+
+    """
+    if value is None:
+        return 'NULL'
+    if type(value) == int or type(value) == float:
+        return str(value)
+    return "'" + escape_string(str(value)) + "'"
+
+
+class _Entry:
+    """ one operation recorded by ChangeSet, kind is 'SQL' for statements which cannot be merged """
+    __slots__ = ('kind', 'database', 'table', 'key_fields', 'key', 'values', 'sql')
+
+    def __init__(self, kind, sql, database=None, table=None, key_fields=(), key=(), values=None):
+        self.kind = kind
+        self.sql = sql
+        self.database = database
+        self.table = table
+        self.key_fields = tuple(key_fields)
+        self.key = tuple(key)
+        self.values = values if values is not None else {}
+
+
+class _Segment:
+    """ merged row changes between two unmergeable statements
+
+    The state of a row is [op, values, deleted], op is one of:
+    INSERT: the row is inserted with values
+    UPDATE: the columns in values are updated
+    DELETE: the row is deleted
+    REINSERT: the row is deleted, then inserted with values
+    CANCELLED: the row was inserted and deleted again, nothing has to be sent
+    deleted holds the values of the row in the table before a DELETE or REINSERT, None if they are unknown
+
+    A table emits its deletes and updates before its inserts, so an update or delete of a row the segment
+    has not seen conflicts with a table which has inserts: the key may name an inserted row by a value of
+    another type (1 and '1'), emitted first it would miss the row
+
+    """
+
+    def __init__(self):
+        self.tables = OrderedDict()
+
+    def merge(self, entry):
+        """ merge an entry into the segment, returns False if it conflicts with the merged state """
+        table = self.tables.get((entry.database, entry.table))
+        if table is None:
+            table = {'key_fields': entry.key_fields, 'rows': OrderedDict(), 'inserts': False}
+            self.tables[(entry.database, entry.table)] = table
+        elif table['key_fields'] != entry.key_fields:
+            return False
+        rows = table['rows']
+        state = rows.get(entry.key)
+        if state is None:
+            if entry.kind != 'INSERT' and table['inserts']:
+                return False
+            if entry.kind == 'DELETE':
+                rows[entry.key] = ['DELETE', {}, dict(entry.values) or None]
+            else:
+                rows[entry.key] = [entry.kind, dict(entry.values), None]
+            table['inserts'] = table['inserts'] or entry.kind == 'INSERT'
+            return True
+
+        op, values, deleted = state
+        if entry.kind == 'INSERT':
+            if op == 'DELETE':
+                # the row of the table is still the one deleted first
+                rows[entry.key] = ['REINSERT', dict(entry.values), deleted]
+            elif op == 'CANCELLED':
+                rows[entry.key] = ['INSERT', dict(entry.values), None]
+            else:
+                return False
+            table['inserts'] = True
+        elif entry.kind == 'UPDATE':
+            if op in ('INSERT', 'UPDATE', 'REINSERT'):
+                values.update(entry.values)
+            # updating a deleted row changes nothing
+        else:
+            if op == 'INSERT':
+                rows[entry.key] = ['CANCELLED', {}, None]
+            elif op == 'UPDATE':
+                rows[entry.key] = ['DELETE', {}, dict(entry.values) or None]
+            elif op == 'REINSERT':
+                rows[entry.key] = ['DELETE', {}, deleted]
+        return True
+
+    def flush(self, batch_size, sizer=None):
+        """ Returns the statements of the merged changes and empties the segment
+
+        Each table emits its deletes, its updates grouped by identical SET clause and its inserts grouped
+        by identical column list, every group batched into statements of at most batch_size rows
+        sizer(database, table) -> (rows, max_bytes) overrides batch_size per table and limits the size of
+        the statements to max_bytes bytes if it is not None
+
+        Returns
+        -------
+        statements: list
+            a list of (sql, rows), rows describes the row changes of sql:
+            [{"op": "update", "key": {"id": 1}, "values": {"name": "Alice"}}, ...]
+
+        """
+        statements = []
+        for (database_name, table_name), table in self.tables.items():
+            name = database_name + '.' + table_name if database_name else table_name
+            key_fields = table['key_fields']
+            rows, max_bytes = sizer(database_name, table_name) if sizer is not None else (batch_size, None)
+            deletes = []
+            updates = OrderedDict()
+            inserts = OrderedDict()
+            for key, (op, values, _) in table['rows'].items():
+                if op in ('DELETE', 'REINSERT'):
+                    deletes.append(key)
+                if op in ('INSERT', 'REINSERT'):
+                    inserts.setdefault(tuple(values.keys()), []).append((key, values))
+                elif op == 'UPDATE' and values:
+                    set_str = ', '.join('%s=%s' % (k, sql_literal(v)) for k, v in values.items())
+                    updates.setdefault(set_str, []).append((key, values))
+
+            for batch in _chunks(deletes, rows, max_bytes, lambda key: key_condition(key_fields, [key])):
+                keys = [key for key, _ in batch]
+                statements.append(('DELETE FROM %s WHERE %s;' % (name, key_condition(key_fields, keys)),
+                                   [_row_change('delete', key_fields, key, table['rows'][key][2])
+                                    for key in keys]))
+            for set_str, items in updates.items():
+                for batch in _chunks(items, rows, max_bytes, lambda item: key_condition(key_fields, [item[0]]),
+                                     len(set_str)):
+                    batch = [item for item, _ in batch]
+                    condition = key_condition(key_fields, [key for key, _ in batch])
+                    statements.append(('UPDATE %s SET %s WHERE %s;' % (name, set_str, condition),
+                                       [_row_change('update', key_fields, key, values) for key, values in batch]))
+            for columns, items in inserts.items():
+                render = lambda item: '(' + ', '.join(sql_literal(v) for v in item[1].values()) + ')'
+                for batch in _chunks(items, rows, max_bytes, render, len(name) + len(', '.join(columns))):
+                    values_str = ', '.join(text for _, text in batch)
+                    statements.append(('INSERT INTO %s(%s) VALUES %s;' % (name, ', '.join(columns), values_str),
+                                       [_row_change('insert', key_fields, key, values)
+                                        for (key, values), _ in batch]))
+        self.tables = OrderedDict()
+        return statements
+
+
+def _chunks(items, rows, max_bytes, render, overhead=0):
+    """ split items into lists of at most rows (item, render(item)) pairs whose rendered size,
+    plus overhead bytes for the rest of the statement, stays within max_bytes, an item is never dropped """
+    chunk = []
+    size = overhead + 32
+    for item in items:
+        text = render(item)
+        length = len(text.encode('utf-8')) + 2
+        if chunk and (len(chunk) >= rows or (max_bytes is not None and size + length > max_bytes)):
+            yield chunk
+            chunk = []
+            size = overhead + 32
+        chunk.append((item, text))
+        size += length
+    if chunk:
+        yield chunk
+
+
+def _row_change(op, key_fields, key, values=None):
+    change = {'op': op, 'key': dict(zip(key_fields, key))}
+    if values is not None:
+        change['values'] = dict(values)
+    return change
+
+
+def key_condition(key_fields, keys):
+    """ Returns the WHERE condition matching the rows with the primary key values keys, a list of tuples """
+    if len(key_fields) == 1:
+        if len(keys) == 1:
+            return '%s=%s' % (key_fields[0], sql_literal(keys[0][0]))
+        return '%s IN (%s)' % (key_fields[0], ', '.join(sql_literal(key[0]) for key in keys))
+    if len(keys) == 1:
+        return ' AND '.join('%s=%s' % (k, sql_literal(v)) for k, v in zip(key_fields, keys[0]))
+    return '(%s) IN (%s)' % (', '.join(key_fields),
+                             ', '.join('(' + ', '.join(sql_literal(v) for v in key) + ')' for key in keys))
+
+
+class ChangeSet:
+    """ Record the pending operations of a SqlCreator in order and compact them before commit
+
+    Row operations on tables with a primary key are merged per table and primary key:
+    successive updates are merged, an update after an insert is folded into the insert,
+    an insert followed by a delete cancels out, and the result is sent as batched statements
+    Any other statement (DDL, tables without primary key) is kept verbatim and in place,
+    row changes are never moved across it
+
+    Attributions:
+    batch_size: the maximum number of rows in one generated statement
+    sizer: None or a callable sizer(database, table) -> (rows, max_bytes) choosing the rows and the byte limit
+           of the generated statements of each table instead of batch_size, refer to batching.AdaptiveBatcher
+    _log: a list of _Entry in the order they were added, used by rollback and show_sql_transaction
+
+    Notes
+    -----
+    Cancelling an insert with a following delete assumes the row did not exist before,
+    which is what inserting it means.
+    A batched statement succeeds or fails as a whole, one bad row (a duplicate key, a value out of range)
+    fails the other rows of its statement too, where uncompacted each row had a statement of its own.
+    Statements of different tables are not reordered relative to the first change of each table,
+    foreign keys between tables changed in one segment are temporarily not supported.
+
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.sizer = None
+        self._log = []
+
+    def add_statement(self, sql):
+        """ append a statement which is executed verbatim and in place """
+        self._log.append(_Entry('SQL', sql))
+
+    def add_statements(self, sql_list):
+        for sql in sql_list:
+            self.add_statement(sql)
+
+    def add_row(self, kind, sql, database_name, table_name, key_fields, key, values=None):
+        """ append a row operation which can be merged with other operations on the same row
+
+        Parameters
+        ----------
+        kind: String
+            'INSERT', 'UPDATE' or 'DELETE'
+        sql: String
+            the uncompacted statement of this operation, returned by show and rollback
+        database_name: String
+            name of the database of the table
+        table_name: String
+            name of the table
+        key_fields: tuple
+            names of the primary key columns of the table
+        key: tuple
+            values of the primary key of the row, in the order of key_fields
+        values: dict
+            values of the columns, all columns for INSERT, the changed columns for UPDATE,
+            they are converted by sql_literal when the statements are generated,
+            the values of the row before it is deleted for DELETE if they are known
+
+        """
+        if kind not in ('INSERT', 'UPDATE', 'DELETE'):
+            raise TypeError('不支持的修改类型%s！' % kind)
+        self._log.append(_Entry(kind, sql, database_name, table_name, key_fields, key, values))
+
+    def pop(self):
+        """ remove the last operation and return its statement, raise IndexError if empty """
+        return self._log.pop().sql
+
+    def clear(self):
+        self._log.clear()
+
+    def __len__(self):
+        return len(self._log)
+
+    def statements(self):
+        """ Returns the uncompacted statements in the order they were added """
+        return [entry.sql for entry in self._log]
+
+    def compact(self):
+        """ Returns the minimal list of statements with the same effect as the recorded operations """
+        return [sql for sql, _ in self.compact_rows()]
+
+    def compact_rows(self):
+        """ Returns the compacted statements as a list of (sql, rows)
+
+        rows is the list of row changes made by a merged statement, refer to _Segment.flush,
+        or None for a statement kept verbatim whose row changes are unknown
+
+        """
+        statements = []
+        segment = _Segment()
+        for entry in self._log:
+            if entry.kind == 'SQL':
+                statements.extend(segment.flush(self.batch_size, self.sizer))
+                statements.append((entry.sql, None))
+            elif not segment.merge(entry):
+                statements.extend(segment.flush(self.batch_size, self.sizer))
+                segment.merge(entry)
+        statements.extend(segment.flush(self.batch_size, self.sizer))
+        return statements
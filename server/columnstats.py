@@ -0,0 +1,294 @@
+"""
+Interface for profiling the value distribution of every column of a table
+    A table is read once as a stream, results are cached per table version
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+import pymysql
+from catalog import SchemaCatalog
+from sqlcreator import SqlCreator, quote_identifier
+from tableversion import TableVersions
+import metrics
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class HyperLogLog:
+    """ Estimate the number of distinct values with 2^precision registers
+
+    The standard error is about 1.04 / sqrt(2^precision), 1.6% with the default precision
+
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    @staticmethod
+    def hash(value):
+        """ Returns a 64 bit hash of a value, stable across processes """
+        if not isinstance(value, bytes):
+            value = str(value).encode('utf8')
+        return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+    def add_hashes(self, hashes):
+        """ add a batch of hashes returned by HyperLogLog.hash """
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        if numpy is not None and len(hashes) > 64:
+            values = numpy.array(hashes, dtype=numpy.uint64)
+            index = (values >> numpy.uint64(shift)).astype(numpy.intp)
+            rest = (values & numpy.uint64(mask)).astype(numpy.float64)
+            # rest has at most 52 bits, its float log2 is exact
+            rank = numpy.where(rest > 0, shift - numpy.floor(numpy.log2(numpy.maximum(rest, 1))), shift + 1)
+            registers = numpy.frombuffer(self.registers, dtype=numpy.uint8).copy()
+            numpy.maximum.at(registers, index, rank.astype(numpy.uint8))
+            self.registers = bytearray(registers.tobytes())
+            return
+        registers = self.registers
+        for h in hashes:
+            index = h >> shift
+            rank = shift - (h & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def estimate(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+class _ColumnProfile:
+    """ accumulate the statistics of one column over the batches of a table """
+
+    def __init__(self, name, top_k, sample_size):
+        self.name = name
+        self.top_k = top_k
+        self.capacity = max(top_k * 100, 1000)
+        self.sample_size = sample_size
+        self.count = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.numeric = True
+        self.hll = HyperLogLog()
+        self.frequencies = {}
+        self.pruned = False
+        self.sample = []
+        self.seen = 0
+
+    def update(self, values):
+        present = [v for v in values if v is not None]
+        self.count += len(values)
+        self.nulls += len(values) - len(present)
+        if not present:
+            return
+        if self.numeric and not all(isinstance(v, (int, float, Decimal)) and not isinstance(v, bool) for v in present):
+            self.numeric = False
+            self.sample = []
+        low, high = self._bounds(present)
+        if self.minimum is None or low < self.minimum:
+            self.minimum = low
+        if self.maximum is None or high > self.maximum:
+            self.maximum = high
+        self.hll.add_hashes([HyperLogLog.hash(v) for v in present])
+        self._count_frequencies(present)
+        if self.numeric:
+            self._reservoir(present)
+
+    def _bounds(self, present):
+        if self.numeric and numpy is not None and len(present) > 64:
+            array = numpy.array([float(v) for v in present])
+            low, high = array.argmin(), array.argmax()
+            return present[low], present[high]
+        return min(present), max(present)
+
+    def _count_frequencies(self, present):
+        frequencies = self.frequencies
+        for value in present:
+            frequencies[value] = frequencies.get(value, 0) + 1
+        if len(frequencies) > self.capacity:
+            # keep the most frequent half, counts of values which are dropped and seen again are lower bounds
+            kept = sorted(frequencies.items(), key=lambda item: item[1], reverse=True)[:self.capacity // 2]
+            self.frequencies = dict(kept)
+            self.pruned = True
+
+    def _reservoir(self, present):
+        for value in present:
+            self.seen += 1
+            if len(self.sample) < self.sample_size:
+                self.sample.append(float(value))
+            else:
+                slot = random.randrange(self.seen)
+                if slot < self.sample_size:
+                    self.sample[slot] = float(value)
+
+    def histogram(self, bins):
+        if not self.numeric or not self.sample:
+            return None
+        low, high = float(self.minimum), float(self.maximum)
+        if low == high:
+            return {'edges': [low, high], 'counts': [self.count - self.nulls], 'exact': True}
+        if numpy is not None:
+            counts, edges = numpy.histogram(numpy.array(self.sample), bins=bins, range=(low, high))
+            counts, edges = counts.tolist(), edges.tolist()
+        else:
+            width = (high - low) / bins
+            edges = [low + i * width for i in range(bins)] + [high]
+            counts = [0] * bins
+            for value in self.sample:
+                counts[min(int((value - low) / width), bins - 1)] += 1
+        scale = (self.count - self.nulls) / len(self.sample)
+        return {'edges': edges, 'counts': [int(round(c * scale)) for c in counts], 'exact': scale == 1}
+
+    def result(self, bins):
+        exact_distinct = not self.pruned
+        top = sorted(self.frequencies.items(), key=lambda item: item[1], reverse=True)[:self.top_k]
+        return {
+            'name': self.name,
+            'count': self.count,
+            'nulls': self.nulls,
+            'min': self.minimum,
+            'max': self.maximum,
+            'distinct': len(self.frequencies) if exact_distinct else self.hll.estimate(),
+            'distinct_exact': exact_distinct,
+            'top': [{'value': value, 'count': count} for value, count in top],
+            'top_exact': exact_distinct,
+            'histogram': self.histogram(bins),
+        }
+
+
+class TableProfiler(SchemaCatalog):
+    """ Profile the columns of a table in one streaming pass, subclass of SchemaCatalog
+
+    For every column: min/max, null count, distinct count (exact while it fits, HyperLogLog beyond),
+    the top_k most frequent values and a histogram of numeric columns built from a reservoir sample
+    Rows are read with an unbuffered cursor in batches, so memory does not grow with the table
+    NumPy is used for the batches when it is installed
+
+    Attributions:
+    batch_size: the number of rows read from the cursor at once
+    sample_size: the number of values of a numeric column kept for its histogram
+    _max_entries: the number of table profiles kept in the cache
+    _profiles: cache of the profiles, keyed by (ip, port, database, table), value is (etag, profile)
+    _profile_stats: hit/miss counters of the cache
+    _running: locks of tables being profiled, a second request for the same table waits for the first one
+
+    """
+    batch_size = 5000
+    sample_size = 10000
+    _max_entries = 64
+    _profiles = OrderedDict()
+    _running = {}
+    _profile_lock = threading.Lock()
+    _profile_stats = {'hits': 0, 'misses': 0}
+
+    def profile(self, database_name, table_name, top_k=10, bins=20, refresh=False):
+        """ Interface for profiling the columns of a table
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table of above database
+        top_k: int
+            number of most frequent values returned per column
+        bins: int
+            number of histogram bins of numeric columns
+        refresh: Boolean
+            ignore the cached profile and read the table again
+
+        Returns
+        -------
+        profile: dict
+            {"database": "test", "table": "table1", "rows": 1000, "etag": "...", "computed_at": 1616000000.0,
+             "seconds": 0.8, "columns": [{"name": "id", "count": 1000, "nulls": 0, "min": 1, "max": 1000,
+             "distinct": 1000, "distinct_exact": True, "top": [{"value": 1, "count": 1}, ...], "top_exact": True,
+             "histogram": {"edges": [1.0, 50.95, ...], "counts": [50, ...], "exact": True}}, ...]}
+
+        """
+        columns = self.column_names(database_name, table_name)
+        etag = TableVersions.etag(database_name, table_name, self.update_time(database_name, table_name))
+        key = (self.ip, self.port, database_name, table_name)
+        options = (top_k, bins)
+        with self._profile_lock:
+            lock = self._running.setdefault(key, threading.Lock())
+        with lock:
+            with self._profile_lock:
+                cached = self._profiles.get(key)
+                if not refresh and cached is not None and cached[0] == (etag, options):
+                    self._profiles.move_to_end(key)
+                    self._profile_stats['hits'] += 1
+                    return cached[1]
+                self._profile_stats['misses'] += 1
+            result = self._scan(database_name, table_name, columns, top_k, bins)
+            result['etag'] = etag
+            with self._profile_lock:
+                self._profiles[key] = ((etag, options), result)
+                self._profiles.move_to_end(key)
+                while len(self._profiles) > self._max_entries:
+                    self._profiles.popitem(last=False)
+                self._running.pop(key, None)
+        return result
+
+    def _scan(self, database_name, table_name, columns, top_k, bins):
+        start = time.perf_counter()
+        profiles = [_ColumnProfile(name, top_k, self.sample_size) for name in columns]
+        sql = 'SELECT %s FROM %s.%s;' % (', '.join(quote_identifier(name) for name in columns),
+                                         quote_identifier(database_name), quote_identifier(table_name))
+        cur = self.execute_sql(sql, cursor_class=pymysql.cursors.SSCursor)
+        rows = 0
+        try:
+            while True:
+                batch = cur.fetchmany(self.batch_size)
+                if not batch:
+                    break
+                rows += len(batch)
+                for profile, values in zip(profiles, zip(*batch)):
+                    profile.update(values)
+        finally:
+            cur.close()
+        return {'database': database_name, 'table': table_name, 'rows': rows, 'computed_at': time.time(),
+                'seconds': round(time.perf_counter() - start, 3),
+                'columns': [profile.result(bins) for profile in profiles]}
+
+    @classmethod
+    def on_commit(cls, changes):
+        """ commit listener of SqlCreator, drops the profiles of changed tables to free memory early """
+        with cls._profile_lock:
+            for change in changes:
+                for key in list(cls._profiles):
+                    if key[2] == change['database'] and (change['table'] is None or key[3] == change['table']):
+                        del cls._profiles[key]
+
+    @classmethod
+    def cache_stats(cls):
+        """ collector of the profile cache for metrics.REGISTRY """
+        with cls._profile_lock:
+            stats = dict(cls._profile_stats)
+            size = len(cls._profiles)
+        return [
+            ('dmp_profile_cache_requests_total', 'counter', 'Column profile cache lookups by result.',
+             [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])]),
+            ('dmp_profile_cache_entries', 'gauge', 'Tables with a cached column profile.', [({}, size)]),
+        ]
+
+
+metrics.REGISTRY.register_collector(TableProfiler.cache_stats)
+SqlCreator.add_commit_listener(TableProfiler.on_commit)
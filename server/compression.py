@@ -0,0 +1,180 @@
+"""
+Interface for compressing HTTP responses according to the Accept-Encoding of the client
+    gzip is always available, brotli and zstd are used when their packages are installed
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ResponseCompressor:
+    """ Compress werkzeug responses with the best encoding accepted by the client
+
+    Buffered responses are compressed at once if they are at least min_size bytes,
+    streamed responses are compressed chunk by chunk and flushed after every chunk,
+    so a streamed client still receives each chunk without waiting for the next one
+
+    Attributions:
+    min_size: buffered responses smaller than this number of bytes are sent uncompressed
+    levels: a dictionary of compression levels keyed by encoding
+    preference: encodings in the order they are chosen when the client accepts several with the same q-value
+    mimetypes: prefixes of the mimetypes which are compressed
+
+    """
+
+    def __init__(self, min_size=1024, levels=None, preference=('zstd', 'br', 'gzip'),
+                 mimetypes=('text/', 'application/json', 'application/javascript', 'application/xml')):
+        self.min_size = min_size
+        self.levels = {'gzip': 6, 'br': 4, 'zstd': 3}
+        if levels:
+            self.levels.update(levels)
+        self.preference = [encoding for encoding in preference if self.available(encoding)]
+        self.mimetypes = tuple(mimetypes)
+
+    @staticmethod
+    def available(encoding):
+        if encoding == 'br':
+            return brotli is not None
+        if encoding == 'zstd':
+            return zstandard is not None
+        return encoding == 'gzip'
+
+    def negotiate(self, accept_encoding):
+        """ choose the encoding of a response
+
+        Parameters
+        ----------
+        accept_encoding: String
+            the Accept-Encoding header of the request, e.g. 'gzip, deflate, br;q=0.9'
+
+        Returns
+        -------
+        encoding: String
+            'zstd', 'br', 'gzip' or None if the response should not be compressed
+
+        """
+        if not accept_encoding:
+            return None
+        accepted = {}
+        for item in accept_encoding.split(','):
+            parts = item.strip().split(';')
+            name = parts[0].strip().lower()
+            q = 1.0
+            for param in parts[1:]:
+                key, _, value = param.strip().partition('=')
+                if key.strip() == 'q':
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            accepted[name] = q
+        best, best_q = None, 0.0
+        for encoding in self.preference:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def compressobj(self, encoding):
+        """ Returns an incremental compressor with compress(data) and flush() -> bytes """
+        return _Compressor(encoding, self.levels[encoding])
+
+    def compress_response(self, response, accept_encoding):
+        """ compress a werkzeug response in place if the client accepts it and it is worth it
+
+        Parameters
+        ----------
+        response: werkzeug.wrappers.Response
+            the response returned by a view
+        accept_encoding: String
+            the Accept-Encoding header of the request
+
+        Returns
+        -------
+        response: werkzeug.wrappers.Response
+            the same response, with Content-Encoding and Vary set if it was compressed
+
+        """
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+        if not (response.mimetype or '').startswith(self.mimetypes):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            compressor = self.compressobj(encoding)
+            response.set_data(compressor.compress(data) + compressor.finish())
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # the compressed bytes differ from the identity representation
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, chunks, encoding):
+        compressor = self.compressobj(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf8')
+                data = compressor.compress(chunk) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+class _Compressor:
+    """ a uniform wrapper around the incremental compressors of zlib, brotli and zstandard """
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._obj = brotli.Compressor(quality=level)
+        elif encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise TypeError('不支持的压缩格式%s！' % encoding)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self):
+        """ emit everything compressed so far without ending the stream """
+        if self.encoding == 'gzip':
+            return self._obj.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == 'br':
+            return self._obj.flush()
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        """ end the stream """
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
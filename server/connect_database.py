@@ -1,4 +1,5 @@
 import pymysql
+import metrics
 
 class Oprations_of_Database:
     connection = None
@@ -11,6 +12,10 @@ class Oprations_of_Database:
         
     def build_connection(self):
         try:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+                metrics.DB_CONNECTIONS_OPEN.dec()
             self.connection = pymysql.connect(
                 host = self.IP_address,
                 port = self.Port,
@@ -18,6 +23,8 @@ class Oprations_of_Database:
                 password = self.Password,
                 charset = 'utf8'
             ) #创建一个连接
+            metrics.DB_CONNECTIONS_OPENED.inc()
+            metrics.DB_CONNECTIONS_OPEN.inc()
             self.cursor = self.connection.cursor() #创建一个游标，用于操作数据库
             return True
         except  Exception as error_info:
@@ -7,6 +7,10 @@ Interface for basic reading database request
 import pymysql
 import logging
 import json
+import time
+import threading
+import metrics
+import workload
 logger = logging.getLogger()
 
 
@@ -89,6 +93,8 @@ class DBConnector:
                 user=self.username,
                 password=self.password
             )
+            metrics.DB_CONNECTIONS_OPENED.inc()
+            metrics.DB_CONNECTIONS_OPEN.inc()
         sql = 'SHOW DATABASES;'
         return self.execute_sql(sql)
 
@@ -159,13 +165,18 @@ class DBConnector:
         sql = 'SELECT * FROM %s.%s' % (database_name, table_name)
         return self.execute_sql(sql)
 
-    def execute_sql(self, sql):
+    def execute_sql(self, sql, args=None, cursor_class=pymysql.cursors.DictCursor):
         """ execute an input sql
 
         Parameters
         ----------
         sql: String
             a correct sql script
+        args: tuple, list or dict
+            parameters bound to the %s placeholders of sql by pymysql, None when sql has no placeholder
+        cursor_class: type
+            cursor class of pymysql, pymysql.cursors.SSCursor streams the rows of a big result,
+            read it to the end before executing the next statement
 
         Returns
         -------
@@ -182,10 +193,42 @@ class DBConnector:
         if self._conn is None:
             raise ReferenceError('Database has not been connected!')
         logger.debug('ExecuteSQL: %s' % sql)
-        cur = self._conn.cursor(pymysql.cursors.DictCursor)
-        cur.execute(sql)
+        cur = self._conn.cursor(cursor_class)
+        start = time.perf_counter()
+        try:
+            cur.execute(sql, args)
+        except pymysql.err.Error:
+            metrics.record_sql(sql, time.perf_counter() - start, failed=True)
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.record_sql(sql, elapsed)
+        workload.WORKLOAD.record(sql, args, elapsed, self.database)
         return cur
 
+    def attach_connection(self, connection):
+        """ use a connection borrowed from a ConnectionPool instead of connecting by itself
+
+        Parameters
+        ----------
+        connection: pymysql.connections.Connection
+            an open connection, give it back to its pool after detach_connection
+
+        """
+        self._conn = connection
+
+    def detach_connection(self):
+        """ stop using the attached connection and return it without closing it """
+        connection = self._conn
+        self._conn = None
+        return connection
+
+    def close_db(self):
+        """ close the connection to the database if it has been established """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            metrics.DB_CONNECTIONS_OPEN.dec()
+
     def commit_sql(self, sql):
         """ commit sql in an affair
 
@@ -194,9 +237,140 @@ class DBConnector:
         sql: String
             a correct sql script
 
+        Returns
+        -------
+        cursor: pymysql.cursor.DictCursor
+            a cursor of input sql, its rowcount is the number of affected rows
+
         """
-        self.execute_sql(sql)
+        cur = self.execute_sql(sql)
         self._conn.commit()
+        return cur
+
+
+class ConnectionPool:
+    """ A bounded pool of connections to one MySQL server and database
+
+    Connections are opened lazily up to max_size and reused after release
+    acquire() blocks while all max_size connections are in use, which limits the concurrency of callers
+    A pool is shared by every caller of the same server, user and database, its size is the largest max_size
+    asked for by get, so a caller never gets fewer connections than it asked for because another came first
+
+    Attributions:
+    _pools: pools shared by the whole process, keyed by (ip, port, username, database)
+    max_size: the maximum number of connections opened by this pool
+
+    """
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, config, max_size=8):
+        """ Returns the shared pool of a config, creating it on first use
+
+        Parameters
+        ----------
+        config: dict
+            a dictionary like the one of DBConnector.init_config
+        max_size: int
+            the maximum number of connections the caller needs, an existing smaller pool grows to it,
+            a pool never shrinks
+
+        """
+        key = (config['ip'], config['port'], config['username'], config['database'])
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls._pools[key] = ConnectionPool(config, max_size)
+            elif max_size > pool.max_size:
+                pool._grow(max_size)
+        return pool
+
+    def __init__(self, config, max_size=8):
+        self._config = dict(config)
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_size)
+        self._in_use = 0
+        self._opened = 0
+
+    def _grow(self, max_size):
+        with self._lock:
+            self._slots.release(max_size - self.max_size)
+            self.max_size = max_size
+
+    def acquire(self, timeout=None):
+        """ borrow a connection, wait for a free one, raise TimeoutError if none is free within timeout seconds """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError('连接池中没有空闲连接！')
+        try:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = pymysql.connect(
+                    host=self._config['ip'],
+                    port=self._config['port'],
+                    database=self._config['database'],
+                    user=self._config['username'],
+                    password=self._config['password']
+                )
+                metrics.DB_CONNECTIONS_OPENED.inc()
+                metrics.DB_CONNECTIONS_OPEN.inc()
+                with self._lock:
+                    self._opened += 1
+            else:
+                connection.ping(reconnect=True)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return connection
+
+    def release(self, connection, broken=False):
+        """ give a borrowed connection back, a broken connection is closed instead of reused """
+        with self._lock:
+            self._in_use -= 1
+            if broken:
+                self._opened -= 1
+            else:
+                self._idle.append(connection)
+        if broken:
+            try:
+                connection.close()
+            except pymysql.err.Error:
+                pass
+            metrics.DB_CONNECTIONS_OPEN.dec()
+        self._slots.release()
+
+    def close(self):
+        """ close all idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for connection in idle:
+            connection.close()
+            metrics.DB_CONNECTIONS_OPEN.dec()
+
+    @classmethod
+    def pool_stats(cls):
+        """ collector of the connection pools for metrics.REGISTRY """
+        in_use, idle = [], []
+        with cls._pools_lock:
+            pools = list(cls._pools.items())
+        for key, pool in pools:
+            labels = {'server': '%s:%s' % (key[0], key[1]), 'database': key[3]}
+            with pool._lock:
+                in_use.append((labels, pool._in_use))
+                idle.append((labels, len(pool._idle)))
+        return [
+            ('dmp_db_pool_connections_in_use', 'gauge', 'Pooled connections currently borrowed.', in_use),
+            ('dmp_db_pool_connections_idle', 'gauge', 'Pooled connections waiting to be reused.', idle),
+        ]
+
+
+metrics.REGISTRY.register_collector(ConnectionPool.pool_stats)
 
 
 class DBPrinter(DBConnector):
@@ -1,31 +1,346 @@
 """
-Interface for import data into database by excel file <.xlsx> and csv file <.csv>
+Interface for import data into database by excel file <.xlsx>, csv file <.csv> and JSON file <.json>
     Please look forward to more features
 """
 #    Author: Wang Chuhan(wchwzhsgdx@gmail.com)
 #    Time: 2021.03.14
 #    for Data Manage Platform(TJU CS2018-3)
 from openpyxl import load_workbook
-from sqlcreator import SqlCreator
+from sqlcreator import SqlCreator, quote_identifier, ddl_change
+from changeset import key_condition
+from importstate import file_digest
+from importpipeline import ImportPipeline
+import parallelcsv
+import jsonstream
+from columnar import ColumnConverter
+import upsert
+import sources
 import csv
 import pymysql
 import datetime
+import itertools
 import json
+import os
+import time
 
 
 class FileImportTool(SqlCreator):
-    """ Import data in excel file <.xlsx> and csv file <.csv>
+    """ Import data in excel file <.xlsx>, csv file <.csv> and JSON file <.json>
 
     Interface for creating database according to excel file
     Interface for creating table in an existed database according to excel file
     Interface for inserting data into an existed table according to excel file
     Interface for inserting data into an existed table according to csv file
+    Interface for inserting data into an existed table according to JSON or NDJSON file
     Interface for rollback the new database
     Interface for rollback the new table
 
+    Attributions:
+    batch_size: the number of rows inserted and committed at once in one transaction, the unit of the checkpoints,
+                the rows of every INSERT statement of a batch are chosen by the AdaptiveBatcher of the table
+    writers: the number of threads inserting batches, each on its own pooled connection
+    queue_size: the number of batches buffered between reading, converting and inserting
+    progress: None or a callable called as progress(parsed=0, inserted=0, failed=0, skipped=0, updated=0, unchanged=0)
+              with the rows parsed, inserted, failed, skipped, updated and found unchanged since the last call,
+              an exception raised by it stops the import
+    checkpoints: None or an importstate.ImportCheckpoints, batches committed by an earlier import of the same file
+                 into the same table are skipped
+    source_hash: the hash of the file being imported, set by the deal functions when checkpoints is used
+    bytes_read(): the bytes of the file being imported read so far, the progress of the file against its size
+    bulk: bulk-load mode of the tables created by deal_excel_1 and deal_excel_2, the writers relax the unique and
+          foreign key checks of their sessions and commit batches of bulk_batch_size rows,
+          secondary indexes are built after the load, refer to build_indexes
+    bulk_batch_size: the number of rows of a batch in bulk-load mode
+    mode: how the deal functions write rows whose key is already in the table,
+          'insert' fails on them, 'upsert' updates the imported columns (INSERT ... ON DUPLICATE KEY UPDATE),
+          'replace' replaces the whole row (REPLACE), rows are matched by the primary or a unique key
+    skip_unchanged: in 'upsert' and 'replace' mode, load the hash of every row of the table first
+                    and skip the rows of the file which did not change, refer to upsert.RowIndex
+
     """
+    batch_size = 1000
+    bulk = False
+    bulk_batch_size = 20000
+    mode = 'insert'
+    skip_unchanged = False
+    _upsert = None
+    writers = 2
+    queue_size = 4
+    progress = None
+    checkpoints = None
+    source_hash = None
+    _source_path = None
+    _source_file = None
+    _read_bytes = 0
+    _source_size = 0
+
+    def _report(self, parsed=0, inserted=0, failed=0, skipped=0, updated=0, unchanged=0):
+        if self.progress is not None:
+            self.progress(parsed=parsed, inserted=inserted, failed=failed, skipped=skipped,
+                          updated=updated, unchanged=unchanged)
+
+    def enable_checkpoints(self, checkpoints, path):
+        """ record the committed batches of the import of path in checkpoints, returns the hash of path """
+        self.checkpoints = checkpoints
+        self._begin_source(path)
+        return self.source_hash
+
+    def bytes_read(self):
+        """ Returns the bytes of the file being imported read so far, also while another thread reads it """
+        source_file = self._source_file
+        if source_file is not None:
+            try:
+                self._read_bytes = source_file.tell()
+            except (ValueError, OSError):
+                # closed once the file was read
+                self._source_file = None
+                self._read_bytes = self._source_size
+        return self._read_bytes
+
+    def _opened(self, source_file):
+        """ the opened callable of sources, follows the position of the binary file being read """
+        self._source_file = source_file
+        self._source_size = os.fstat(source_file.fileno()).st_size
+
+    def _range_parsed(self, start, end):
+        """ the parsed callable of parallelcsv.parse_parallel """
+        self._read_bytes += end - start
+
+    def _begin_source(self, path):
+        self._source_file = None
+        self._read_bytes = 0
+        if self.checkpoints is not None and self._source_path != path:
+            self.source_hash = file_digest(path)
+            self._source_path = path
+
+    def _batch_present(self, batch, database_name, table_name):
+        """ check whether a batch begun by an interrupted import has been committed, by its primary keys """
+        key_fields = self.primary_key(self.table_columns(database_name, table_name).fetchall())
+        if not key_fields:
+            print("Import Warning: 表'%s'没有主键，无法确认中断的批次是否已提交，将重新插入。" % table_name)
+            return False
+        keys = [tuple(value_d[k] for k in key_fields) for value_d in batch]
+        condition = key_condition([quote_identifier(k) for k in key_fields], keys)
+        sql = 'SELECT COUNT(*) AS found FROM %s.%s WHERE %s;' % (quote_identifier(database_name),
+                                                               quote_identifier(table_name), condition)
+        return int(self.execute_sql(sql).fetchone()['found']) == len(batch)
+
+    def _write_batch(self, index, batch, database_name, table_name, verify=False):
+        """ insert and commit one batch of row dictionaries, the writer stage of ImportPipeline
+
+        Parameters
+        ----------
+        index: int
+            the number of the batch in the file, the key of its checkpoint
+        batch: list
+            the row dictionaries of the batch
+        verify: Boolean
+            an earlier import began this batch without confirming it, skip it if its rows are in the table
+
+        Returns
+        -------
+        inserted: int
+            the number of rows inserted, rows of a failed batch are reported as failed
+
+        """
+        checkpoint = None
+        if self.checkpoints is not None and self.source_hash is not None:
+            checkpoint = (self.source_hash, database_name, table_name, self.batch_size)
+        if verify and self.mode == 'insert' and self._batch_present(batch, database_name, table_name):
+            self.checkpoints.commit(*checkpoint, index, len(batch))
+            self._report(skipped=len(batch))
+            return 0
+        if checkpoint is not None:
+            self.checkpoints.begin(*checkpoint, index, len(batch))
+        if self.mode != 'insert':
+            # writing a batch again gives the same rows, a batch begun before needs no verification
+            count = self._upsert_batch(batch, database_name, table_name)
+            if count and checkpoint is not None:
+                self.checkpoints.commit(*checkpoint, index, count)
+            return count
+        # create_object_sql takes less than 10000 rows per call, a bulk batch is queued in parts
+        for start in range(0, len(batch), 5000):
+            json_template = dict(('%d' % num, value_d) for num, value_d in enumerate(batch[start:start + 5000]))
+            self.create_object_sql(json.dumps(json_template, ensure_ascii=False), database_name, table_name)
+        # a batch is committed in one transaction, it is in the table or not at all, never partly,
+        # so its rows are counted right and a resumed import can check it by its keys
+        status = self.commit_all(single_transaction=True)
+        print("Insert Into Table '%s' Status Code:" % table_name, status)
+        executed, total = status.split(' ')[0].split('-')
+        count = len(batch) if executed == total else 0
+        if count and checkpoint is not None:
+            self.checkpoints.commit(*checkpoint, index, count)
+        self._report(inserted=count, failed=len(batch) - count)
+        return count
+
+    def _prepare_upsert(self, database_name, table_name, names):
+        """ find the key matching the rows of the file to the table, and load its RowIndex if skip_unchanged """
+        if self.mode not in upsert.MODES:
+            raise TypeError('不支持的导入模式%s！' % self.mode)
+        self._upsert = None
+        if self.mode == 'insert':
+            return
+        key_fields = upsert.unique_key(self, database_name, table_name, names)
+        row_index = None
+        if self.skip_unchanged:
+            row_index = upsert.RowIndex.load(self, database_name, table_name, key_fields, names)
+            print("Table '%s' Row Index Loaded:" % table_name, len(row_index))
+        self._upsert = (key_fields, list(names), row_index)
+
+    def _upsert_batch(self, batch, database_name, table_name):
+        """ write a batch in 'upsert' or 'replace' mode, returns the number of rows written or found unchanged
+
+        Rows of the batch with the same key are written once, with the values of the last of them,
+        the others are reported as skipped
+        The keys already in the table, found by MySQL or in the RowIndex, tell inserted rows from the others,
+        in 'upsert' mode the affected rows of the statement, 1 per inserted and 2 per changed row,
+        tell updated rows from unchanged ones
+
+        """
+        key_fields, names, row_index = self._upsert
+        latest = {}
+        for value_d in batch:
+            latest[tuple(upsert.normalize(value_d[k]) for k in key_fields)] = value_d
+        skipped = len(batch) - len(latest)
+        unchanged = 0
+        rows = []
+        digests = {}
+        for key, value_d in latest.items():
+            if row_index is not None:
+                digest = upsert.row_digest(value_d[name] for name in names)
+                if row_index.get(key) == digest:
+                    unchanged += 1
+                    continue
+                digests[key] = digest
+            rows.append((key, value_d))
+        existing = set(key for key, _ in rows if row_index is not None and row_index.get(key) is not None)
+        # a key missing from the index may still be in the table with a value which only looks different
+        unknown = [(key, value_d) for key, value_d in rows if key not in existing]
+        if unknown:
+            positions = upsert.existing_keys(self, database_name, table_name, key_fields,
+                                             [tuple(value_d[k] for k in key_fields) for _, value_d in unknown])
+            existing.update(unknown[position][0] for position in positions)
+
+        inserted = updated = failed = 0
+        batcher = self._batcher(database_name, table_name)
+        start_row = 0
+        while start_row < len(rows):
+            part = rows[start_row:start_row + batcher.rows()]
+            start_row += len(part)
+            sql = upsert.upsert_statement(database_name, table_name, names, [value_d for _, value_d in part],
+                                          self.mode, key_fields)
+            size = len(sql.encode('utf-8'))
+            start = time.perf_counter()
+            try:
+                cur = self.commit_sql(sql)
+            except pymysql.err.Error as error_info:
+                batcher.failure(error_info, size)
+                print("Sql Error: %s 语句存在错误，并没有被执行！" % sql[:200], error_info)
+                failed += len(part)
+                continue
+            batcher.success(len(part), time.perf_counter() - start, size)
+            new = sum(1 for key, _ in part if key not in existing)
+            old = len(part) - new
+            changed = old
+            if self.mode == 'upsert' and 0 <= cur.rowcount - new <= 2 * old:
+                changed = (cur.rowcount - new) // 2
+            inserted += new
+            updated += changed
+            unchanged += old - changed
+            if row_index is not None:
+                row_index.update(dict((key, digests[key]) for key, _ in part))
+            self._notify_commit([self._upsert_change(database_name, table_name, key_fields, part, existing, new,
+                                                     changed)])
+        self._report(inserted=inserted, updated=updated, unchanged=unchanged, skipped=skipped, failed=failed)
+        return 0 if failed else len(batch)
+
+    def _upsert_change(self, database_name, table_name, key_fields, part, existing, inserted, updated):
+        """ Returns the change of an upsert statement for the commit listeners, refer to add_commit_listener """
+        change = {'database': database_name, 'table': table_name, 'inserted': inserted, 'updated': updated,
+                  'deleted': 0, 'ddl': False, 'complete': self.mode == 'upsert', 'rows': []}
+        if self.mode == 'replace':
+            # a replaced row loses the columns which are not imported, the old rows are unknown
+            return change
+        for key, value_d in part:
+            change['rows'].append({'op': 'update' if key in existing else 'insert',
+                                   'key': dict((k, value_d[k]) for k in key_fields), 'values': dict(value_d)})
+        return change
+
+    def _insert_rows(self, rows, convert, database_name, table_name):
+        """ insert raw rows through an ImportPipeline, refer to ImportPipeline.run
+
+        Returns
+        -------
+        pipeline: ImportPipeline
+            the finished pipeline, with the number of rows parsed and inserted
+
+        """
+        setup, teardown = (), ()
+        if self.bulk:
+            setup = ['SET SESSION unique_checks = 0, foreign_key_checks = 0;']
+            teardown = ['SET SESSION unique_checks = 1, foreign_key_checks = 1;']
+        pipeline = ImportPipeline(self, database_name, table_name, self.writers, self.queue_size, setup, teardown)
+        pipeline.run(rows, convert)
+        return pipeline
+
+    def build_indexes(self, database_name, table_name, indexes, expected_rows=None):
+        """ build the secondary indexes of a loaded table in one ALTER TABLE statement
+
+        Building every index once from the loaded rows is much cheaper than maintaining it row by row,
+        so the tables are created with only their primary key and the indexes are added here
 
-    def deal_excel_1(self, excel, key_number=0):
+        Parameters
+        ----------
+        database_name, table_name: str
+            the loaded table
+        indexes: list
+            column names, lists of column names of a composite index
+            or dictionaries {"Columns": ["stype", "device"], "Unique": true}
+        expected_rows: int or None
+            the number of rows which should be in the table, checked before the indexes are built
+
+        Returns
+        -------
+        names: list
+            the names of the indexes built
+
+        Notes
+        -----
+        A unique index is checked for duplicate values before it is built, the rows were loaded without unique checks.
+        Raise Warning if the table does not hold the expected rows, has duplicates or misses an index afterwards.
+
+        """
+        table = '%s.%s' % (quote_identifier(database_name), quote_identifier(table_name))
+        if expected_rows is not None:
+            count = int(self.execute_sql('SELECT COUNT(*) AS found FROM %s;' % table).fetchone()['found'])
+            if count != expected_rows:
+                raise Warning("表'%s'导入了%d行数据，应为%d行！" % (table_name, count, expected_rows))
+        clauses = []
+        names = []
+        for index in indexes:
+            columns = _index_columns(index)
+            unique = isinstance(index, dict) and index.get('Unique', False)
+            quoted = ', '.join(quote_identifier(c) for c in columns)
+            if unique:
+                duplicate = self.execute_sql('SELECT %s FROM %s GROUP BY %s HAVING COUNT(*) > 1 LIMIT 1;'
+                                             % (quoted, table, quoted)).fetchone()
+                if duplicate is not None:
+                    raise Warning("表'%s'的唯一索引列存在重复值%s！" % (table_name, duplicate))
+            name = ('%s_%s' % ('uni' if unique else 'idx', '_'.join(columns)))[:64]
+            clauses.append('ADD %sINDEX %s (%s)' % ('UNIQUE ' if unique else '', quote_identifier(name), quoted))
+            names.append(name)
+        if not clauses:
+            return names
+        self.commit_sql('ALTER TABLE %s %s;' % (table, ', '.join(clauses)))
+        self._notify_commit([ddl_change(database_name, table_name)])
+        built = set(row['Key_name'] for row in self.execute_sql('SHOW INDEX FROM %s;' % table).fetchall())
+        missing = [name for name in names if name not in built]
+        if missing:
+            raise Warning("表'%s'的索引%s没有建立！" % (table_name, ', '.join(missing)))
+        print("Table '%s' Indexes Built:" % table_name, ', '.join(names))
+        return names
+
+    def deal_excel_1(self, excel, key_number=0, indexes=None):
         """ create database according to excel file
 
         Function will automatically generate database and import data according to excel data
@@ -36,6 +351,8 @@ class FileImportTool(SqlCreator):
             path of excel file <.xlsx>
         key_number: int
             be able to specify the number of the first column as the primary key, which is the first column by default
+        indexes: list
+            secondary indexes of every table, refer to deal_excel_2
 
         Notes
         -----
@@ -44,7 +361,7 @@ class FileImportTool(SqlCreator):
         (The default is 0)
 
         """
-        database = excel.split('.')[0]
+        database = sources.split_name(excel)[0]
         json_template = """
         {
             "database": "%s",
@@ -56,11 +373,11 @@ class FileImportTool(SqlCreator):
         print("Database '%s' Create Status Code:" % database, self.commit_all())
 
         try:
-            self.deal_excel_2(excel, database, key_number)
+            self.deal_excel_2(excel, database, key_number, indexes)
         except ReferenceError:
             self.rollback_database_import(database)
 
-    def deal_excel_2(self, excel, database_name, key_number=0):
+    def deal_excel_2(self, excel, database_name, key_number=0, indexes=None):
         """ create table according to excel file
 
         Function creates the data table automatically
@@ -73,71 +390,75 @@ class FileImportTool(SqlCreator):
             name of an existed database
         key_number: int
             be able to specify the number of the first column as the primary key, which is the first column by default
+        indexes: list
+            secondary indexes built after the data of a table is loaded, refer to build_indexes,
+            an index is built in every table which has all of its columns
 
         Notes
         -----
         You can specify which column as the primary key column, but in each workbook this number must be same.
         (The default is 0)
+        The tables are created with only their primary key, set bulk to load them in bulk-load mode.
 
         """
-        workbook = load_workbook(excel, data_only=True)
-        sheets = workbook.sheetnames
-
-        for sheet in sheets:
-            field_template = {}
-            json_template = {sheet: field_template}
-            work_sheet = workbook[sheet]
-            value_row = []
-            for row in work_sheet.rows:
-                value = [cell.value for cell in row]
-                value_row.append(value)
-            num = 0
-            for v in value_row[1]:
-                if num == key_number:
-                    e = 'PRI'
-                else:
-                    e = ''
-
-                if type(v) == int:
-                    field_template[num] = {'Field': value_row[0][num], 'Type': 'INT', 'Key': e}
-                elif type(v) == float:
-                    field_template[num] = {'Field': value_row[0][num], 'Type': 'FLOAT', 'Key': e}
-                elif type(v) == str:
-                    field_template[num] = {'Field': value_row[0][num], 'Type': 'VARCHAR(255)', 'Key': e}
-                elif type(v) == datetime.datetime:
-                    field_template[num] = {'Field': value_row[0][num], 'Type': 'DATETIME', 'Key': e}
-                elif type(v) == datetime.date:
-                    field_template[num] = {'Field': value_row[0][num], 'Type': 'DATE', 'Key': e}
-                elif type(v) == datetime.time:
-                    field_template[num] = {'Field': value_row[0][num], 'Type': 'TIME', 'Key': e}
-                else:
-                    raise TypeError('不支持的数据类型！')
-                num = num + 1
-            json_create_table = json.dumps(json_template)
-            self.create_table_sql(json_create_table, database_name)
-            print("Table '%s' Create Status Code:" % sheet, self.commit_all())
-
-            num = 0
-            json_template = {}
-            for values in value_row[1:]:
-                value = [v for v in values]
-                value_num = len(value)
-                value_d = {}
-                for i in range(value_num):
-                    if value[i] is None:
-                        self.rollback_table_import(database_name, sheet)
-                        raise ReferenceError('表中数据存在空存档，请修改后重试')
-
-                    if type(value[i]) == datetime.datetime or type(value[i]) == datetime.date \
-                            or type(value[i]) == datetime.time:
-                        value_d[value_row[0][i]] = str(value[i]).split('.')[0]
-                    else:
-                        value_d[value_row[0][i]] = value[i]
-                json_template['%d' % num] = value_d
-                num = num + 1
-            json_insert_table = json.dumps(json_template, ensure_ascii=False)
-            self.create_object_sql(json_insert_table, database_name, sheet)
-            print("Insert Into Table '%s' Status Code:" % sheet, self.commit_all())
+        self._begin_source(excel)
+        with sources.workbook_source(excel, self._opened) as source:
+            workbook = load_workbook(source, read_only=True, data_only=True)
+            sheets = workbook.sheetnames
+
+            try:
+                for sheet in sheets:
+                    self._create_sheet_table(workbook[sheet], sheet, database_name, key_number, indexes or [])
+            finally:
+                workbook.close()
+
+    def _create_sheet_table(self, work_sheet, sheet, database_name, key_number, indexes):
+        field_template = {}
+        json_template = {sheet: field_template}
+        rows = work_sheet.iter_rows(values_only=True)
+        names = list(next(rows))
+        first = list(next(rows))
+        num = 0
+        for v in first:
+            if num == key_number:
+                e = 'PRI'
+            else:
+                e = ''
+
+            if type(v) == int:
+                field_template[num] = {'Field': names[num], 'Type': 'INT', 'Key': e}
+            elif type(v) == float:
+                field_template[num] = {'Field': names[num], 'Type': 'FLOAT', 'Key': e}
+            elif type(v) == str:
+                field_template[num] = {'Field': names[num], 'Type': 'VARCHAR(255)', 'Key': e}
+            elif type(v) == datetime.datetime:
+                field_template[num] = {'Field': names[num], 'Type': 'DATETIME', 'Key': e}
+            elif type(v) == datetime.date:
+                field_template[num] = {'Field': names[num], 'Type': 'DATE', 'Key': e}
+            elif type(v) == datetime.time:
+                field_template[num] = {'Field': names[num], 'Type': 'TIME', 'Key': e}
+            else:
+                raise TypeError('不支持的数据类型！')
+            num = num + 1
+        json_create_table = json.dumps(json_template)
+        self.create_table_sql(json_create_table, database_name)
+        print("Table '%s' Create Status Code:" % sheet, self.commit_all())
+
+        self._prepare_upsert(database_name, sheet, names)
+        batch_size = self.batch_size
+        if self.bulk:
+            self.batch_size = self.bulk_batch_size
+        try:
+            pipeline = self._insert_rows(itertools.chain([first], rows), ColumnConverter(names), database_name, sheet)
+        except ReferenceError:
+            self.rollback_table_import(database_name, sheet)
+            raise
+        finally:
+            self.batch_size = batch_size
+
+        table_indexes = [index for index in indexes if set(_index_columns(index)) <= set(names)]
+        if table_indexes:
+            self.build_indexes(database_name, sheet, table_indexes, pipeline.parsed)
 
     def deal_excel_3(self, excel, database_name, table_name, sheet_seq=0):
         """ insert data into table according to excel file <.xlsx>
@@ -160,16 +481,17 @@ class FileImportTool(SqlCreator):
         if not specify the serial number of imported workbook, it will be defaulted by 0 (the first work sheet)
 
         """
-        workbook = load_workbook(excel, data_only=True)
-        sheets = workbook.sheetnames
-        sheet = workbook[sheets[sheet_seq]]
-        value_row = []
-        for row in sheet.rows:
-            value = [cell.value for cell in row]
-            value_row.append(value)
-        self.insert_value_row(value_row, database_name, table_name)
-
-    def deal_csv(self, csv_file, database_name, table_name):
+        self._begin_source(excel)
+        with sources.workbook_source(excel, self._opened) as source:
+            workbook = load_workbook(source, read_only=True, data_only=True)
+            sheets = workbook.sheetnames
+            sheet = workbook[sheets[sheet_seq]]
+            try:
+                self.insert_value_row(sheet.iter_rows(values_only=True), database_name, table_name)
+            finally:
+                workbook.close()
+
+    def deal_csv(self, csv_file, database_name, table_name, processes=1, ordered=True):
         """ insert data into table according to csv file <.csv>
 
         Function automatically matches column and database properties by name
@@ -177,45 +499,131 @@ class FileImportTool(SqlCreator):
         Parameters
         ----------
         csv_file: str
-            path of csv file <.csv>
+            path of csv file <.csv>, <.csv.gz>, <.csv.zst> or <.zip>, refer to sources.csv_streams
         database_name: str
             name of an existed database
         table_name: str
             name of an existed table
+        processes: int
+            parse the file in parallel with this many processes, None for the number of cores,
+            1 parses it in the calling thread
+        ordered: Boolean
+            insert the rows of a parallel parse in the order of the file, required by the checkpoints,
+            an unordered import inserts the rows parsed first without waiting and is not checkpointed
+
+        Notes
+        -----
+        A parallel parse cuts the memory-mapped file at record boundaries, newlines inside quoted fields
+        are kept in their record, and parses the ranges in a process pool, refer to parallelcsv
+        A compressed file is decompressed while it is parsed, it cannot be cut and is always parsed in one thread.
+        The csv members of a .zip archive are imported one after another as one file, they must have the same names.
 
         """
-        with open(csv_file) as f_csv:
-            file = csv.reader(f_csv)
-            value_row = []
+        self._begin_source(csv_file)
+        if processes != 1 and not sources.is_compressed(csv_file):
+            self._deal_csv_parallel(csv_file, database_name, table_name, processes, ordered)
+            return
+        self.insert_value_row(self._csv_rows(csv_file), database_name, table_name, strip_spaces=True)
+
+    def _csv_rows(self, csv_file):
+        """ generator of the rows of the csv streams of a file, the names of the first stream and no other names """
+        header = None
+        for name, stream in sources.csv_streams(csv_file, opened=self._opened):
+            file = csv.reader(stream)
+            names = [v.replace(' ', '') for v in next(file, [])]
+            if header is None:
+                header = names
+                yield header
+            elif names != header:
+                raise ReferenceError('%s的数据名称与第一个文件不一致！' % name)
             for row in file:
-                value = [v.replace(' ', '') for v in row]
-                value_row.append(value)
-        f_csv.close()
-        self.insert_value_row(value_row, database_name, table_name)
+                yield row
+
+    def _deal_csv_parallel(self, csv_file, database_name, table_name, processes, ordered):
+        header, ranges = parallelcsv.split_ranges(csv_file)
+        input_name = parallelcsv.parse_range(csv_file, *header)
+        if not input_name:
+            raise ReferenceError('文件中没有数据名称！')
+        converter = self._column_converter(input_name[0], database_name, table_name)
+        self._prepare_upsert(database_name, table_name, converter.names)
+        self._range_parsed(*header)
+        rows = parallelcsv.parse_parallel(csv_file, ranges, processes, ordered, parsed=self._range_parsed)
+        checkpoints = self.checkpoints
+        if not ordered and checkpoints is not None:
+            # batches of an unordered parse hold different rows every time, they cannot be resumed
+            print("Import Warning: 无序并行导入不记录检查点。")
+            self.checkpoints = None
+        try:
+            self._insert_rows(rows, converter, database_name, table_name)
+        finally:
+            self.checkpoints = checkpoints
+            rows.close()
+
+    def deal_json(self, json_file, database_name, table_name):
+        """ insert data into table according to JSON file <.json> or NDJSON file <.ndjson>, <.jsonl>
+
+        Function automatically matches column and database properties by the keys of the first row
 
-    def insert_value_row(self, value_row, database_name, table_name):
+        Parameters
+        ----------
+        json_file: str
+            path of the file, also compressed <.gz>, <.zst> or in a <.zip> archive, refer to sources.text_streams
+        database_name: str
+            name of an existed database
+        table_name: str
+            name of an existed table
+
+        Notes
+        -----
+        The rows are objects, one per line, in an array or in an object by row number like document <Data.json>,
+        refer to jsonstream.iter_objects, every row must have the keys of the first one
+        The file is decoded a row at a time while the previous batches are inserted, so memory does not grow
+        with the file, true and false are inserted as 1 and 0, nested objects and arrays as JSON text
+
+        """
+        self._begin_source(json_file)
+        self.insert_value_row(jsonstream.iter_rows(self._json_objects(json_file)), database_name, table_name)
+
+    def _json_objects(self, json_file):
+        """ generator of the rows of the JSON streams of a file, the members of a .zip archive one after another """
+        for _, stream in sources.text_streams(json_file, jsonstream.EXTENSIONS, 'utf-8-sig', self._opened):
+            for obj in jsonstream.iter_objects(stream):
+                yield obj
+
+    def insert_value_row(self, value_row, database_name, table_name, strip_spaces=False):
         """ inserts the input data into the specified table
 
         Parameters
         ----------
-        value_row: list
-            the input data
+        value_row: list or iterable
+            the input data, rows are read lazily and inserted in batches while the next ones are read
         database_name: str
             name of an existed database
         table_name: str
             name of an existed table
+        strip_spaces: Boolean
+            remove every space from the string values
 
         Notes
         -----
         the value of value_row[0] must be the name of column
+        the rows are converted a batch at a time by a ColumnConverter, strings of numeric columns become numbers
+        rows before an empty cell may already be committed when the empty cell is found
 
         """
-        input_name = []
-        for value in value_row[0]:
-            input_name.append(value)
+        rows = iter(value_row)
+        converter = self._column_converter(next(rows), database_name, table_name, strip_spaces)
+        self._prepare_upsert(database_name, table_name, converter.names)
+        self._insert_rows(rows, converter, database_name, table_name)
+
+    def _column_converter(self, input_name, database_name, table_name, strip_spaces=False):
+        """ Returns the ColumnConverter of a file, every column of it matched by name to a column of the table """
+        input_name = list(input_name)
         accept_name = []
+        accept_type = []
         for key in self.table_columns(database_name, table_name).fetchall():
             accept_name.append(key['Field'])
+            accept_type.append(key['Type'])
 
         try:
             auto_map = my_match_list(input_name, accept_name)  # <input -> accept>
@@ -226,27 +634,8 @@ class FileImportTool(SqlCreator):
         except ReferenceError:
             raise Warning('输入数据不能对所有数据库属性赋值，可能会产生意想不到的错误！')
 
-        num = 0
-        json_template = {}
-        for values in value_row[1:]:
-            value = [v for v in values]
-            value_num = len(value)
-            value_d = {}
-            for i in range(value_num):
-                if value[i] is None:
-                    raise ReferenceError('表中数据存在空存档，请修改后重试')
-
-                if type(value[i]) == datetime.datetime or type(value[i]) == datetime.date \
-                        or type(value[i]) == datetime.time:
-                    value_d[value_row[0][auto_map[i]]] = str(value[i]).split('.')[0]
-                else:
-                    value_d[value_row[0][auto_map[i]]] = value[i]
-            json_template['%d' % num] = value_d
-            num = num + 1
-        json_insert_table = json.dumps(json_template, ensure_ascii=False)
-        self.create_object_sql(json_insert_table, database_name, table_name)
-        print(json_insert_table)
-        print("Insert Into Table '%s' Status Code:" % table_name, self.commit_all())
+        return ColumnConverter([accept_name[auto_map[i]] for i in range(len(input_name))],
+                               [accept_type[auto_map[i]] for i in range(len(input_name))], strip_spaces)
 
     def rollback_database_import(self, database_name):
         try:
@@ -257,12 +646,17 @@ class FileImportTool(SqlCreator):
 
     def rollback_table_import(self, database_name, table_name):
         try:
-            self.commit_sql('DROP TABLE %s.%s;') % (database_name, table_name)
+            self.commit_sql('DROP TABLE %s.%s;' % (database_name, table_name))
         except pymysql.err.Error:
             print('表中数据存在空存档，请修改后重试')
             raise ReferenceError('Rollback Import Error: Cannot drop table.')
 
 
+def _index_columns(index):
+    columns = index['Columns'] if isinstance(index, dict) else index
+    return [columns] if isinstance(columns, str) else list(columns)
+
+
 def my_match_list(list1, list2):
     list2_stack = {}
     i = 0
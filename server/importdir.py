@@ -0,0 +1,205 @@
+"""
+Interface for importing every file of a directory
+    Files are mapped to tables by rules and imported in parallel within a budget of connections
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import fnmatch
+import glob
+import json
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dbconn import ConnectionPool
+from importdatafile import FileImportTool
+from importstate import checkpoints
+import jsonstream
+import sources
+
+
+class DirectoryImport:
+    """ Import the csv <.csv>, excel <.xlsx> and JSON <.json>, <.ndjson>, <.jsonl> files of a directory
+    into existing tables, also compressed <.gz>, <.zst> or in a <.zip> archive, refer to sources
+
+    Every file matching pattern is imported into the table of the first rule matching its name,
+    files matching no rule are reported as 'unmatched' and left alone
+    A file imported completely into a table before, judged by the hash of its content, is skipped,
+    so the same drop directory can be imported again after new files arrived
+
+    workers files are imported at the same time, each by a FileImportTool with one connection of its own
+    and writers connections of the ConnectionPool shared by all files, sized workers * writers by run,
+    both are chosen so that at most connection_budget connections are used
+
+    Attributions:
+    directory: the directory of the files
+    pattern: a glob pattern relative to directory, '**' matches subdirectories
+    rules: a list of mapping rules {"Pattern": "sales_*.csv", "Database": "shop", "Table": "sales", "Sheet": 0},
+           Pattern is matched against the file name, or the relative path if it contains '/',
+           Database and Table may contain {stem}, the file name without extensions,
+           Database defaults to database_name and Sheet, the work sheet of an excel file, to 0
+    workers: the number of files imported at the same time
+    writers: the number of writer connections of every file
+    store: the ImportCheckpoints recording the batches and the files imported
+    mode, skip_unchanged: how rows already in the tables are written, refer to FileImportTool.mode
+    progress: None or a callable like FileImportTool.progress receiving the rows of all files,
+              an exception raised by it stops the import of the directory
+    manifest: the result of the last run, refer to run
+
+    """
+    extensions = ('.csv', '.xlsx') + jsonstream.EXTENSIONS
+
+    def __init__(self, directory, pattern='*.csv', rules=None, database_name=None, workers=4,
+                 connection_budget=8, store=None, progress=None, mode='insert', skip_unchanged=False):
+        if not os.path.isdir(directory):
+            raise TypeError('目录%s不存在！' % directory)
+        self.directory = directory
+        self.pattern = pattern
+        self.rules = rules if rules is not None else [{'Pattern': '*', 'Table': '{stem}'}]
+        self.database = database_name
+        self.workers = max(min(workers, connection_budget // 2), 1)
+        self.writers = max(connection_budget // self.workers - 1, 1)
+        self.store = store if store is not None else checkpoints()
+        self.progress = progress
+        self.mode = mode
+        self.skip_unchanged = skip_unchanged
+        self.manifest = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def files(self):
+        """ Returns the paths of the files matching pattern, sorted """
+        paths = glob.glob(os.path.join(self.directory, self.pattern), recursive=True)
+        return sorted(path for path in paths if os.path.isfile(path))
+
+    def target(self, path):
+        """ Returns (database, table, sheet) of a file by the first matching rule, None if no rule matches """
+        relative = os.path.relpath(path, self.directory).replace(os.sep, '/')
+        stem = sources.split_name(path)[0]
+        for rule in self.rules:
+            pattern = rule['Pattern']
+            name = relative if '/' in pattern else os.path.basename(path)
+            if fnmatch.fnmatch(name, pattern):
+                database_name = rule.get('Database', self.database)
+                if database_name is None:
+                    raise TypeError('规则%s没有指定数据库！' % pattern)
+                return (database_name.format(stem=stem), rule['Table'].format(stem=stem), rule.get('Sheet', 0))
+        return None
+
+    def run(self, manifest_path=None):
+        """ Interface for importing the directory
+
+        Parameters
+        ----------
+        manifest_path: String
+            also write the manifest to this file as JSON
+
+        Returns
+        -------
+        manifest: dict
+            {"directory": "/data/drop", "pattern": "*.csv", "started_at": 1616000000.0, "finished_at": 1616000060.0,
+             "summary": {"done": 2, "skipped": 1, ...},
+             "files": [{"file": "/data/drop/sales_01.csv", "file_hash": "...", "database": "shop", "table": "sales",
+                        "state": "done", "rows_inserted": 1000, "rows_updated": 0, "rows_unchanged": 0,
+                        "rows_failed": 0, "rows_skipped": 0,
+                        "seconds": 1.2, "error": None}, ...]}
+            the state of a file is 'done', 'skipped', 'unmatched', 'failed' or 'cancelled'
+
+        """
+        started_at = time.time()
+        paths = self.files()
+        # the writers of every file borrow from the same pool, it must hold all of them
+        ConnectionPool.get(dict(FileImportTool._config), max_size=self.workers * self.writers)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import-dir') as executor:
+            entries = list(executor.map(self._import_file, paths))
+        summary = {}
+        for entry in entries:
+            summary[entry['state']] = summary.get(entry['state'], 0) + 1
+        self.manifest = {'directory': self.directory, 'pattern': self.pattern, 'started_at': started_at,
+                         'finished_at': time.time(), 'summary': summary, 'files': entries}
+        if manifest_path is not None:
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        return self.manifest
+
+    def _report(self, entry, parsed=0, inserted=0, failed=0, skipped=0, updated=0, unchanged=0):
+        with self._lock:
+            entry['rows_inserted'] += inserted
+            entry['rows_updated'] += updated
+            entry['rows_unchanged'] += unchanged
+            entry['rows_failed'] += failed
+            entry['rows_skipped'] += skipped
+            if self.progress is not None:
+                try:
+                    self.progress(parsed=parsed, inserted=inserted, failed=failed, skipped=skipped,
+                                  updated=updated, unchanged=unchanged)
+                except Exception:
+                    self._stopped = True
+                    raise
+
+    @staticmethod
+    def _extension(path):
+        """ the extension of the content of a file,
+        a .zip archive holds csv files unless it has an .xlsx member or JSON members """
+        _, extension, compression = sources.split_name(path)
+        if compression == '.zip':
+            with zipfile.ZipFile(path) as archive:
+                names = [name.lower() for name in archive.namelist()]
+            if any(name.endswith('.xlsx') for name in names):
+                return '.xlsx'
+            return '.json' if any(name.endswith(jsonstream.EXTENSIONS) for name in names) else '.csv'
+        return extension
+
+    def _import_file(self, path):
+        entry = {'file': path, 'file_hash': None, 'database': None, 'table': None, 'state': 'unmatched',
+                 'rows_inserted': 0, 'rows_updated': 0, 'rows_unchanged': 0, 'rows_failed': 0, 'rows_skipped': 0,
+                 'seconds': 0.0, 'error': None}
+        try:
+            extension = self._extension(path)
+            target = self.target(path) if extension in self.extensions else None
+        except (TypeError, zipfile.BadZipFile) as error_info:
+            entry['state'], entry['error'] = 'failed', str(error_info)
+            return entry
+        if target is None:
+            return entry
+        database_name, table_name, sheet_seq = target
+        entry['database'], entry['table'] = database_name, table_name
+        if self._stopped:
+            entry['state'] = 'cancelled'
+            return entry
+
+        start = time.perf_counter()
+        tool = FileImportTool()
+        tool.writers = self.writers
+        tool.mode = self.mode
+        tool.skip_unchanged = self.skip_unchanged
+        tool.progress = lambda **counts: self._report(entry, **counts)
+        try:
+            entry['file_hash'] = tool.enable_checkpoints(self.store, path)
+            if self.store.imported_file(entry['file_hash'], database_name, table_name) is not None:
+                entry['state'] = 'skipped'
+                return entry
+            tool.connect_db()
+            if extension == '.xlsx':
+                tool.deal_excel_3(path, database_name, table_name, sheet_seq)
+            elif extension in jsonstream.EXTENSIONS:
+                tool.deal_json(path, database_name, table_name)
+            else:
+                tool.deal_csv(path, database_name, table_name)
+        except Exception as error_info:
+            entry['state'] = 'cancelled' if self._stopped else 'failed'
+            entry['error'] = '%s: %s' % (type(error_info).__name__, error_info)
+        else:
+            if entry['rows_failed']:
+                # the checkpoints are kept, the next run retries only the failed batches
+                entry['state'], entry['error'] = 'failed', '%d行数据插入失败！' % entry['rows_failed']
+            else:
+                entry['state'] = 'done'
+                self.store.finish(entry['file_hash'], database_name, table_name)
+                self.store.record_file(entry['file_hash'], database_name, table_name, path,
+                                       entry['rows_inserted'] + entry['rows_updated'] + entry['rows_unchanged']
+                                       + entry['rows_skipped'])
+        finally:
+            tool.close_db()
+            entry['seconds'] = round(time.perf_counter() - start, 3)
+        return entry
@@ -0,0 +1,326 @@
+"""
+Interface for running file imports as background jobs
+    Jobs run in a small worker pool and report their progress while they run
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from importdatafile import FileImportTool
+from importdir import DirectoryImport
+from importstate import checkpoints
+import metrics
+
+
+class ImportCancelled(Exception):
+    """ raised inside a running import when its job is cancelled """
+
+
+class ImportJob:
+    """ The state of one import, updated by the worker and read by the clients
+
+    States: 'queued' -> 'running' -> 'done', 'failed' or 'cancelled'
+
+    Attributions:
+    kind: 'excel_database' (deal_excel_1), 'excel_table' (deal_excel_2), 'excel_rows' (deal_excel_3),
+          'csv' (deal_csv), 'json' (deal_json) or 'directory' (DirectoryImport, path is the directory)
+    options: keyword arguments of the deal function, key_number or sheet_seq,
+             bulk and indexes of 'excel_database' and 'excel_table', refer to FileImportTool.bulk,
+             processes and ordered of 'csv', refer to FileImportTool.deal_csv,
+             mode and skip_unchanged of every kind, refer to FileImportTool.mode,
+             pattern, rules, workers, connection_budget and manifest_path of 'directory'
+    resume: skip the batches committed by an earlier job of the same file, otherwise import the whole file again
+    file_hash: the hash of the file, the key of its checkpoints
+    rows_parsed, rows_inserted, rows_failed, rows_skipped, rows_updated, rows_unchanged:
+        row counters reported by FileImportTool.progress
+    bytes_total: the size of the file, None for a 'directory' job
+    bytes_read: None or a callable returning the bytes of the file read so far, refer to FileImportTool.bytes_read
+    errors: messages of the errors of the job
+    result: the manifest of a 'directory' job, refer to DirectoryImport.run
+    cleanup: None or a directory removed when the job finishes, the upload directory of the file
+    version: bumped by every change, stream() waits for it to change
+
+    """
+    kinds = ('excel_database', 'excel_table', 'excel_rows', 'csv', 'json', 'directory')
+
+    def __init__(self, kind, path, database_name=None, table_name=None, options=None, resume=True, cleanup=None):
+        if kind not in self.kinds:
+            raise TypeError('不支持的导入类型%s！' % kind)
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.path = path
+        self.database = database_name
+        self.table = table_name
+        self.options = options or {}
+        self.resume = resume
+        self.file_hash = None
+        self.state = 'queued'
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.rows_failed = 0
+        self.rows_skipped = 0
+        self.rows_updated = 0
+        self.rows_unchanged = 0
+        self.bytes_total = None
+        self.bytes_read = None
+        self.errors = []
+        self.result = None
+        self.cleanup = cleanup
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.future = None
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def _touch(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def progress(self, parsed=0, inserted=0, failed=0, skipped=0, updated=0, unchanged=0):
+        """ FileImportTool.progress of the job, raises ImportCancelled once the job is cancelled """
+        self.rows_parsed += parsed
+        self.rows_inserted += inserted
+        self.rows_failed += failed
+        self.rows_skipped += skipped
+        self.rows_updated += updated
+        self.rows_unchanged += unchanged
+        self._touch()
+        if self.cancel_requested:
+            raise ImportCancelled()
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.finished_at = time.time()
+        if error is not None:
+            self.errors.append(error)
+        if self.cleanup is not None:
+            shutil.rmtree(self.cleanup, ignore_errors=True)
+        self._touch()
+
+    def wait(self, version, timeout):
+        """ block until the job changes after version, returns the current version """
+        with self._changed:
+            if self.version == version and self.finished_at is None:
+                self._changed.wait(timeout)
+            return self.version
+
+    def snapshot(self):
+        """ Returns the state of the job as a dictionary
+
+        rows_per_second is measured since the job started, eta_seconds extrapolates the bytes of the file read
+        so far to its size, it is None before the first bytes are read and for a 'directory' job
+
+        """
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at is not None else 0
+        done = self.rows_inserted + self.rows_failed + self.rows_skipped + self.rows_updated + self.rows_unchanged
+        rate = done / elapsed if elapsed > 0 else 0.0
+        bytes_read = self.bytes_read() if self.bytes_read is not None else None
+        eta = None
+        if self.finished_at is None and bytes_read and self.bytes_total and elapsed > 0:
+            eta = round(elapsed * max(self.bytes_total - bytes_read, 0) / bytes_read, 1)
+        return {'id': self.id, 'kind': self.kind, 'file': self.path, 'database': self.database,
+                'table': self.table, 'state': self.state, 'resume': self.resume, 'file_hash': self.file_hash,
+                'rows_parsed': self.rows_parsed, 'rows_inserted': self.rows_inserted,
+                'rows_failed': self.rows_failed, 'rows_skipped': self.rows_skipped,
+                'rows_updated': self.rows_updated, 'rows_unchanged': self.rows_unchanged,
+                'bytes_read': bytes_read, 'bytes_total': self.bytes_total,
+                'rows_per_second': round(rate, 1), 'eta_seconds': eta, 'errors': list(self.errors),
+                'result': self.result,
+                'submitted_at': self.submitted_at, 'started_at': self.started_at, 'finished_at': self.finished_at}
+
+
+class ImportQueue:
+    """ Run ImportJob in a worker pool with at most max_workers imports at the same time
+
+    The cap keeps imports from taking every connection and CPU needed by interactive queries,
+    further jobs wait in the queue in the order they were submitted
+
+    Attributions:
+    max_workers: the number of imports running at the same time
+    keep_finished: the number of finished jobs remembered for the clients
+    _jobs: jobs keyed by id in the order they were submitted
+
+    """
+
+    def __init__(self, max_workers=2, keep_finished=100):
+        self.max_workers = max_workers
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, config, kind, path, database_name=None, table_name=None, options=None, resume=True,
+               cleanup=None):
+        """ Interface for queueing an import
+
+        Parameters
+        ----------
+        config: dict
+            the connection config of DBConnector.init_config used by the job
+        kind: String
+            one of ImportJob.kinds
+        path: String
+            path of the uploaded file
+        database_name: String
+            target database, not used by 'excel_database' which names the database after the file
+        table_name: String
+            target table of 'excel_rows', 'csv' and 'json'
+        options: dict
+            key_number, bulk and indexes of 'excel_database' and 'excel_table', sheet_seq of 'excel_rows',
+            processes and ordered of 'csv', mode and skip_unchanged of every kind,
+            the arguments of DirectoryImport of 'directory', whose database_name is the default database of its rules
+        resume: Boolean
+            continue an earlier import of the same file which did not finish, refer to ImportCheckpoints
+        cleanup: String
+            a directory removed with everything in it when the job finishes, whatever its state
+
+        Returns
+        -------
+        job: ImportJob
+
+        """
+        job = ImportJob(kind, path, database_name, table_name, options, resume, cleanup)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished()
+        job.future = self._executor.submit(self._run, dict(config), job)
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self, config, job):
+        if job.cancel_requested:
+            job.finish('cancelled')
+            return
+        job.state = 'running'
+        job.started_at = time.time()
+        job._touch()
+        FileImportTool.init_config(config)
+        if job.kind == 'directory':
+            self._run_directory(job)
+            return
+        tool = FileImportTool()
+        tool.progress = job.progress
+        job.bytes_read = tool.bytes_read
+        tool.bulk = job.options.get('bulk', False)
+        tool.mode = job.options.get('mode', 'insert')
+        tool.skip_unchanged = job.options.get('skip_unchanged', False)
+        try:
+            job.file_hash = tool.enable_checkpoints(checkpoints(), job.path)
+            if not job.resume:
+                tool.checkpoints.finish(job.file_hash)
+            job.bytes_total = os.path.getsize(job.path)
+            tool.connect_db()
+            if job.kind == 'excel_database':
+                tool.deal_excel_1(job.path, job.options.get('key_number', 0), job.options.get('indexes'))
+            elif job.kind == 'excel_table':
+                tool.deal_excel_2(job.path, job.database, job.options.get('key_number', 0),
+                                  job.options.get('indexes'))
+            elif job.kind == 'excel_rows':
+                tool.deal_excel_3(job.path, job.database, job.table, job.options.get('sheet_seq', 0))
+            elif job.kind == 'json':
+                tool.deal_json(job.path, job.database, job.table)
+            else:
+                tool.deal_csv(job.path, job.database, job.table, job.options.get('processes', 1),
+                              job.options.get('ordered', True))
+        except ImportCancelled:
+            job.finish('cancelled')
+        except Exception as error_info:
+            job.finish('failed', '%s: %s' % (type(error_info).__name__, error_info))
+        else:
+            if job.rows_failed:
+                # the checkpoints are kept, submitting the file again retries only the failed batches
+                job.errors.append('%d行数据插入失败！' % job.rows_failed)
+            else:
+                tool.checkpoints.finish(job.file_hash)
+            job.finish('done')
+        finally:
+            tool.close_db()
+
+    def _run_directory(self, job):
+        options = dict(job.options)
+        manifest_path = options.pop('manifest_path', None)
+        try:
+            directory = DirectoryImport(job.path, database_name=job.database, store=checkpoints(),
+                                        progress=job.progress, **options)
+            job.result = directory.run(manifest_path)
+        except Exception as error_info:
+            job.finish('failed', '%s: %s' % (type(error_info).__name__, error_info))
+            return
+        if job.cancel_requested:
+            job.finish('cancelled')
+            return
+        for entry in job.result['files']:
+            if entry['state'] == 'failed':
+                job.errors.append('%s: %s' % (entry['file'], entry['error']))
+        job.finish('done')
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """ Returns the snapshots of all remembered jobs, the latest first """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.snapshot() for job in reversed(jobs)]
+
+    def cancel(self, job_id):
+        """ Interface for cancelling a job
+
+        A queued job never starts, a running job stops after its current batch,
+        batches committed before are kept
+
+        Returns
+        -------
+        job: ImportJob or None if there is no such job
+
+        """
+        job = self.get(job_id)
+        if job is None or job.finished_at is not None:
+            return job
+        job.cancel_requested = True
+        if job.future is not None and job.future.cancel():
+            job.finish('cancelled')
+        return job
+
+    def stream(self, job_id, heartbeat=15):
+        """ generator of the Server-Sent Events of a job, a 'progress' event for every change, ends with the job """
+        job = self.get(job_id)
+        if job is None:
+            return
+        version = -1
+        while True:
+            current = job.wait(version, heartbeat)
+            if current == version:
+                yield ': ping\n\n'
+                continue
+            version = current
+            snapshot = job.snapshot()
+            yield 'event: progress\ndata: %s\n\n' % json.dumps(snapshot, ensure_ascii=False)
+            if snapshot['finished_at'] is not None:
+                break
+
+    def job_stats(self):
+        """ collector of the import jobs for metrics.REGISTRY """
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+        return [('dmp_import_jobs', 'gauge', 'Remembered import jobs by state.',
+                 [({'state': state}, states.count(state))
+                  for state in ('queued', 'running', 'done', 'failed', 'cancelled')])]
+
+
+IMPORTS = ImportQueue()
+metrics.REGISTRY.register_collector(IMPORTS.job_stats)
@@ -0,0 +1,194 @@
+"""
+Interface for inserting the rows of a file through a pipeline of threads
+    Reading, converting and writing overlap, linked by bounded queues
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import queue
+import threading
+from dbconn import ConnectionPool
+
+
+_done = object()
+
+
+class ImportPipeline:
+    """ Insert rows read from a file with a reader, a converter and several writer stages
+
+    reader (the calling thread): cuts the raw rows into chunks of batch_size rows
+    converter (one thread): turns every raw row into a dictionary of column values, numbers the batches
+                            and drops the batches committed by an earlier import of the same file
+    writers (writers threads): insert and commit the batches, each on a connection of a ConnectionPool
+
+    Every queue holds at most queue_size chunks, a stage faster than the next one blocks on it,
+    so memory stays bounded and the throughput approaches the one of the slowest stage
+    The first error of any stage stops all stages and is raised by run()
+
+    Attributions:
+    tool: the FileImportTool which runs the import, it reports the progress
+    writers: the number of writer threads and pooled connections
+    queue_size: the number of chunks buffered between two stages
+    setup: statements run on the connection of every writer before its first batch, e.g. session variables
+    teardown: statements run on the connection of every writer after its last batch, before it is pooled again
+    parsed, inserted: the number of rows read and inserted
+
+    """
+
+    def __init__(self, tool, database_name, table_name, writers=2, queue_size=4, setup=(), teardown=()):
+        self.tool = tool
+        self.database = database_name
+        self.table = table_name
+        self.writers = max(writers, 1)
+        self.queue_size = queue_size
+        self.setup = list(setup)
+        self.teardown = list(teardown)
+        self.parsed = 0
+        self.inserted = 0
+        self._raw = queue.Queue(maxsize=queue_size)
+        self._batches = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _put(self, q, item):
+        """ put with backpressure, returns False if the pipeline stopped meanwhile """
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _done
+
+    def report(self, **counts):
+        """ report progress of any stage through the tool, serialized """
+        with self._lock:
+            self.tool._report(**counts)
+
+    def run(self, rows, convert):
+        """ Interface for inserting rows
+
+        Parameters
+        ----------
+        rows: iterable
+            the raw rows of the file without its header, read lazily
+        convert: callable
+            convert(raw row) -> dictionary of column values, raise to stop the import,
+            if it has a convert_batch method, like columnar.ColumnConverter, whole chunks are converted by it
+
+        Returns
+        -------
+        inserted: int
+            the number of rows inserted
+
+        """
+        threads = [threading.Thread(target=self._convert_stage, args=(convert,), name='import-convert')]
+        threads += [threading.Thread(target=self._write_stage, name='import-write-%d' % i)
+                    for i in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        try:
+            chunk = []
+            for row in rows:
+                if self._stop.is_set():
+                    break
+                chunk.append(row)
+                if len(chunk) >= self.tool.batch_size:
+                    self.parsed += len(chunk)
+                    self.report(parsed=len(chunk))
+                    if not self._put(self._raw, chunk):
+                        break
+                    chunk = []
+            if chunk and not self._stop.is_set():
+                self.parsed += len(chunk)
+                self.report(parsed=len(chunk))
+                self._put(self._raw, chunk)
+        except Exception as error_info:
+            self._fail(error_info)
+        finally:
+            self._put(self._raw, _done)
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.inserted
+
+    def _convert_stage(self, convert):
+        tool = self.tool
+        recorded = {}
+        if tool.checkpoints is not None and tool.source_hash is not None:
+            recorded = tool.checkpoints.batches(tool.source_hash, self.database, self.table, tool.batch_size)
+        convert_batch = getattr(convert, 'convert_batch', None)
+        index = 0
+        try:
+            while True:
+                chunk = self._get(self._raw)
+                if chunk is _done:
+                    break
+                batch = convert_batch(chunk) if convert_batch is not None else [convert(row) for row in chunk]
+                if recorded.get(index):
+                    # committed by an earlier import of the same file
+                    self.report(skipped=len(batch))
+                elif not self._put(self._batches, (index, batch, index in recorded)):
+                    break
+                index = index + 1
+        except Exception as error_info:
+            self._fail(error_info)
+        finally:
+            for _ in range(self.writers):
+                self._put(self._batches, _done)
+
+    def _write_stage(self):
+        tool = self.tool
+        pool = ConnectionPool.get(dict(tool._config, database=tool.database), max_size=self.writers)
+        try:
+            connection = pool.acquire()
+        except Exception as error_info:
+            self._fail(error_info)
+            return
+        writer = type(tool)()
+        writer.database = tool.database
+        writer.batch_size = tool.batch_size
+        writer.checkpoints = tool.checkpoints
+        writer.source_hash = tool.source_hash
+        writer.bulk = tool.bulk
+        writer.mode = tool.mode
+        writer._upsert = tool._upsert
+        writer.progress = self.report
+        writer.attach_connection(connection)
+        try:
+            for sql in self.setup:
+                writer.execute_sql(sql)
+            while True:
+                item = self._get(self._batches)
+                if item is _done:
+                    break
+                index, batch, verify = item
+                count = writer._write_batch(index, batch, self.database, self.table, verify)
+                with self._lock:
+                    self.inserted += count
+        except Exception as error_info:
+            self._fail(error_info)
+        finally:
+            try:
+                for sql in self.teardown:
+                    writer.execute_sql(sql)
+            except Exception as error_info:
+                # never give a connection with changed session variables back to the pool
+                print('Import Pipeline Error: 连接的会话变量无法恢复！', error_info)
+                connection.close()
+            writer.detach_connection()
+            pool.release(connection, broken=not connection.open)
@@ -0,0 +1,141 @@
+"""
+Interface for the checkpoints of file imports
+    Committed batches are recorded in a local SQLite file, an interrupted import resumes after them
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """ Returns the sha256 of the content of a file, the identity of an import source """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImportCheckpoints:
+    """ Record which batches of an import have been committed
+
+    An import is identified by the hash of its file, the target database and table and the batch size,
+    batch i always holds the same rows of the same file, so it is inserted at most once:
+    begin() is recorded before a batch is committed and commit() after,
+    a batch begun but not committed may or may not be in the table and has to be verified by the importer
+    finish() forgets the batches of an import, importing the same file again then inserts it again
+    record_file() remembers a file imported completely, a directory import skips it afterwards
+
+    Attributions:
+    path: the SQLite file of the store
+    _local: a SQLite connection per thread
+
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS import_batch ('
+        ' file_hash TEXT NOT NULL, database_name TEXT NOT NULL, table_name TEXT NOT NULL,'
+        ' batch_size INTEGER NOT NULL, batch_index INTEGER NOT NULL, rows INTEGER NOT NULL,'
+        ' committed INTEGER NOT NULL, updated_at REAL NOT NULL,'
+        ' PRIMARY KEY (file_hash, database_name, table_name, batch_size, batch_index))',
+        'CREATE TABLE IF NOT EXISTS import_file ('
+        ' file_hash TEXT NOT NULL, database_name TEXT NOT NULL, table_name TEXT NOT NULL,'
+        ' path TEXT NOT NULL, rows INTEGER NOT NULL, imported_at REAL NOT NULL,'
+        ' PRIMARY KEY (file_hash, database_name, table_name))',
+    )
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_state.sqlite3')
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for sql in self._schema:
+                conn.execute(sql)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def batches(self, file_hash, database_name, table_name, batch_size):
+        """ Returns a dictionary of the recorded batches of an import, {batch index: committed} """
+        rows = self._connection().execute(
+            'SELECT batch_index, committed FROM import_batch '
+            'WHERE file_hash = ? AND database_name = ? AND table_name = ? AND batch_size = ?',
+            (file_hash, database_name, table_name, batch_size)).fetchall()
+        return dict((index, bool(committed)) for index, committed in rows)
+
+    def _record(self, file_hash, database_name, table_name, batch_size, batch_index, rows, committed):
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO import_batch VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (file_hash, database_name, table_name, batch_size, batch_index, rows,
+                          int(committed), time.time()))
+
+    def begin(self, file_hash, database_name, table_name, batch_size, batch_index, rows):
+        self._record(file_hash, database_name, table_name, batch_size, batch_index, rows, False)
+
+    def commit(self, file_hash, database_name, table_name, batch_size, batch_index, rows):
+        self._record(file_hash, database_name, table_name, batch_size, batch_index, rows, True)
+
+    def finish(self, file_hash, database_name=None, table_name=None):
+        """ forget the batches of a completed import, of every table of the file if table_name is None """
+        sql = 'DELETE FROM import_batch WHERE file_hash = ?'
+        args = [file_hash]
+        if database_name is not None:
+            sql += ' AND database_name = ?'
+            args.append(database_name)
+        if table_name is not None:
+            sql += ' AND table_name = ?'
+            args.append(table_name)
+        with self._connection() as conn:
+            conn.execute(sql, args)
+
+    def record_file(self, file_hash, database_name, table_name, path, rows):
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO import_file VALUES (?, ?, ?, ?, ?, ?)',
+                         (file_hash, database_name, table_name, path, rows, time.time()))
+
+    def imported_file(self, file_hash, database_name, table_name):
+        """ Returns the record of a file already imported into a table, None if it was not """
+        row = self._connection().execute(
+            'SELECT path, rows, imported_at FROM import_file '
+            'WHERE file_hash = ? AND database_name = ? AND table_name = ?',
+            (file_hash, database_name, table_name)).fetchone()
+        if row is None:
+            return None
+        return {'path': row[0], 'rows': row[1], 'imported_at': row[2]}
+
+    def unfinished(self):
+        """ Interface for listing the imports which can be resumed
+
+        Returns
+        -------
+        imports: list
+            [{"file_hash": "...", "database": "test", "table": "table1", "batch_size": 1000,
+              "batches": 12, "rows": 12000, "updated_at": 1616000000.0}, ...]
+
+        """
+        rows = self._connection().execute(
+            'SELECT file_hash, database_name, table_name, batch_size, SUM(committed), '
+            'SUM(CASE WHEN committed THEN rows ELSE 0 END), MAX(updated_at) FROM import_batch '
+            'GROUP BY file_hash, database_name, table_name, batch_size ORDER BY MAX(updated_at) DESC').fetchall()
+        return [{'file_hash': row[0], 'database': row[1], 'table': row[2], 'batch_size': row[3],
+                 'batches': row[4], 'rows': row[5], 'updated_at': row[6]} for row in rows]
+
+
+CHECKPOINTS = None
+_checkpoints_lock = threading.Lock()
+
+
+def checkpoints():
+    """ Returns the store of the process, created on first use """
+    global CHECKPOINTS
+    with _checkpoints_lock:
+        if CHECKPOINTS is None:
+            CHECKPOINTS = ImportCheckpoints()
+    return CHECKPOINTS
@@ -0,0 +1,184 @@
+"""
+Interface for reading the rows of a large JSON file
+    The file is decoded one row at a time from a buffer of chunks, memory is bounded by the largest row
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import json
+import re
+
+
+EXTENSIONS = ('.json', '.ndjson', '.jsonl')
+_WHITESPACE = ' \t\n\r'
+_DELIMITER = re.compile(r'[\s,:\]}]')
+
+
+class _Buffer:
+    """ The unread text of a stream, read in chunks and decoded a value at a time
+
+    Attributions:
+    stream: a text stream
+    chunk_size: the number of characters read at once
+    max_value: the number of characters a single value may take, a longer value is taken as a broken file
+    _text: the text read and not yet dropped
+    _pos: the position of the next character in _text
+
+    """
+
+    def __init__(self, stream, chunk_size=1 << 20, max_value=64 << 20):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_value = max_value
+        self._text = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _read(self):
+        """ read another chunk, returns False at the end of the stream """
+        if self._eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._pos > len(self._text) // 2:
+            self._text = self._text[self._pos:]
+            self._pos = 0
+        self._text += chunk
+        return True
+
+    def peek(self):
+        """ Returns the next character which is not whitespace without consuming it, '' at the end of the stream """
+        while True:
+            while self._pos < len(self._text) and self._text[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._read():
+                return ''
+
+    def expect(self, characters):
+        """ consume the next character which is not whitespace, it must be one of characters """
+        character = self.peek()
+        if not character or character not in characters:
+            raise ReferenceError('JSON文件格式错误：位置%d处应为%s！' % (self._pos, ' '.join(characters)))
+        self._pos += 1
+        return character
+
+    def decode(self):
+        """ Returns the next value, more chunks are read while the value is incomplete """
+        if self.peek() not in '{["':
+            # a number or literal is decoded only when its end was read, '12' may continue as '12.5'
+            while not _DELIMITER.search(self._text, self._pos) and self._read():
+                pass
+        while True:
+            try:
+                value, self._pos = self._decoder.raw_decode(self._text, self._pos)
+                return value
+            except json.JSONDecodeError as error_info:
+                if len(self._text) - self._pos > self.max_value or not self._read():
+                    raise ReferenceError('JSON文件格式错误：%s' % error_info)
+
+
+def iter_objects(stream, chunk_size=1 << 20):
+    """ Interface for reading the rows of a JSON file as dictionaries, one at a time
+
+    Parameters
+    ----------
+    stream: text stream
+        the content of the file, read in chunks of chunk_size characters
+    chunk_size: int
+        the number of characters read at once
+
+    Returns
+    -------
+    rows: generator
+        the dictionary of every row, in the order of the file
+
+    Notes
+    -----
+    Three layouts are read, told apart by their first characters:
+        NDJSON, one object per line or separated by any whitespace: {"a": 1} {"a": 2}
+        an array of objects: [{"a": 1}, {"a": 2}]
+        an object of objects by row number, like document <Data.json>: {"0": {"a": 1}, "1": {"a": 2}}
+    a file whose first value is an object is taken as the third layout if the first member of it is an object
+    Raise ReferenceError if the file is not one of them or a row is not an object
+
+    """
+    buffer = _Buffer(stream, chunk_size)
+    first = buffer.peek()
+    if first == '[':
+        buffer.expect('[')
+        if buffer.peek() == ']':
+            buffer.expect(']')
+        else:
+            while True:
+                yield _row(buffer.decode())
+                if buffer.expect(',]') == ']':
+                    break
+    elif first == '{':
+        # {"0": {...}} holds rows, {"a": 1} is the first row of NDJSON
+        buffer.expect('{')
+        if buffer.peek() == '}':
+            buffer.expect('}')
+        else:
+            yield from _object_rows(buffer)
+    elif first:
+        raise ReferenceError('JSON文件格式错误：应为对象或数组！')
+    if buffer.peek():
+        raise ReferenceError('JSON文件格式错误：数据之后还有多余内容！')
+
+
+def _object_rows(buffer):
+    """ the rows of a file starting with an object, after its '{' """
+    key = buffer.decode()
+    buffer.expect(':')
+    value = buffer.decode()
+    if isinstance(value, dict):
+        while True:
+            yield value
+            if buffer.expect(',}') == '}':
+                break
+            buffer.decode()
+            buffer.expect(':')
+            value = _row(buffer.decode())
+    else:
+        row = {key: value}
+        while buffer.expect(',}') == ',':
+            key = buffer.decode()
+            buffer.expect(':')
+            row[key] = buffer.decode()
+        yield row
+        while buffer.peek():
+            yield _row(buffer.decode())
+
+
+def _row(value):
+    if not isinstance(value, dict):
+        raise ReferenceError('JSON文件格式错误：每行数据应为一个对象！')
+    return value
+
+
+def iter_rows(objects):
+    """ generator of the rows of insert_value_row from dictionaries, the names first
+
+    The keys of the first dictionary are the names, every following dictionary must have the same keys,
+    true and false become 1 and 0, nested objects and arrays are kept as JSON text
+
+    """
+    names = None
+    for obj in objects:
+        if names is None:
+            names = list(obj)
+            yield names
+        elif len(obj) != len(names) or any(name not in obj for name in names):
+            raise ReferenceError('JSON数据的键与第一行不一致：%s' % ', '.join(sorted(obj)))
+        yield [_cell(obj[name]) for name in names]
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return int(value)
+    return value
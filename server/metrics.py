@@ -0,0 +1,255 @@
+"""
+Interface for collecting runtime metrics of the server in Prometheus text format
+    Counters, gauges and histograms are kept in process memory
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """ Base class of all metrics kept by MetricsRegistry
+
+    Attributions:
+    name: name of the metric exposed to Prometheus
+    documentation: help text of the metric
+    label_names: a tuple of label names, every sample must give values for all of them
+
+    """
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError('指标%s需要标签%s！' % (self.name, ', '.join(self.label_names)))
+        return tuple(str(v) for v in labels)
+
+    def samples(self):
+        """ a list of (suffix, label values, extra label, value) tuples """
+        with self._lock:
+            return [('', key, None, value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """ a monotonically increasing value """
+    metric_type = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """ a value which can go up and down """
+    metric_type = 'gauge'
+
+    def inc(self, amount=1, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+    def set(self, value, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """ cumulative histogram of observed values with fixed upper bounds """
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, number) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    result.append(('_bucket', key, ('le', _format_value(bound)), cumulative))
+                result.append(('_sum', key, None, total))
+                result.append(('_count', key, None, number))
+        return result
+
+
+class MetricsRegistry:
+    """ Hold all metrics of the process and render them as Prometheus text
+
+    Layers which keep their own statistics (connections, caches) can register a collector,
+    a callable returning a list of (name, type, help, [(labels_dict, value)]) tuples,
+    which is evaluated every time the metrics are rendered
+
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """ Render every metric in the Prometheus text exposition format (version 0.0.4)
+
+        Returns
+        -------
+        text: String
+            the exposition text, ending with a newline
+
+        """
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.metric_type))
+            for suffix, key, extra, value in metric.samples():
+                lines.append('%s%s%s %s' % (metric.name, suffix, _format_labels(metric.label_names, key, extra),
+                                            _format_value(value)))
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as error_info:
+                print('Metrics Collector Error:', error_info)
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append('# HELP %s %s' % (name, documentation))
+                lines.append('# TYPE %s %s' % (name, metric_type))
+                for labels, value in samples:
+                    lines.append('%s%s %s' % (name, _format_labels(list(labels.keys()), list(labels.values())),
+                                              _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram('dmp_http_request_duration_seconds',
+                                     'Latency of HTTP requests by route.', ('route', 'method', 'status'))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge('dmp_http_requests_in_flight', 'HTTP requests currently being served.')
+RESPONSE_SIZE = REGISTRY.histogram('dmp_http_response_size_bytes', 'Size of HTTP response bodies by route.',
+                                   ('route', 'method'), SIZE_BUCKETS)
+REQUEST_DB_TIME = REGISTRY.histogram('dmp_http_request_db_seconds',
+                                     'Time spent executing SQL per HTTP request by route.', ('route',))
+REQUEST_SERIALIZE_TIME = REGISTRY.histogram('dmp_http_request_serialize_seconds',
+                                            'Time spent serializing response data per HTTP request by route.',
+                                            ('route',))
+SQL_LATENCY = REGISTRY.histogram('dmp_sql_duration_seconds', 'Latency of single SQL statements.', ('statement',))
+SQL_ERRORS = REGISTRY.counter('dmp_sql_errors_total', 'SQL statements raising an error.', ('statement',))
+DB_CONNECTIONS_OPENED = REGISTRY.counter('dmp_db_connections_opened_total', 'MySQL connections opened.')
+DB_CONNECTIONS_OPEN = REGISTRY.gauge('dmp_db_connections_open', 'MySQL connections currently open.')
+
+_request_state = threading.local()
+
+
+def begin_request():
+    """ reset the per-request timers of the current thread """
+    _request_state.db_time = 0.0
+    _request_state.serialize_time = 0.0
+
+
+def request_times():
+    """ Returns (db seconds, serialization seconds) accumulated by the current thread's request """
+    return getattr(_request_state, 'db_time', 0.0), getattr(_request_state, 'serialize_time', 0.0)
+
+
+def statement_kind(sql):
+    """ Returns the leading keyword of a sql statement in upper case, used as low-cardinality label """
+    head = sql.lstrip().split(None, 1)
+    return head[0].upper() if head else 'EMPTY'
+
+
+def record_sql(sql, seconds, failed=False):
+    """ record one executed sql statement and charge its time to the current request """
+    kind = statement_kind(sql)
+    SQL_LATENCY.observe(seconds, (kind,))
+    if failed:
+        SQL_ERRORS.inc(labels=(kind,))
+    _request_state.db_time = getattr(_request_state, 'db_time', 0.0) + seconds
+
+
+class serialize_timer:
+    """ context manager charging the enclosed block to the serialization time of the current request
+
+    Examples
+    --------
+    >>> with serialize_timer():
+    ...     response = jsonify(ret)
+
+    """
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self._start
+        _request_state.serialize_time = getattr(_request_state, 'serialize_time', 0.0) + elapsed
+        return False
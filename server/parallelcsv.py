@@ -0,0 +1,138 @@
+"""
+Interface for parsing a large csv file in parallel
+    The file is memory-mapped, cut at record boundaries and the ranges are parsed in a process pool
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import collections
+import csv
+import io
+import locale
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+_SCAN_BYTES = 16 << 20
+
+
+def _quotes(mm, start, end):
+    """ Returns the number of double quotes in mm[start:end], scanned in slices to bound memory """
+    count = 0
+    for i in range(start, end, _SCAN_BYTES):
+        count += mm[i:min(i + _SCAN_BYTES, end)].count(b'"')
+    return count
+
+
+def _next_boundary(mm, begin, target):
+    """ Returns the first record boundary at or after target, begin must be a record boundary
+
+    A newline ends a record only outside a quoted field, which is where an even number of quotes
+    was seen since begin, escaped quotes ("") count twice and keep the parity
+
+    """
+    size = len(mm)
+    if target >= size:
+        return size
+    parity = _quotes(mm, begin, target) % 2
+    end = target
+    while True:
+        newline = mm.find(b'\n', end)
+        if newline < 0:
+            return size
+        parity = (parity + _quotes(mm, end, newline)) % 2
+        end = newline + 1
+        if parity == 0:
+            return end
+
+
+def split_ranges(path, chunk_bytes=32 << 20):
+    """ Interface for cutting a csv file into byte ranges of whole records
+
+    Parameters
+    ----------
+    path: String
+        path of csv file <.csv>
+    chunk_bytes: int
+        the approximate size of a range
+
+    Returns
+    -------
+    header: tuple
+        the byte range (start, end) of the first record, the column names
+    ranges: list
+        the byte ranges (start, end) of the following records, in the order of the file
+
+    """
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return (0, 0), []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            header_end = _next_boundary(mm, 0, 0)
+            ranges = []
+            begin = header_end
+            while begin < size:
+                end = _next_boundary(mm, begin, begin + chunk_bytes)
+                ranges.append((begin, end))
+                begin = end
+    return (0, header_end), ranges
+
+
+def parse_range(path, start, end, encoding=None):
+    """ Returns the records in a byte range of a csv file as lists of strings, spaces removed like deal_csv """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[start:end].decode(encoding or locale.getpreferredencoding(False))
+    return [[v.replace(' ', '') for v in row] for row in csv.reader(io.StringIO(text, newline=''))]
+
+
+def parse_parallel(path, ranges, processes=None, ordered=True, encoding=None, parsed=None):
+    """ Interface for parsing the ranges of a csv file in a process pool
+
+    At most two ranges per process are parsed or waiting to be consumed, so memory stays bounded
+    while the consumer, usually ImportPipeline, inserts the rows
+
+    Parameters
+    ----------
+    path: String
+        path of csv file <.csv>
+    ranges: list
+        byte ranges returned by split_ranges
+    processes: int
+        the number of parser processes, the number of cores by default
+    ordered: Boolean
+        yield the rows in the order of the file, otherwise in the order the ranges are parsed
+    parsed: callable
+        None or called as parsed(start, end) once the rows of a range were all consumed, the progress of the file
+
+    Returns
+    -------
+    rows: generator
+        the records of the ranges as lists of strings
+
+    """
+    processes = processes or os.cpu_count() or 1
+    pending = collections.deque(ranges)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        window = 2 * processes
+        running = collections.deque()
+        try:
+            while pending or running:
+                while pending and len(running) < window:
+                    start, end = pending.popleft()
+                    future = executor.submit(parse_range, path, start, end, encoding)
+                    future.range = start, end
+                    running.append(future)
+                if ordered:
+                    future = running.popleft()
+                else:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    future = done.pop()
+                    running.remove(future)
+                for row in future.result():
+                    yield row
+                if parsed is not None:
+                    parsed(*future.range)
+        finally:
+            for future in running:
+                future.cancel()
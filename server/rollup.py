@@ -0,0 +1,353 @@
+"""
+Interface for pre-aggregated count tables of log tables
+    Rollups are kept up to date by the commits of SqlCreator and answer the grouped counts of the charts
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import hashlib
+import threading
+from collections import Counter
+import pymysql
+from catalog import SchemaCatalog
+from sqlcreator import SqlCreator, quote_identifier
+from changeset import sql_literal
+import metrics
+
+
+# the time buckets and dimensions of the log tables, refer to log_labels in src/renderer/assets/api.js
+TIME_BUCKETS = ('year', 'month', 'day', 'hour', 'fmonth', 'fday', 'fhour')
+DIMENSIONS = ('stype', 'device', 'exception', 'system')
+
+_comment_prefix = 'rollup:'
+
+
+class RollupManager(SchemaCatalog):
+    """ Maintain count tables grouped by time buckets and dimensions, subclass of SchemaCatalog
+
+    A rollup of a table is a table `_rollup_<hash>` with the grouped columns and row_count,
+    its COMMENT 'rollup:<table>:<column>,<column>' describes it, so rollups are found again after a restart
+    Every time bucket of the log tables is determined by fhour, a rollup holding all of them together with
+    one dimension is no bigger than the one at hourly grain, the default rollups are one per dimension
+
+    Rows inserted by commit_all (FileImportTool included) and deleted rows whose values are known are
+    added to the rollups as count deltas, without reading the table
+    Any other change of a grouped column marks the rollup stale, it is rebuilt before it is read again
+
+    Attributions:
+    compact_rows: the number of appended delta rows after which a rollup is regrouped
+    _registry: rollups of loaded databases, keyed by (ip, port, database),
+               value is {"config": dict, "rollups": {rollup name: state}, "writer": RollupManager},
+               the writer is the connection the deltas are appended on
+    _unloaded: (database, table) changed by commits before the rollups of their database were loaded
+
+    Notes
+    -----
+    Changes made by other clients are not seen, rebuild the rollups of a table after changing it directly.
+
+    """
+    compact_rows = 10000
+    _registry = {}
+    _unloaded = set()
+    _rollup_lock = threading.RLock()
+
+    @staticmethod
+    def rollup_name(table_name, columns):
+        digest = hashlib.sha1(('%s:%s' % (table_name, ','.join(columns))).encode('utf8')).hexdigest()[:12]
+        return '_rollup_' + digest
+
+    def rollups(self, database_name, refresh=False):
+        """ Interface for reading the rollups of a database
+
+        Returns
+        -------
+        rollups: dict
+            keyed by rollup name: {"table": "log", "columns": ["year", ..., "stype"], "stale": False, "appended": 0}
+
+        """
+        key = (self.ip, self.port, database_name)
+        with self._rollup_lock:
+            entry = self._registry.get(key)
+            if entry is not None and not refresh:
+                return entry['rollups']
+            found = {}
+            for name, table in self.schema(database_name, refresh).items():
+                comment = table['comment'] or ''
+                if not name.startswith('_rollup_') or not comment.startswith(_comment_prefix):
+                    continue
+                _, source, columns = comment.split(':', 2)
+                if name != self.rollup_name(source, columns.split(',')):
+                    # the _new and _old tables of a regroup in progress carry the same comment
+                    continue
+                previous = entry['rollups'].get(name) if entry is not None else None
+                found[name] = {'table': source, 'columns': columns.split(','),
+                               'stale': previous['stale'] if previous else False,
+                               'appended': previous['appended'] if previous else 0}
+            for state in found.values():
+                if (database_name, state['table']) in self._unloaded or (database_name, None) in self._unloaded:
+                    state['stale'] = True
+            self._unloaded.difference_update(
+                [item for item in self._unloaded if item[0] == database_name])
+            self._registry[key] = {'config': dict(self._config, database=database_name), 'rollups': found}
+            if entry is not None and 'writer' in entry:
+                self._registry[key]['writer'] = entry['writer']
+            return found
+
+    def create(self, database_name, table_name, columns=None):
+        """ Interface for creating the rollups of a table and filling them from its rows
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table of above database
+        columns: list
+            a list of column lists, one rollup for each, None creates the default rollups:
+            all time buckets of the table, alone and with each dimension of the table
+
+        Returns
+        -------
+        names: list
+            names of the created rollups, existing rollups are skipped
+
+        """
+        table = self.table(database_name, table_name)
+        if table is None:
+            raise ReferenceError("表'%s.%s'不存在！" % (database_name, table_name))
+        types = dict((column['name'], column['type']) for column in table['columns'])
+        if columns is None:
+            buckets = [name for name in TIME_BUCKETS if name in types]
+            if not buckets:
+                raise ReferenceError("表'%s.%s'没有时间分桶列！" % (database_name, table_name))
+            columns = [buckets] + [buckets + [name] for name in DIMENSIONS if name in types]
+
+        created = []
+        with self._rollup_lock:
+            existing = self.rollups(database_name)
+            for group in columns:
+                for name in group:
+                    if name not in types:
+                        raise ReferenceError("列'%s'不存在！" % name)
+                name = self.rollup_name(table_name, group)
+                if name in existing:
+                    continue
+                fields = ', '.join('%s %s' % (quote_identifier(c), types[c]) for c in group)
+                comment = '%s%s:%s' % (_comment_prefix, table_name, ','.join(group))
+                self.commit_sql('CREATE TABLE %s.%s (%s, row_count BIGINT NOT NULL) COMMENT=%s;' % (
+                    quote_identifier(database_name), quote_identifier(name), fields, sql_literal(comment)))
+                self._fill(database_name, name, table_name, group)
+                created.append(name)
+            self.invalidate(database_name)
+            self.rollups(database_name, refresh=True)
+        return created
+
+    def drop(self, database_name, table_name):
+        """ Interface for dropping all rollups of a table """
+        with self._rollup_lock:
+            names = [name for name, state in self.rollups(database_name).items() if state['table'] == table_name]
+            for name in names:
+                self.commit_sql('DROP TABLE %s.%s;' % (quote_identifier(database_name), quote_identifier(name)))
+            self.invalidate(database_name)
+            self.rollups(database_name, refresh=True)
+        return names
+
+    def _fill(self, database_name, name, table_name, columns):
+        group = ', '.join(quote_identifier(c) for c in columns)
+        self.commit_sql('INSERT INTO %s.%s (%s, row_count) SELECT %s, COUNT(*) FROM %s.%s GROUP BY %s;' % (
+            quote_identifier(database_name), quote_identifier(name), group, group,
+            quote_identifier(database_name), quote_identifier(table_name), group))
+
+    def _regroup(self, database_name, name, source_table, columns):
+        """ replace the content of a rollup by its grouped content, or by the grouped source table """
+        db = quote_identifier(database_name)
+        group = ', '.join(quote_identifier(c) for c in columns)
+        fresh, old = quote_identifier(name + '_new'), quote_identifier(name + '_old')
+        self.commit_sql('DROP TABLE IF EXISTS %s.%s;' % (db, fresh))
+        self.commit_sql('CREATE TABLE %s.%s LIKE %s.%s;' % (db, fresh, db, quote_identifier(name)))
+        if source_table is None:
+            self.commit_sql('INSERT INTO %s.%s (%s, row_count) SELECT %s, SUM(row_count) FROM %s.%s '
+                            'GROUP BY %s HAVING SUM(row_count) <> 0;'
+                            % (db, fresh, group, group, db, quote_identifier(name), group))
+        else:
+            self._fill(database_name, name + '_new', source_table, columns)
+        self.commit_sql('RENAME TABLE %s.%s TO %s.%s, %s.%s TO %s.%s;' % (
+            db, quote_identifier(name), db, old, db, fresh, db, quote_identifier(name)))
+        self.commit_sql('DROP TABLE %s.%s;' % (db, old))
+
+    def rebuild(self, database_name, table_name=None):
+        """ Interface for recomputing the rollups of a table, or of every table of the database if None """
+        with self._rollup_lock:
+            rebuilt = []
+            for name, state in self.rollups(database_name).items():
+                if table_name is None or state['table'] == table_name:
+                    self._regroup(database_name, name, state['table'], state['columns'])
+                    state['stale'], state['appended'] = False, 0
+                    rebuilt.append(name)
+        return rebuilt
+
+    def count(self, database_name, table_name, group_by, filters=None):
+        """ Interface for counting the rows of a table grouped by some columns
+
+        The smallest fresh rollup containing the grouped and filtered columns answers the query,
+        the table itself is grouped if there is none
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table of above database
+        group_by: list
+            names of the grouped columns, e.g. ["fday", "stype"]
+        filters: dict
+            equality conditions on columns, e.g. {"year": 2021}, a list value means IN
+
+        Returns
+        -------
+        result: dict
+            {"source": "_rollup_3f2a...", "rows": [{"fday": "2021-03-14", "stype": "A", "count": 12}, ...]},
+            source is the name of the table which answered
+
+        """
+        filters = filters or {}
+        needed = set(group_by) | set(filters)
+        with self._rollup_lock:
+            candidates = [(len(state['columns']), name, state) for name, state in self.rollups(database_name).items()
+                          if state['table'] == table_name and needed <= set(state['columns'])]
+            candidates.sort(key=lambda item: item[0])
+            if candidates:
+                _, source, state = candidates[0]
+                if state['stale']:
+                    self._regroup(database_name, source, table_name, state['columns'])
+                    state['stale'], state['appended'] = False, 0
+        if candidates:
+            measure = 'SUM(row_count)'
+        else:
+            source, measure = table_name, 'COUNT(*)'
+
+        args = []
+        conditions = []
+        for column, value in filters.items():
+            if isinstance(value, list):
+                conditions.append('%s IN (%s)' % (quote_identifier(column), ', '.join(['%s'] * len(value))))
+                args.extend(value)
+            elif value is None:
+                conditions.append('%s IS NULL' % quote_identifier(column))
+            else:
+                conditions.append('%s = %%s' % quote_identifier(column))
+                args.append(value)
+        group = ', '.join(quote_identifier(c) for c in group_by)
+        sql = 'SELECT %s%s AS count FROM %s.%s' % (group + ', ' if group else '', measure,
+                                                    quote_identifier(database_name), quote_identifier(source))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if group:
+            sql += ' GROUP BY %s ORDER BY %s' % (group, group)
+        rows = self.execute_sql(sql + ';', args or None).fetchall()
+        for row in rows:
+            row['count'] = int(row['count'] or 0)
+        return {'source': source, 'rows': list(rows)}
+
+    @classmethod
+    def on_commit(cls, changes):
+        """ commit listener of SqlCreator, adds the committed rows to the rollups of their table """
+        with cls._rollup_lock:
+            for change in changes:
+                entries = [(key, entry) for key, entry in cls._registry.items() if key[2] == change['database']]
+                if not entries:
+                    cls._unloaded.add((change['database'], change['table']))
+                    continue
+                for key, entry in entries:
+                    deltas = {}
+                    for name, state in entry['rollups'].items():
+                        if change['table'] is not None and state['table'] != change['table']:
+                            continue
+                        delta = cls._deltas(change, state['columns'])
+                        if delta is None:
+                            state['stale'] = True
+                        elif delta:
+                            deltas[name] = delta
+                    if deltas:
+                        cls._apply(entry, deltas)
+
+    @staticmethod
+    def _deltas(change, columns):
+        """ Returns a Counter of count changes per group, None if the change cannot be counted """
+        if change['ddl'] or not change['complete'] or change['table'] is None:
+            return None
+        delta = Counter()
+        for row in change['rows']:
+            values = row.get('values') or {}
+            if row['op'] == 'update':
+                if set(values) & set(columns):
+                    return None
+                continue
+            if not all(column in values for column in columns):
+                return None
+            delta[tuple(values[column] for column in columns)] += 1 if row['op'] == 'insert' else -1
+        return Counter({group: n for group, n in delta.items() if n != 0})
+
+    @classmethod
+    def _apply(cls, entry, deltas):
+        """ append the deltas on the writer connection of the rollups, a rollup which is not updated becomes stale
+
+        The writer is a connection of its own, not one of the ConnectionPool of the committing writers,
+        which are still held while their listeners run
+
+        """
+        try:
+            manager = cls._writer(entry)
+        except Exception as error_info:
+            print("Rollup Error: 无法连接数据库，汇总表已过期！", error_info)
+            for name in deltas:
+                entry['rollups'][name]['stale'] = True
+            return
+        database_name = entry['config']['database']
+        for name, delta in deltas.items():
+            state = entry['rollups'][name]
+            try:
+                fields = ', '.join(quote_identifier(c) for c in state['columns'])
+                values = ', '.join('(' + ', '.join(sql_literal(v) for v in group) + ', %d)' % n
+                                   for group, n in delta.items())
+                manager.commit_sql('INSERT INTO %s.%s (%s, row_count) VALUES %s;' % (
+                    quote_identifier(database_name), quote_identifier(name), fields, values))
+                state['appended'] += len(delta)
+                if state['appended'] >= cls.compact_rows:
+                    manager._regroup(database_name, name, None, state['columns'])
+                    state['appended'] = 0
+            except Exception as error_info:
+                print("Rollup Error: 汇总表'%s'更新失败！" % name, error_info)
+                state['stale'] = True
+                if not isinstance(error_info, pymysql.err.Error) or not manager._conn.open:
+                    manager.close_db()
+                    entry.pop('writer', None)
+                    return
+
+    @classmethod
+    def _writer(cls, entry):
+        """ Returns the RollupManager of the writer connection of an entry, connected on first use """
+        manager = entry.get('writer')
+        if manager is None:
+            config = entry['config']
+            manager = cls.__new__(cls)
+            manager.ip, manager.port, manager.database = config['ip'], config['port'], config['database']
+            manager.username, manager.password = config['username'], config['password']
+            manager.connect_db()
+            entry['writer'] = manager
+        return manager
+
+    @classmethod
+    def rollup_stats(cls):
+        """ collector of the rollups for metrics.REGISTRY """
+        with cls._rollup_lock:
+            states = [state for entry in cls._registry.values() for state in entry['rollups'].values()]
+        return [
+            ('dmp_rollup_tables', 'gauge', 'Rollup tables known by state.',
+             [({'state': 'stale'}, sum(1 for s in states if s['stale'])),
+              ({'state': 'fresh'}, sum(1 for s in states if not s['stale']))]),
+            ('dmp_rollup_appended_rows', 'gauge', 'Delta rows appended to rollups since they were regrouped.',
+             [({}, sum(s['appended'] for s in states))]),
+        ]
+
+
+metrics.REGISTRY.register_collector(RollupManager.rollup_stats)
+SqlCreator.add_commit_listener(RollupManager.on_commit)
@@ -0,0 +1,149 @@
+"""
+Interface for fast row counts of tables
+    Estimates come from information_schema instantly, exact counts are computed in the background
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from catalog import SchemaCatalog
+from sqlcreator import SqlCreator, quote_identifier
+import metrics
+
+
+class RowCounter(SchemaCatalog):
+    """ Return row counts of tables without blocking on COUNT(*), subclass of SchemaCatalog
+
+    count() answers from the cache of exact counts if possible,
+    otherwise it answers with the TABLE_ROWS estimate and schedules an exact COUNT(*) in the background
+    Exact counts are adjusted by the row deltas of SqlCreator.commit_all and dropped when a table is altered
+
+    Attributions:
+    _max_age: seconds an exact count is trusted, rows written by other clients are not seen before it expires
+    _counts: a dictionary of exact counts, keyed by (ip, port, database, table), value is (count, computed time)
+    _generations: bumped whenever a table changes, keyed by (database, table) or (database, None) for a change
+                  of the whole database, a background count started before either of them changed is discarded
+    _pending: keys of tables being counted in the background
+    _executor: thread pool running the background counts
+
+    """
+    _max_age = 300
+    _counts = {}
+    _generations = {}
+    _pending = set()
+    _counts_lock = threading.Lock()
+    _executor = ThreadPoolExecutor(max_workers=2)
+
+    @classmethod
+    def set_max_age(cls, seconds):
+        cls._max_age = seconds
+
+    def _key(self, database_name, table_name):
+        return self.ip, self.port, database_name, table_name
+
+    def count(self, database_name, table_name, wait=False):
+        """ Interface for reading the row count of a table
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table of above database
+        wait: Boolean
+            count exactly before returning if no exact count is cached
+
+        Returns
+        -------
+        count: dict
+            {"count": 1000, "exact": True, "computed_at": 1616000000.0}, "computed_at" is None for estimates
+
+        """
+        key = self._key(database_name, table_name)
+        with self._counts_lock:
+            cached = self._counts.get(key)
+        if cached is not None and time.time() - cached[1] < self._max_age:
+            return {'count': cached[0], 'exact': True, 'computed_at': cached[1]}
+        if wait:
+            return self._count_exact(database_name, table_name)
+
+        self._schedule(database_name, table_name)
+        if cached is not None:
+            return {'count': cached[0], 'exact': False, 'computed_at': cached[1]}
+        table = self.table(database_name, table_name)
+        if table is None:
+            raise ReferenceError("表'%s.%s'不存在！" % (database_name, table_name))
+        return {'count': table['row_estimate'], 'exact': False, 'computed_at': None}
+
+    def _schedule(self, database_name, table_name):
+        key = self._key(database_name, table_name)
+        with self._counts_lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._background_count, dict(self._config), database_name, table_name)
+
+    @classmethod
+    def _background_count(cls, config, database_name, table_name):
+        counter = None
+        try:
+            counter = RowCounter()
+            counter.ip, counter.port = config['ip'], config['port']
+            counter.username, counter.password = config['username'], config['password']
+            counter.database = config['database']
+            counter.connect_db()
+            counter._count_exact(database_name, table_name)
+        except Exception as error_info:
+            print("Row Count Error: 表'%s.%s'计数失败！" % (database_name, table_name), error_info)
+        finally:
+            if counter is not None:
+                counter.close_db()
+            with cls._counts_lock:
+                cls._pending.discard((config['ip'], config['port'], database_name, table_name))
+
+    def _generation(self, database_name, table_name):
+        return (self._generations.get((database_name, table_name), 0),
+                self._generations.get((database_name, None), 0))
+
+    def _count_exact(self, database_name, table_name):
+        key = self._key(database_name, table_name)
+        with self._counts_lock:
+            generation = self._generation(database_name, table_name)
+        sql = 'SELECT COUNT(*) AS total FROM %s.%s;' % (quote_identifier(database_name), quote_identifier(table_name))
+        total = int(self.execute_sql(sql).fetchone()['total'])
+        now = time.time()
+        with self._counts_lock:
+            if self._generation(database_name, table_name) == generation:
+                self._counts[key] = (total, now)
+        return {'count': total, 'exact': True, 'computed_at': now}
+
+    @classmethod
+    def on_commit(cls, changes):
+        """ commit listener of SqlCreator, adjusts cached exact counts by the committed row deltas """
+        with cls._counts_lock:
+            for change in changes:
+                table_key = (change['database'], change['table'])
+                cls._generations[table_key] = cls._generations.get(table_key, 0) + 1
+                for key in list(cls._counts):
+                    if key[2] != change['database'] or (change['table'] is not None and key[3] != change['table']):
+                        continue
+                    if change['ddl']:
+                        del cls._counts[key]
+                    else:
+                        total, computed_at = cls._counts[key]
+                        cls._counts[key] = (total + change['inserted'] - change['deleted'], computed_at)
+
+    @classmethod
+    def cache_stats(cls):
+        """ collector of the row count cache for metrics.REGISTRY """
+        with cls._counts_lock:
+            size = len(cls._counts)
+            pending = len(cls._pending)
+        return [
+            ('dmp_rowcount_cache_entries', 'gauge', 'Tables with a cached exact row count.', [({}, size)]),
+            ('dmp_rowcount_pending', 'gauge', 'Exact row counts running in the background.', [({}, pending)]),
+        ]
+
+
+metrics.REGISTRY.register_collector(RowCounter.cache_stats)
+SqlCreator.add_commit_listener(RowCounter.on_commit)
@@ -6,8 +6,127 @@ Interface for complex CRUD database request
 #    Time: 2021.03.20
 #    for Data Manage Platform(TJU CS2018-3)
 import json
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pymysql
 from dbconn import DBConnector
+from dbconn import ConnectionPool
+from changeset import ChangeSet
+from changeset import sql_literal
+from batching import AdaptiveBatcher
+
+
+_statement_pattern = re.compile(
+    r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM|CREATE\s+TABLE|ALTER\s+TABLE|DROP\s+TABLE|'
+    r'TRUNCATE\s+TABLE|CREATE\s+DATABASE|ALTER\s+DATABASE|DROP\s+DATABASE)\s+`?([\w$]+)`?(?:\.`?([\w$]+)`?)?',
+    re.IGNORECASE)
+
+
+_identifier_pattern = re.compile(r'^[\w$]+$')
+_comparisons = ('=', '!=', '<>', '<', '<=', '>', '>=')
+
+
+def _insert_statement(database_name, table_name, rows):
+    """ Returns the INSERT statement of row changes of the same columns, refer to ChangeSet.compact_rows """
+    name = database_name + '.' + table_name if database_name else table_name
+    columns = list(rows[0]['values'].keys())
+    values_str = ', '.join('(' + ', '.join(sql_literal(row['values'][c]) for c in columns) + ')' for row in rows)
+    return 'INSERT INTO %s(%s) VALUES %s;' % (name, ', '.join(columns), values_str)
+
+
+def ddl_change(database_name, table_name):
+    """ Returns the change of a DDL statement on a table for the commit listeners, refer to add_commit_listener """
+    return {'database': database_name, 'table': table_name, 'inserted': 0, 'updated': 0, 'deleted': 0,
+            'ddl': True, 'complete': False, 'rows': []}
+
+
+def quote_identifier(name):
+    """ quote a database, table or column name with backticks, raise ValueError for an unsafe name """
+    if not isinstance(name, str) or not _identifier_pattern.match(name):
+        raise ValueError("非法的名称'%s'！" % name)
+    return '`' + name + '`'
+
+
+def _compile_predicate(predicate, args):
+    field = quote_identifier(predicate['Field'])
+    op = str(predicate.get('Op', '=')).upper()
+    value = predicate.get('Value')
+    if op in _comparisons:
+        if value is None:
+            if op not in ('=', '!=', '<>'):
+                raise ValueError("NULL只能使用'='或'!='比较！")
+            return field + (' IS NULL' if op == '=' else ' IS NOT NULL')
+        args.append(value)
+        return '%s %s %%s' % (field, op)
+    if op == 'BETWEEN':
+        if not isinstance(value, list) or len(value) != 2:
+            raise ValueError('BETWEEN需要两个值！')
+        args.extend(value)
+        return '%s BETWEEN %%s AND %%s' % field
+    if op == 'IN':
+        if not isinstance(value, list) or not value:
+            raise ValueError('IN需要至少一个值！')
+        args.extend(value)
+        return '%s IN (%s)' % (field, ', '.join(['%s'] * len(value)))
+    if op in ('LIKE', 'CONTAINS'):
+        text = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        args.append(('%' if op == 'CONTAINS' else '') + text + '%')
+        return '%s LIKE %%s' % field
+    raise TypeError('不支持的查询条件%s！' % op)
+
+
+def _compile_keyset(order, after, args):
+    """ (a, b) after (x, y) in the order of ORDER BY a, b expands to a > x OR (a = x AND b > y) """
+    alternatives = []
+    for i, (field, desc) in enumerate(order):
+        if field not in after:
+            raise ValueError("'After'中缺少排序列'%s'！" % field)
+        parts = []
+        for prev_field, _ in order[:i]:
+            parts.append('%s = %%s' % quote_identifier(prev_field))
+            args.append(after[prev_field])
+        parts.append('%s %s %%s' % (quote_identifier(field), '<' if desc else '>'))
+        args.append(after[field])
+        alternatives.append(' AND '.join(parts))
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(' + ' OR '.join('(' + alternative + ')' for alternative in alternatives) + ')'
+
+
+def parse_statement(sql, default_database=None):
+    """ find out what kind of statement a generated sql is and which table it touches
+
+    Parameters
+    ----------
+    sql: String
+        a sql statement generated by SqlCreator
+    default_database: String
+        database of the table when sql does not name one
+
+    Returns
+    -------
+    (kind, database_name, table_name): tuple
+        kind is one of 'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'ALTER', 'DROP', 'TRUNCATE' or None
+        if sql is not understood, table_name is None for statements on a whole database
+
+    Examples
+    --------
+    >>> parse_statement("UPDATE test.table1 SET name='Alice' WHERE id=2;")
+    ('UPDATE', 'test', 'table1')
+
+    """
+    match = _statement_pattern.match(sql)
+    if match is None:
+        return None, default_database, None
+    words = match.group(1).upper().split()
+    kind = words[0]
+    if words[-1] == 'DATABASE':
+        return kind, match.group(2), None
+    if match.group(3) is None:
+        return kind, default_database, match.group(2)
+    return kind, match.group(2), match.group(3)
 
 
 class SqlCreator(DBConnector):
@@ -18,18 +137,81 @@ class SqlCreator(DBConnector):
     The query operation will expose the dictionary object converted by cursor upward
 
     Attributions:
-    _transaction: a list of transaction before committing
+    _transaction: a ChangeSet of transaction before committing, compacted by commit_all
+    _commit_listeners: callables notified with the row changes of every commit_all
+    adaptive_batching: size the batched statements of every table with its batching.AdaptiveBatcher,
+                       from max_allowed_packet and the commit latency, instead of the fixed batch size
+    retries: the number of times a batched statement is retried after a lock wait timeout or a deadlock
+    retry_pause: the pause in seconds before the first retry, doubled before every further one
 
     """
+    _commit_listeners = []
+    _packet_bytes = {}
+    adaptive_batching = True
+    retries = 3
+    retry_pause = 0.2
+
+    @classmethod
+    def add_commit_listener(cls, listener):
+        """ register a callable notified after every commit_all
+
+        Parameters
+        ----------
+        listener: callable
+            called as listener(changes), changes is a list of dictionaries, one for each touched table:
+            {"database": "test", "table": "table1", "inserted": 2, "updated": 1, "deleted": 0, "ddl": False,
+             "complete": True, "rows": [{"op": "update", "key": {"id": 1}, "values": {"name": "Alice"}}, ...]}
+            "table" is None when a statement changes a whole database, "ddl" is True when the definition
+            of the table or database changed, "complete" is False when some statements changed rows
+            not described in "rows" (statements kept verbatim by the change set),
+            the "values" of a delete are the deleted row as given to delete_object_sql, missing if unknown
+
+        """
+        if listener not in cls._commit_listeners:
+            cls._commit_listeners.append(listener)
+
+    @classmethod
+    def remove_commit_listener(cls, listener):
+        if listener in cls._commit_listeners:
+            cls._commit_listeners.remove(listener)
 
     def __init__(self):
         """ initialization function
 
-        Create an empty list of database transactions
+        Create an empty change set of database transactions
 
         """
         super().__init__()
-        self._transaction = []
+        self._transaction = ChangeSet()
+        if self.adaptive_batching:
+            self._transaction.sizer = self._statement_size
+
+    def _batcher(self, database_name, table_name):
+        batcher = AdaptiveBatcher.get(database_name or self.database, table_name, self._transaction.batch_size)
+        if batcher.packet_bytes is None:
+            batcher.packet_bytes = self._max_allowed_packet()
+        return batcher
+
+    def _statement_size(self, database_name, table_name):
+        """ sizer of the change set, returns (rows, max_bytes) of the statements of a table """
+        batcher = self._batcher(database_name, table_name)
+        return batcher.rows(), batcher.max_bytes()
+
+    def _max_allowed_packet(self):
+        """ Returns max_allowed_packet of the server, read once per server, None without a connection """
+        server = (self.ip, self.port)
+        packet = self._packet_bytes.get(server)
+        if packet is None and self._conn is not None:
+            try:
+                packet = int(self.execute_sql('SELECT @@max_allowed_packet AS packet;').fetchone()['packet'])
+            except pymysql.err.Error:
+                return None
+            self._packet_bytes[server] = packet
+        return packet
+
+    def primary_key(self, description_list):
+        """ Returns a tuple of the primary key columns in a DESC result, empty if the table has none """
+        return tuple(description['Field'] for description in description_list if description['Key'] == 'PRI')
 
     def create_object_sql(self, _json, database_name, table_name):
         """ C(Create) of database data
@@ -66,27 +248,30 @@ class SqlCreator(DBConnector):
         sql_list = []
 
         description_list = self.table_columns(database_name, table_name).fetchall()
+        key_fields = self.primary_key(description_list)
         fields = []
         for description in description_list:
             fields.append(description['Field'])
         fields_str = ', '.join(fields)
 
         for _, value in objects.items():
-            values = []
-            for field in fields:
-                if type(value[field]) != int and type(value[field]) != float:
-                    value[field] = "'" + value[field] + "'"
-                values.append(str(value[field]))
-            values_str = ', '.join(values)
-            sql_list.append(sql_template % (database_name + '.' + table_name, fields_str, values_str))
-
-        self._transaction = self._transaction + sql_list
+            values = OrderedDict((field, value[field]) for field in fields)
+            values_str = ', '.join(sql_literal(v) for v in values.values())
+            sql = sql_template % (database_name + '.' + table_name, fields_str, values_str)
+            sql_list.append(sql)
+            if key_fields:
+                self._transaction.add_row('INSERT', sql, database_name, table_name, key_fields,
+                                          tuple(values[k] for k in key_fields), values)
+            else:
+                self._transaction.add_statement(sql)
+
         return sql_list
 
     def retrieve_object_sql(self, _json, database_name, table_name):
         """ R(Retrieve) the selected column of the selected table in the selected database
 
         The incoming data should be in JSON format
+        Filters, sorting and paging are compiled into parameterized sql, so MySQL can use its indexes
         Returns the dictionary object converted by cursor upward
 
         Parameters
@@ -108,40 +293,91 @@ class SqlCreator(DBConnector):
         Examples
         --------
         >>> sc = SqlCreator()
-        >>> sc.retrieve_object_sql('json_str', 'test', 'table2')
-        ['SELECT Host, Db, User FROM db;']
+        >>> sc.retrieve_object_sql('{"Fields": ["Host", "Db", "User"]}', 'mysql', 'db')
+        ['SELECT `Host`, `Db`, `User` FROM `mysql`.`db`;']
+        >>> sc.retrieve_object_sql('{"Fields": ["id", "name"], "Where": [{"Field": "id", "Op": ">", "Value": 3}],'
+        ...                        ' "OrderBy": [{"Field": "id"}], "Limit": 2}', 'test', 'table1')
+        ['SELECT `id`, `name` FROM `test`.`table1` WHERE `id` > 3 ORDER BY `id` ASC LIMIT 0, 2;']
 
         Notes
         -----
         if JSON file have key 'Limit', it will limit the number of data read out
         if JSON file have key 'Start', it will set start location of reading out
         if JSON file only have key 'Start' without 'Limit', 'Start' config will not work
+        if JSON file have key 'Where', a list of predicates joined by AND:
+            {"Field": "id", "Op": "=", "Value": 1}, "Op" is one of =, !=, <, <=, >, >=, BETWEEN, IN, LIKE, CONTAINS,
+            "Value" is a list of two values for BETWEEN, a list of values for IN, a prefix for LIKE
+            and a substring for CONTAINS, which cannot use an index
+        if JSON file have key 'OrderBy', a list of {"Field": "id", "Desc": false} or column names
+        if JSON file have key 'After', it continues after the row whose 'OrderBy' columns have these values:
+            {"id": 100}, the 'OrderBy' columns should end with a unique key, use it instead of 'Start' on big tables
 
         """
-        sql_template = 'SELECT %s FROM %s'
-        sql_list = []
-
         fields = json.loads(_json)
-        columns = fields['Fields']
-        columns_str = ', '.join(columns)
-        try:
-            sql_list.append((sql_template % (columns_str, database_name + '.' + table_name)) +
-                            (' LIMIT %d, %d' % (fields['Start'], fields['Limit'])) + ';')
-        except KeyError:
-            try:
-                sql_list.append((sql_template % (columns_str, database_name + '.' + table_name))
-                                + ('LIMIT 0, %d' % fields['Limit']) + ';')
-            except KeyError:
-                sql_list.append(sql_template % (columns_str, database_name + '.' + table_name) + ';')
+        sql, args = self.compile_retrieve_sql(fields, database_name, table_name)
+        sql_list = [sql % tuple(self._literal_arg(arg) for arg in args) if args else sql]
 
         dic = {}
         try:
-            dic = self.execute_sql(sql_list[0]).fetchall()
+            dic = self.execute_sql(sql, args or None).fetchall()
         except pymysql.err.Error:
             print('查询数据出错，请修改后尝试！')
 
         return sql_list, dic
 
+    def _literal_arg(self, arg):
+        if self._conn is not None:
+            return self._conn.literal(arg)
+        return sql_literal(arg)
+
+    def compile_retrieve_sql(self, fields, database_name, table_name):
+        """ compile the JSON spec of retrieve_object_sql into a parameterized SELECT
+
+        Parameters
+        ----------
+        fields: dict
+            the parsed JSON spec, refer to retrieve_object_sql
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table of above database
+
+        Returns
+        -------
+        (sql, args): tuple
+            sql with %s placeholders and the list of values bound to them
+
+        """
+        columns = fields.get('Fields') or []
+        columns_str = ', '.join(quote_identifier(column) for column in columns) if columns else '*'
+        sql = 'SELECT %s FROM %s.%s' % (columns_str, quote_identifier(database_name), quote_identifier(table_name))
+        args = []
+
+        conditions = []
+        for predicate in fields.get('Where', []):
+            conditions.append(_compile_predicate(predicate, args))
+
+        order = []
+        for item in fields.get('OrderBy', []):
+            if isinstance(item, str):
+                item = {'Field': item}
+            order.append((item['Field'], bool(item.get('Desc', False))))
+
+        if fields.get('After') is not None:
+            if not order:
+                raise ValueError("使用'After'时必须指定'OrderBy'！")
+            conditions.append(_compile_keyset(order, fields['After'], args))
+
+        if conditions:
+            sql = sql + ' WHERE ' + ' AND '.join(conditions)
+        if order:
+            sql = sql + ' ORDER BY ' + ', '.join('%s %s' % (quote_identifier(field), 'DESC' if desc else 'ASC')
+                                                 for field, desc in order)
+        if 'Limit' in fields:
+            sql = sql + ' LIMIT %s, %s'
+            args.extend([int(fields.get('Start', 0)), int(fields['Limit'])])
+        return sql + ';', args
+
     def update_object_sql(self, _json, database_name, table_name):
         """ U(Update) the data of the selected table in the selected database
 
@@ -177,11 +413,8 @@ class SqlCreator(DBConnector):
         sql_template = 'UPDATE %s SET %s WHERE %s;'
         sql_list = []
 
-        primary_key = ''
-        for description in description_list:
-            if description['Key'] == 'PRI':
-                primary_key = description['Field']
-        if primary_key == '':
+        key_fields = self.primary_key(description_list)
+        if not key_fields:
             print('该数据库中没有主键，使用其所有属性值作为索引使用，可能会有预料之外的错误。')
             for _, value in objects.items():
                 modify_attr = value["update"]
@@ -195,21 +428,24 @@ class SqlCreator(DBConnector):
                 for k, v in value.items():
                     cond.append('%s=%s, ' % (k, v))
                 cond_str = ', '.join(cond)
-                sql_list.append((sql_template % (database_name + '.' + table_name,
-                                                 key_value_str, cond_str)).rstrip(', '))
+                sql = (sql_template % (database_name + '.' + table_name, key_value_str, cond_str)).rstrip(', ')
+                sql_list.append(sql)
+                self._transaction.add_statement(sql)
         else:
             for _, value in objects.items():
                 modify_attr = value["update"]
-                key_value = []
-                for attr in modify_attr:
-                    if type(value[attr]) != int and type(value[attr]) != float:
-                        value[attr] = "'" + str(value[attr]) + "'"
-                    key_value.append(attr + '=' + str(value[attr]))
-                key_value_str = ', '.join(key_value)
-                sql_list.append(sql_template % (database_name + '.' + table_name, key_value_str,
-                                                primary_key + "=" + str(value[primary_key])))
+                values = OrderedDict((attr, value[attr]) for attr in modify_attr)
+                key_value_str = ', '.join(attr + '=' + sql_literal(v) for attr, v in values.items())
+                key = tuple(value[k] for k in key_fields)
+                cond_str = ' AND '.join(k + '=' + sql_literal(v) for k, v in zip(key_fields, key))
+                sql = sql_template % (database_name + '.' + table_name, key_value_str, cond_str)
+                sql_list.append(sql)
+                if set(key_fields) & set(modify_attr):
+                    # changing the primary key moves the row, it cannot be merged with other changes
+                    self._transaction.add_statement(sql)
+                else:
+                    self._transaction.add_row('UPDATE', sql, database_name, table_name, key_fields, key, values)
 
-        self._transaction = self._transaction + sql_list
         return sql_list
 
     def delete_object_sql(self, _json, database_name, table_name):
@@ -251,25 +487,29 @@ class SqlCreator(DBConnector):
         sql_template = 'DELETE FROM %s WHERE %s;'
         sql_list = []
 
-        primary_key = ''
-        for description in description_list:
-            if description['Key'] == 'PRI':
-                primary_key = description['Field']
+        key_fields = self.primary_key(description_list)
 
-        if primary_key == '':
+        if not key_fields:
             print('该数据库中没有主键，使用其所有属性值作为索引使用，可能会有预料之外的错误。')
             for _, value in objects.items():
                 cond = []
                 for k, v in value.items():
                     cond.append('%s=%s' % (k, v))
                 cond_str = ', '.join(cond)
-                sql_list.append((sql_template % (database_name + '.' + table_name, cond_str)))
+                sql = sql_template % (database_name + '.' + table_name, cond_str)
+                sql_list.append(sql)
+                self._transaction.add_statement(sql)
         else:
             for _, value in objects.items():
-                sql_list.append(sql_template % (database_name + '.' + table_name,
-                                                primary_key + "=" + str(value[primary_key])))
+                key = tuple(value[k] for k in key_fields)
+                cond_str = ' AND '.join(k + '=' + sql_literal(v) for k, v in zip(key_fields, key))
+                sql = sql_template % (database_name + '.' + table_name, cond_str)
+                sql_list.append(sql)
+                # the values of the row are passed on to the commit listeners as the deleted row
+                values = OrderedDict((field['Field'], value[field['Field']]) for field in description_list
+                                     if field['Field'] in value)
+                self._transaction.add_row('DELETE', sql, database_name, table_name, key_fields, key, values)
 
-        self._transaction = self._transaction + sql_list
         return sql_list
 
     def create_table_sql(self, _json, database_name):
@@ -336,7 +576,7 @@ class SqlCreator(DBConnector):
                 field_str = ', '.join(fields)
 
         sql_list.append(sql_template % (database_name + '.' + table_name, field_str))
-        self._transaction = self._transaction + sql_list
+        self._transaction.add_statements(sql_list)
         return sql_list
 
     def retrieve_table_sql(self, _json, database_name):
@@ -437,7 +677,7 @@ class SqlCreator(DBConnector):
                     attr_str = field['Alter']
                     raise TypeError('不支持的修改类型%s！' % attr_str)
 
-        self._transaction = self._transaction + sql_list
+        self._transaction.add_statements(sql_list)
         return sql_list
 
     def delete_table_sql(self, _json, database_name):
@@ -472,7 +712,7 @@ class SqlCreator(DBConnector):
         for _, value in objects['table'].items():
             sql_list.append(sql_template % database_name + '.' + value)
 
-        self._transaction = self._transaction + sql_list
+        self._transaction.add_statements(sql_list)
         return sql_list
 
     def create_database_sql(self, _json):
@@ -514,7 +754,7 @@ class SqlCreator(DBConnector):
             charset = ';'
         sql.append(sql_template % (database_name, charset))
 
-        self._transaction = self._transaction + sql
+        self._transaction.add_statements(sql)
         return sql
 
     def retrieve_database_sql(self, _json):
@@ -585,7 +825,7 @@ class SqlCreator(DBConnector):
         sql_template = "ALTER DATABASE %s CHARSET='%s'"
         sql_list = [sql_template % (objects['database'], objects['charset'])]
 
-        self._transaction = self._transaction + sql_list
+        self._transaction.add_statements(sql_list)
         return sql_list
 
     def delete_database_sql(self, _json):
@@ -617,7 +857,7 @@ class SqlCreator(DBConnector):
         for database in objects['database']:
             sql_list.append(sql_template % database)
 
-        self._transaction = self._transaction + sql_list
+        self._transaction.add_statements(sql_list)
         return sql_list
 
     def rollback(self, step, reverse=False):
@@ -654,46 +894,262 @@ class SqlCreator(DBConnector):
         else:
             return roll_list
 
-    def show_sql_transaction(self):
+    def show_sql_transaction(self, compact=False):
         """ Get the current database transaction list
 
+        Parameters
+        ----------
+        compact: Boolean
+            return the statements commit_all would send instead of the statements in the order they were added
+
         Returns
         -------
-        self._transaction: list
+        sql_list: list
             the current database transaction list
 
         """
-        return self._transaction
+        if compact is True:
+            return self._transaction.compact()
+        return self._transaction.statements()
 
-    def commit_all(self):
+    def commit_all(self, parallel=False, max_workers=4, single_transaction=False):
         """ Submit the current database transaction list to the database
 
         CUD operations will first enter the transaction list cache, and then run the function
 
+        Parameters
+        ----------
+        parallel: Boolean
+            split the statements by table and commit the tables concurrently on pooled connections
+        max_workers: int
+            the maximum number of tables committed at the same time in parallel mode
+        single_transaction: Boolean
+            commit once after all statements instead of after every statement, ignored in parallel mode,
+            a failed statement rolls back the whole transaction and the status is then (0-<total>)
+
         Returns
         -------
         status: String
             The number of sql statements executed and total sql statements: (<executed>-<total>)
+            in parallel mode followed by the status of every table: '5-6 (test.t1:3-3, test.t2:2-3)'
 
         Notes
         -----
         Be sure to execute this function
+        The transaction list is compacted first, so the counts are those of the compacted statements
+        Parallel mode falls back to the serial order if the list contains any statement other than
+        INSERT, UPDATE and DELETE; tables linked by a foreign key are committed together in their original order
 
         """
-        count = 0
-        total = len(self._transaction)
-        for affair in self._transaction:
-            count = count + 1
+        affairs = self._transaction.compact_rows()
+        self._transaction.clear()
+        total = len(affairs)
+        changes = {}
+
+        groups = self._parallel_groups(affairs) if parallel is True else None
+        if groups is None or len(groups) < 2:
+            count = self._commit_statements(affairs, changes, commit_each=single_transaction is not True)
+            status = str(count) + '-' + str(total)
+        else:
+            pool = ConnectionPool.get(dict(self._config, database=self.database), max_size=max_workers)
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(groups))) as executor:
+                futures = [(name, len(group), executor.submit(self._commit_in_pool, pool, group))
+                           for name, group in groups]
+            count = 0
+            group_status = []
+            for name, group_total, future in futures:
+                try:
+                    group_count, group_changes = future.result()
+                except Exception as error_info:
+                    print("Sql Error: %s 组提交失败！" % name, error_info)
+                    group_count, group_changes = 0, {}
+                count = count + group_count
+                group_status.append('%s:%d-%d' % (name, group_count, group_total))
+                for key, change in group_changes.items():
+                    merged = changes.setdefault(key, change)
+                    if merged is not change:
+                        for k in ('inserted', 'updated', 'deleted'):
+                            merged[k] += change[k]
+                        merged['ddl'] = merged['ddl'] or change['ddl']
+                        merged['complete'] = merged['complete'] and change['complete']
+                        merged['rows'].extend(change['rows'])
+            status = str(count) + '-' + str(total) + ' (' + ', '.join(group_status) + ')'
+
+        self._notify_commit(list(changes.values()))
+        return status
+
+    def _commit_statements(self, affairs, changes, commit_each=True):
+        """ execute statements, returns the number of statements executed
+
+        committed one by one a failed statement is skipped, in one transaction (commit_each False)
+        the first failed statement rolls back the whole transaction and 0 is returned, nothing is recorded in changes
+
+        """
+        if commit_each:
+            count = 0
+            for affair, rows in affairs:
+                try:
+                    rowcount = self._commit_statement(affair, rows, commit_each)
+                except pymysql.err.Error:
+                    print("Sql Error: %s 语句存在错误，并没有被执行！" % affair)
+                    continue
+                count = count + 1
+                self._record_change(changes, affair, rowcount, rows)
+            return count
+
+        recorded = {}
+        affair = None
+        try:
+            for affair, rows in affairs:
+                rowcount = self._commit_statement(affair, rows, commit_each)
+                self._record_change(recorded, affair, rowcount, rows)
+            self._conn.commit()
+        except pymysql.err.Error:
+            print("Sql Error: %s 语句存在错误，整个事务已回滚！" % affair)
             try:
-                self.commit_sql(affair)
+                self._conn.rollback()
             except pymysql.err.Error:
-                self.rollback(1)
-                count = count - 1
-                print("Sql Error: %s 语句存在错误，并没有被执行！" % affair)
+                pass
+            return 0
+        changes.update(recorded)
+        return len(affairs)
 
-        self._transaction.clear()
-        status = str(count) + '-' + str(total)
-        return status
+    def _commit_statement(self, affair, rows, commit_each=True):
+        """ execute one statement, returns the number of affected rows
+
+        A batched statement reports its latency and size to the batcher of its table,
+        it is retried after a lock wait timeout and, if committed alone, after a deadlock,
+        a batched INSERT exceeding max_allowed_packet is split in halves
+
+        """
+        if not self.adaptive_batching or not rows:
+            cur = self.commit_sql(affair) if commit_each else self.execute_sql(affair)
+            return cur.rowcount
+        kind, database_name, table_name = parse_statement(affair, self.database)
+        batcher = self._batcher(database_name, table_name)
+        size = len(affair.encode('utf-8'))
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                cur = self.commit_sql(affair) if commit_each else self.execute_sql(affair)
+            except pymysql.err.Error as error_info:
+                reason = batcher.failure(error_info, size)
+                # a deadlock rolls back the whole transaction, the earlier statements of it are lost
+                if (reason == 'lock_wait' or (reason == 'deadlock' and commit_each)) and attempt < self.retries:
+                    time.sleep(self.retry_pause * 2 ** attempt)
+                    attempt = attempt + 1
+                    continue
+                if reason == 'packet' and kind == 'INSERT' and len(rows) > 1 \
+                        and all(row['op'] == 'insert' and 'values' in row for row in rows):
+                    half = len(rows) // 2
+                    return sum(self._commit_statement(_insert_statement(database_name, table_name, part),
+                                                      part, commit_each)
+                               for part in (rows[:half], rows[half:]))
+                raise
+            batcher.success(len(rows), time.perf_counter() - start, size)
+            return cur.rowcount
+
+    def _commit_in_pool(self, pool, affairs):
+        worker = type(self)()
+        worker.database = self.database
+        connection = pool.acquire()
+        worker.attach_connection(connection)
+        changes = {}
+        try:
+            count = worker._commit_statements(affairs, changes)
+        finally:
+            worker.detach_connection()
+            pool.release(connection, broken=not connection.open)
+        return count, changes
+
+    def _parallel_groups(self, affairs):
+        """ split statements into groups which can be committed concurrently
+
+        Returns
+        -------
+        groups: list
+            a list of (name, statements) in the order of the first statement of each group,
+            None if the statements must keep their global order
+
+        """
+        tables = OrderedDict()
+        for affair, _ in affairs:
+            kind, database_name, table_name = parse_statement(affair, self.database)
+            if kind not in ('INSERT', 'UPDATE', 'DELETE') or table_name is None:
+                return None
+            tables.setdefault((database_name, table_name), []).append(affair)
+        if len(tables) < 2:
+            return None
+
+        parent = {key: key for key in tables}
+
+        def find(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for child, referenced in self._foreign_keys(set(key[0] for key in tables)):
+            if child in parent and referenced in parent:
+                parent[find(child)] = find(referenced)
+
+        groups = OrderedDict()
+        for affair, rows in affairs:
+            kind, database_name, table_name = parse_statement(affair, self.database)
+            root = find((database_name, table_name))
+            groups.setdefault(root, ([], []))
+            members, statements = groups[root]
+            if (database_name, table_name) not in members:
+                members.append((database_name, table_name))
+            statements.append((affair, rows))
+        return [('+'.join('%s.%s' % member for member in members), statements)
+                for members, statements in groups.values()]
+
+    def _foreign_keys(self, database_names):
+        """ Returns a list of ((database, table), (referenced database, referenced table)) of the databases """
+        database_names = sorted(database_names)
+        sql = ('SELECT DISTINCT TABLE_SCHEMA, TABLE_NAME, REFERENCED_TABLE_SCHEMA, REFERENCED_TABLE_NAME '
+               'FROM information_schema.KEY_COLUMN_USAGE '
+               'WHERE REFERENCED_TABLE_NAME IS NOT NULL AND TABLE_SCHEMA IN (%s);'
+               % ', '.join(['%s'] * len(database_names)))
+        rows = self.execute_sql(sql, database_names).fetchall()
+        return [((row['TABLE_SCHEMA'], row['TABLE_NAME']),
+                 (row['REFERENCED_TABLE_SCHEMA'], row['REFERENCED_TABLE_NAME'])) for row in rows]
+
+    def _record_change(self, changes, sql, rowcount, rows=None):
+        kind, database_name, table_name = parse_statement(sql, self.database)
+        if kind is None:
+            return
+        key = (database_name, table_name)
+        change = changes.get(key)
+        if change is None:
+            change = {'database': database_name, 'table': table_name,
+                      'inserted': 0, 'updated': 0, 'deleted': 0, 'ddl': False, 'complete': True, 'rows': []}
+            changes[key] = change
+        rowcount = max(rowcount, 0)
+        if kind == 'INSERT':
+            change['inserted'] += rowcount
+        elif kind == 'UPDATE':
+            change['updated'] += rowcount
+        elif kind == 'DELETE':
+            change['deleted'] += rowcount
+        else:
+            change['ddl'] = True
+        if rows is None:
+            change['complete'] = False
+        else:
+            change['rows'].extend(rows)
+
+    @classmethod
+    def _notify_commit(cls, changes):
+        if not changes:
+            return
+        for listener in list(cls._commit_listeners):
+            try:
+                listener(changes)
+            except Exception as error_info:
+                print('Commit Listener Error:', error_info)
 
 
 # # 测试用代码，去掉注释使用
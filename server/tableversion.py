@@ -0,0 +1,69 @@
+"""
+Interface for versions of tables changed through SqlCreator
+    Versions are used as validators of HTTP responses and as keys of caches derived from table data
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import hashlib
+import threading
+import uuid
+from sqlcreator import SqlCreator
+
+
+class TableVersions:
+    """ Keep a version number per table, bumped by every SqlCreator.commit_all touching the table
+
+    Versions live in process memory, the boot id makes validators of an earlier process invalid
+    Changes by other clients are not counted, combine the version with information_schema.TABLES.UPDATE_TIME
+
+    Attributions:
+    _boot: a random id of this process
+    _versions: a dictionary of table versions, keyed by (database, table)
+    _database_versions: a dictionary of database versions, bumped by statements on a whole database
+
+    """
+    _boot = uuid.uuid4().hex[:8]
+    _versions = {}
+    _database_versions = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def on_commit(cls, changes):
+        """ commit listener of SqlCreator, bumps the version of every touched table """
+        with cls._lock:
+            for change in changes:
+                if change['table'] is None:
+                    cls._database_versions[change['database']] = cls._database_versions.get(change['database'], 0) + 1
+                else:
+                    key = (change['database'], change['table'])
+                    cls._versions[key] = cls._versions.get(key, 0) + 1
+
+    @classmethod
+    def version(cls, database_name, table_name=None):
+        """ Returns a string which changes whenever the table (or any table of the database if None) is changed """
+        with cls._lock:
+            database_version = cls._database_versions.get(database_name, 0)
+            if table_name is None:
+                table_version = sum(v for (d, _), v in cls._versions.items() if d == database_name)
+            else:
+                table_version = cls._versions.get((database_name, table_name), 0)
+        return '%s-%d-%d' % (cls._boot, database_version, table_version)
+
+    @classmethod
+    def etag(cls, database_name, table_name=None, update_time=None):
+        """ Returns a strong validator of the table combining its version and its UPDATE_TIME
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table, None for a validator of the whole database
+        update_time: String
+            information_schema.TABLES.UPDATE_TIME of the table, to notice changes by other clients
+
+        """
+        text = '%s|%s|%s|%s' % (database_name, table_name, cls.version(database_name, table_name), update_time)
+        return hashlib.sha1(text.encode('utf8')).hexdigest()[:20]
+
+
+SqlCreator.add_commit_listener(TableVersions.on_commit)
@@ -0,0 +1,16 @@
+import pytest
+from advisor import QueryAnalyzer
+
+
+@pytest.mark.parametrize('sql, args, columns', [
+    ('SELECT * FROM `d`.`t` WHERE `a` = %s AND `b` > %s;', [1, 2], ['a', 'b']),
+    ('SELECT * FROM `d`.`t` WHERE `a` IN (%s, %s) ORDER BY `c` LIMIT 10;', [1, 2], ['a', 'c']),
+    ('SELECT * FROM `d`.`t` ORDER BY `c` DESC, `e` LIMIT 10;', [], ['c', 'e']),
+    ('SELECT * FROM `d`.`t` WHERE `name` LIKE %s;', ['abc%'], ['name']),
+    # a pattern starting with a wildcard cannot use an index
+    ('SELECT * FROM `d`.`t` WHERE `name` LIKE %s;', ['%abc%'], []),
+    ('SELECT * FROM `d`.`t` WHERE `a` = %s AND `name` LIKE %s ORDER BY `c`;', [1, '_bc%'], ['a', 'c']),
+    ("SELECT * FROM `d`.`t` WHERE `name` LIKE '%%abc' ORDER BY `c`;", None, ['c']),
+])
+def test_index_columns(sql, args, columns):
+    assert QueryAnalyzer._index_columns(sql, args) == columns
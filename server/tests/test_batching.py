@@ -0,0 +1,43 @@
+import pymysql
+from batching import AdaptiveBatcher
+
+
+def test_fast_full_batches_grow():
+    batcher = AdaptiveBatcher(initial=100, step=10, maximum=115)
+    batcher.success(100, 0.1)
+    assert batcher.rows() == 110
+    batcher.success(110, 0.1)
+    assert batcher.rows() == 115
+
+
+def test_short_tail_does_not_grow():
+    batcher = AdaptiveBatcher(initial=100, step=10)
+    batcher.success(30, 0.1)
+    assert batcher.rows() == 100
+
+
+def test_slow_batches_halve():
+    batcher = AdaptiveBatcher(initial=100, minimum=40, target_seconds=0.5)
+    batcher.success(100, 1.0)
+    assert batcher.rows() == 50
+    batcher.success(50, 1.0)
+    assert batcher.rows() == 40
+    assert batcher.backoffs == {'slow': 2}
+
+
+def test_rows_fit_the_packet():
+    batcher = AdaptiveBatcher(initial=1000)
+    batcher.packet_bytes = 10000
+    batcher.success(10, 0.1, statement_bytes=1000)
+    assert batcher.rows() == 80
+
+
+def test_failures():
+    batcher = AdaptiveBatcher(initial=100)
+    assert batcher.failure(pymysql.err.OperationalError(1213, 'Deadlock')) == 'deadlock'
+    assert batcher.failure(pymysql.err.OperationalError(1205, 'Lock wait timeout')) == 'lock_wait'
+    assert batcher.failure(pymysql.err.IntegrityError(1062, 'Duplicate entry')) is None
+    assert batcher.rows() == 25
+    assert batcher.failure(pymysql.err.OperationalError(1153, 'Packet too large'), 8000) == 'packet'
+    assert batcher.max_bytes() == 4000
+    assert batcher.rows() == 12
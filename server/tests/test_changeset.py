@@ -0,0 +1,102 @@
+from changeset import ChangeSet, key_condition, sql_literal
+
+
+def _insert(changes, key, **values):
+    changes.add_row('INSERT', 'INSERT %s' % key, 'db', 't', ('id',), (key,), dict(values, id=key))
+
+
+def _update(changes, key, **values):
+    changes.add_row('UPDATE', 'UPDATE %s' % key, 'db', 't', ('id',), (key,), values)
+
+
+def _delete(changes, key, **values):
+    changes.add_row('DELETE', 'DELETE %s' % key, 'db', 't', ('id',), (key,), values or None)
+
+
+def test_sql_literal():
+    assert sql_literal(None) == 'NULL'
+    assert sql_literal(3) == '3'
+    assert sql_literal(1.5) == '1.5'
+    assert sql_literal("O'Neil") == "'O\\'Neil'"
+
+
+def test_key_condition():
+    assert key_condition(('id',), [(1,)]) == 'id=1'
+    assert key_condition(('id',), [(1,), (2,)]) == 'id IN (1, 2)'
+    assert key_condition(('a', 'b'), [(1, 'x')]) == "a=1 AND b='x'"
+    assert key_condition(('a', 'b'), [(1, 'x'), (2, 'y')]) == "(a, b) IN ((1, 'x'), (2, 'y'))"
+
+
+def test_updates_fold_into_insert():
+    changes = ChangeSet()
+    _insert(changes, 1, name='a')
+    _update(changes, 1, name='b')
+    assert changes.compact() == ["INSERT INTO db.t(name, id) VALUES ('b', 1);"]
+
+
+def test_insert_then_delete_cancels():
+    changes = ChangeSet()
+    _insert(changes, 1, name='a')
+    _delete(changes, 1)
+    assert changes.compact() == []
+
+
+def test_updates_are_merged_and_grouped():
+    changes = ChangeSet()
+    _update(changes, 1, name='a')
+    _update(changes, 2, name='a')
+    _update(changes, 1, age=3)
+    assert changes.compact() == ["UPDATE db.t SET name='a', age=3 WHERE id=1;",
+                                 "UPDATE db.t SET name='a' WHERE id=2;"]
+
+
+def test_statements_are_not_reordered_across_verbatim_sql():
+    changes = ChangeSet()
+    _insert(changes, 1, name='a')
+    changes.add_statement('ALTER TABLE db.t ADD c INT;')
+    _update(changes, 1, name='b')
+    assert changes.compact() == ["INSERT INTO db.t(name, id) VALUES ('a', 1);",
+                                 'ALTER TABLE db.t ADD c INT;',
+                                 "UPDATE db.t SET name='b' WHERE id=1;"]
+
+
+def test_batches_respect_batch_size():
+    changes = ChangeSet(batch_size=2)
+    for key in range(5):
+        _insert(changes, key)
+    assert [len(rows) for _, rows in changes.compact_rows()] == [2, 2, 1]
+
+
+def test_reinsert_reports_deleted_values():
+    changes = ChangeSet()
+    _delete(changes, 1, name='old')
+    _insert(changes, 1, name='new')
+    statements = changes.compact_rows()
+    assert [sql for sql, _ in statements] == ['DELETE FROM db.t WHERE id=1;',
+                                              "INSERT INTO db.t(name, id) VALUES ('new', 1);"]
+    assert statements[0][1] == [{'op': 'delete', 'key': {'id': 1}, 'values': {'name': 'old'}}]
+    assert statements[1][1] == [{'op': 'insert', 'key': {'id': 1}, 'values': {'name': 'new', 'id': 1}}]
+
+
+def test_delete_of_reinserted_row_keeps_first_values():
+    changes = ChangeSet()
+    _delete(changes, 1, name='old')
+    _insert(changes, 1, name='new')
+    _delete(changes, 1)
+    assert changes.compact_rows() == [('DELETE FROM db.t WHERE id=1;',
+                                       [{'op': 'delete', 'key': {'id': 1}, 'values': {'name': 'old'}}])]
+
+
+def test_unknown_deleted_values():
+    changes = ChangeSet()
+    _delete(changes, 1)
+    assert changes.compact_rows()[0][1] == [{'op': 'delete', 'key': {'id': 1}}]
+
+
+def test_change_of_unseen_key_after_insert_keeps_order():
+    # 1 and '1' name the same row in MySQL, the update must not be sent before the insert
+    changes = ChangeSet()
+    _insert(changes, 1, name='a')
+    _update(changes, '1', name='b')
+    assert changes.compact() == ["INSERT INTO db.t(name, id) VALUES ('a', 1);",
+                                 "UPDATE db.t SET name='b' WHERE id='1';"]
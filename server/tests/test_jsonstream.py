@@ -0,0 +1,56 @@
+import io
+import pytest
+from jsonstream import iter_objects, iter_rows
+
+
+def _objects(text, chunk_size=1 << 20):
+    return list(iter_objects(io.StringIO(text), chunk_size))
+
+
+@pytest.mark.parametrize('text', [
+    '{"a": 1}\n{"a": 2}\n',
+    '{"a": 1} {"a": 2}',
+    '[{"a": 1}, {"a": 2}]',
+    ' [ {"a": 1} ,\n {"a": 2} ] ',
+    '{"0": {"a": 1}, "1": {"a": 2}}',
+])
+def test_layouts(text):
+    assert _objects(text) == [{'a': 1}, {'a': 2}]
+
+
+@pytest.mark.parametrize('text', [
+    '{"a": 12.5, "b": "x"}\n{"a": 3, "b": "\\"}"}',
+    '[{"a": 12.5, "b": "x"}, {"a": 3, "b": "\\"}"}]',
+    '{"0": {"a": 12.5, "b": "x"}, "1": {"a": 3, "b": "\\"}"}}',
+])
+def test_small_chunks(text):
+    # values are split across chunks, a number must not be decoded before its end is read
+    assert _objects(text, chunk_size=1) == [{'a': 12.5, 'b': 'x'}, {'a': 3, 'b': '"}'}]
+
+
+@pytest.mark.parametrize('text', ['', '  \n', '[]', '{}'])
+def test_empty(text):
+    assert _objects(text) == []
+
+
+@pytest.mark.parametrize('text', [
+    '1',
+    '[1, 2]',
+    '[{"a": 1} {"a": 2}]',
+    '{"0": {"a": 1}, "1": 2}',
+    '[{"a": 1}] x',
+    '{"a": ',
+])
+def test_broken_files(text):
+    with pytest.raises(ReferenceError):
+        _objects(text)
+
+
+def test_rows():
+    rows = list(iter_rows([{'a': 1, 'b': True, 'c': {'x': [1]}}, {'b': False, 'a': None, 'c': 'y'}]))
+    assert rows == [['a', 'b', 'c'], [1, 1, '{"x": [1]}'], [None, 0, 'y']]
+
+
+def test_rows_with_other_keys():
+    with pytest.raises(ReferenceError):
+        list(iter_rows([{'a': 1}, {'b': 1}]))
@@ -0,0 +1,54 @@
+import csv
+import io
+import pytest
+import parallelcsv
+
+TEXT = ('id,note\r\n'
+        '1,"two\nlines"\n'
+        '2,"quoted ""a,b"" and\n""x"""\n'
+        '3,plain\n'
+        '4,"\n\n"\n'
+        '5,last')
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_bytes(TEXT.encode('utf-8'))
+    return str(path)
+
+
+def _expected():
+    return [[v.replace(' ', '') for v in row] for row in csv.reader(io.StringIO(TEXT, newline=''))]
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 2, 5, 7, 13, 1 << 20])
+def test_ranges_keep_quoted_newlines(csv_path, chunk_bytes):
+    header, ranges = parallelcsv.split_ranges(csv_path, chunk_bytes)
+    assert header == (0, len('id,note\r\n'))
+    assert ranges[0][0] == header[1] and ranges[-1][1] == len(TEXT)
+    assert all(previous[1] == following[0] for previous, following in zip(ranges, ranges[1:]))
+    rows = parallelcsv.parse_range(csv_path, *header, 'utf-8')
+    for start, end in ranges:
+        rows += parallelcsv.parse_range(csv_path, start, end, 'utf-8')
+    assert rows == _expected()
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_bytes(b'')
+    assert parallelcsv.split_ranges(str(path)) == ((0, 0), [])
+
+
+def test_header_only(tmp_path):
+    path = tmp_path / 'header.csv'
+    path.write_bytes(b'a,b')
+    assert parallelcsv.split_ranges(str(path)) == ((0, 3), [])
+
+
+def test_parse_parallel_reports_ranges(csv_path):
+    header, ranges = parallelcsv.split_ranges(csv_path, 5)
+    parsed = []
+    rows = list(parallelcsv.parse_parallel(csv_path, ranges, 2, True, 'utf-8', parsed=lambda *r: parsed.append(r)))
+    assert rows == _expected()[1:]
+    assert parsed == ranges
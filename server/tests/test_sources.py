@@ -0,0 +1,57 @@
+import gzip
+import zipfile
+import pytest
+import sources
+
+
+@pytest.mark.parametrize('path, parts', [
+    ('/data/sales_01.csv', ('sales_01', '.csv', None)),
+    ('/data/sales_01.CSV.GZ', ('sales_01', '.csv', '.gz')),
+    ('events.jsonl.zst', ('events', '.jsonl', '.zst')),
+    ('bundle.zip', ('bundle', None, '.zip')),
+    ('data.gz', ('data', None, '.gz')),
+])
+def test_split_name(path, parts):
+    assert sources.split_name(path) == parts
+
+
+def _read(path, extension='.csv'):
+    opened = []
+    streams = [(name, stream.read()) for name, stream in sources.text_streams(str(path), extension, 'utf-8',
+                                                                               opened.append)]
+    return streams, opened
+
+
+def test_plain_file(tmp_path):
+    path = tmp_path / 'a.csv'
+    path.write_text('a,b\n1,2\n', encoding='utf-8')
+    streams, opened = _read(path)
+    assert streams == [('a.csv', 'a,b\n1,2\n')]
+    assert len(opened) == 1 and opened[0].closed
+
+
+def test_gzip_file(tmp_path):
+    path = tmp_path / 'a.csv.gz'
+    path.write_bytes(gzip.compress('a,b\n1,2\n'.encode('utf-8')))
+    streams, opened = _read(path)
+    assert streams == [('a.csv.gz', 'a,b\n1,2\n')]
+    assert opened[0].closed
+
+
+def test_zip_members_in_order(tmp_path):
+    path = tmp_path / 'bundle.zip'
+    with zipfile.ZipFile(str(path), 'w') as archive:
+        archive.writestr('b.csv', 'b\n')
+        archive.writestr('a.csv', 'a\n')
+        archive.writestr('notes.txt', 'x')
+    streams, opened = _read(path)
+    assert streams == [('a.csv', 'a\n'), ('b.csv', 'b\n')]
+    assert opened[0].closed
+
+
+def test_zip_without_members(tmp_path):
+    path = tmp_path / 'bundle.zip'
+    with zipfile.ZipFile(str(path), 'w') as archive:
+        archive.writestr('notes.txt', 'x')
+    with pytest.raises(TypeError):
+        _read(path)
@@ -0,0 +1,50 @@
+import pytest
+from sqlcreator import _compile_keyset, _compile_predicate, quote_identifier
+
+
+def _compile(predicate):
+    args = []
+    return _compile_predicate(predicate, args), args
+
+
+def test_quote_identifier():
+    assert quote_identifier('table_1') == '`table_1`'
+    for name in ('a`b', 'a b', 'a;b', '', None):
+        with pytest.raises(ValueError):
+            quote_identifier(name)
+
+
+def test_comparisons():
+    assert _compile({'Field': 'id', 'Op': '>=', 'Value': 3}) == ('`id` >= %s', [3])
+    assert _compile({'Field': 'id', 'Value': 'x'}) == ('`id` = %s', ['x'])
+    assert _compile({'Field': 'id', 'Op': '=', 'Value': None}) == ('`id` IS NULL', [])
+    assert _compile({'Field': 'id', 'Op': '!=', 'Value': None}) == ('`id` IS NOT NULL', [])
+    assert _compile({'Field': 'id', 'Op': 'between', 'Value': [1, 2]}) == ('`id` BETWEEN %s AND %s', [1, 2])
+    assert _compile({'Field': 'id', 'Op': 'IN', 'Value': [1, 2]}) == ('`id` IN (%s, %s)', [1, 2])
+
+
+def test_like_escapes_wildcards():
+    assert _compile({'Field': 'name', 'Op': 'LIKE', 'Value': 'a_b%'}) == ('`name` LIKE %s', ['a\\_b\\%%'])
+    assert _compile({'Field': 'name', 'Op': 'CONTAINS', 'Value': '1\\2'}) == ('`name` LIKE %s', ['%1\\\\2%'])
+
+
+@pytest.mark.parametrize('predicate, error', [
+    ({'Field': 'id', 'Op': '<', 'Value': None}, ValueError),
+    ({'Field': 'id', 'Op': 'BETWEEN', 'Value': [1]}, ValueError),
+    ({'Field': 'id', 'Op': 'IN', 'Value': []}, ValueError),
+    ({'Field': 'id', 'Op': 'REGEXP', 'Value': 'x'}, TypeError),
+    ({'Field': 'id; DROP', 'Op': '=', 'Value': 1}, ValueError),
+])
+def test_invalid_predicates(predicate, error):
+    with pytest.raises(error):
+        _compile(predicate)
+
+
+def test_keyset():
+    args = []
+    assert _compile_keyset([('a', False)], {'a': 1}, args) == '`a` > %s'
+    assert args == [1]
+    args = []
+    assert _compile_keyset([('a', False), ('b', True)], {'a': 1, 'b': 2}, args) == \
+        '((`a` > %s) OR (`a` = %s AND `b` < %s))'
+    assert args == [1, 1, 2]
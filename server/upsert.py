@@ -0,0 +1,145 @@
+"""
+Interface for importing rows which may already be in the table
+    Rows are matched by the primary or a unique key, updated or replaced, and skipped if unchanged
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import datetime
+import hashlib
+import threading
+import pymysql
+from changeset import sql_literal
+from sqlcreator import quote_identifier
+
+
+MODES = ('insert', 'upsert', 'replace')
+
+
+def normalize(value):
+    """ Returns the text of a value used to compare a row of a file with the row in the table
+
+    A value read from MySQL and the value converted from a file give the same text when they are equal,
+    values which only look different are taken as changed, which costs an update and never loses one
+
+    """
+    if value is None:
+        return '\x00'
+    if type(value) == datetime.datetime:
+        return value.isoformat(' ', 'seconds')
+    if type(value) == datetime.timedelta:
+        # TIME columns are read as timedelta
+        seconds = int(value.total_seconds())
+        sign = '-' if seconds < 0 else ''
+        seconds = abs(seconds)
+        return '%s%02d:%02d:%02d' % (sign, seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return str(value)
+
+
+def row_digest(values):
+    """ Returns the hash of the normalized values of a row """
+    return hashlib.blake2b('\x1f'.join(map(normalize, values)).encode('utf-8'), digest_size=8).digest()
+
+
+def unique_key(tool, database_name, table_name, names):
+    """ Returns the primary key of a table, or its first unique key, made of columns in names
+
+    Raise ReferenceError if the table has no such key, rows of the file could not be matched to rows of the table
+
+    """
+    keys = {}
+    sql = 'SHOW INDEX FROM %s.%s;' % (quote_identifier(database_name), quote_identifier(table_name))
+    for index in tool.execute_sql(sql).fetchall():
+        if int(index['Non_unique']) == 0:
+            keys.setdefault(index['Key_name'], []).append((int(index['Seq_in_index']), index['Column_name']))
+    ordered = sorted(keys.items(), key=lambda item: item[0] != 'PRIMARY')
+    for _, columns in ordered:
+        fields = tuple(name for _, name in sorted(columns))
+        if set(fields) <= set(names):
+            return fields
+    raise ReferenceError("表'%s'没有由导入数据组成的主键或唯一索引，无法更新导入！" % table_name)
+
+
+def upsert_statement(database_name, table_name, names, rows, mode, key_fields=()):
+    """ Returns the batched INSERT ... ON DUPLICATE KEY UPDATE ('upsert') or REPLACE ('replace') of rows,
+    the key columns are not updated """
+    table = quote_identifier(database_name) + '.' + quote_identifier(table_name)
+    columns = ', '.join(quote_identifier(name) for name in names)
+    values_str = ', '.join('(' + ', '.join(sql_literal(value_d[name]) for name in names) + ')' for value_d in rows)
+    if mode == 'replace':
+        return 'REPLACE INTO %s(%s) VALUES %s;' % (table, columns, values_str)
+    updated = [name for name in names if name not in key_fields] or names[:1]
+    update_str = ', '.join('%s=VALUES(%s)' % ((quote_identifier(name),) * 2) for name in updated)
+    return 'INSERT INTO %s(%s) VALUES %s ON DUPLICATE KEY UPDATE %s;' % (table, columns, values_str, update_str)
+
+
+def existing_keys(tool, database_name, table_name, key_fields, keys, chunk=1000):
+    """ Returns the positions in keys of the keys which are in the table
+
+    The keys are compared by MySQL with the types and collations of the key columns, as the unique key
+    matching the written rows compares them, so '1.50' of a file is found as the DECIMAL 1.5 of the table
+
+    """
+    found = set()
+    table = quote_identifier(database_name) + '.' + quote_identifier(table_name)
+    condition = ' AND '.join('t.%s = k._k%d' % (quote_identifier(name), i) for i, name in enumerate(key_fields))
+    for start in range(0, len(keys), chunk):
+        derived = ' UNION ALL '.join(
+            'SELECT %d AS _position, %s' % (start + i, ', '.join('%s AS _k%d' % (sql_literal(value), j)
+                                                                 for j, value in enumerate(key)))
+            for i, key in enumerate(keys[start:start + chunk]))
+        sql = 'SELECT k._position FROM (%s) AS k WHERE EXISTS (SELECT 1 FROM %s AS t WHERE %s);' % (
+            derived, table, condition)
+        for row in tool.execute_sql(sql, cursor_class=pymysql.cursors.Cursor).fetchall():
+            found.add(int(row[0]))
+    return found
+
+
+class RowIndex:
+    """ The hash of every row of a table by its key, loaded before an import which skips unchanged rows
+
+    Only the columns imported from the file are hashed, a row whose hash did not change is not sent again
+    The writers of the import share the index and record the rows they wrote
+
+    Attributions:
+    key_fields: the key columns of the rows
+    names: the hashed columns, in the order of row_digest
+    _digests: {normalized key: hash}
+
+    """
+
+    def __init__(self, key_fields, names):
+        self.key_fields = tuple(key_fields)
+        self.names = list(names)
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, tool, database_name, table_name, key_fields, names, batch_size=5000):
+        """ Returns the index of a table, read as a stream """
+        index = cls(key_fields, names)
+        width = len(index.key_fields)
+        columns = index.key_fields + tuple(names)
+        sql = 'SELECT %s FROM %s.%s;' % (', '.join(quote_identifier(name) for name in columns),
+                                         quote_identifier(database_name), quote_identifier(table_name))
+        cur = tool.execute_sql(sql, cursor_class=pymysql.cursors.SSCursor)
+        try:
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    index._digests[tuple(map(normalize, row[:width]))] = row_digest(row[width:])
+        finally:
+            cur.close()
+        return index
+
+    def __len__(self):
+        return len(self._digests)
+
+    def get(self, key):
+        with self._lock:
+            return self._digests.get(key)
+
+    def update(self, digests):
+        """ record the hashes of written rows, {normalized key: hash} """
+        with self._lock:
+            self._digests.update(digests)
@@ -0,0 +1,137 @@
+"""
+Interface for the distinct values of a column, used as suggestions of the column filter
+    Small columns are loaded once into a sorted dictionary, big ones are searched by prefix in MySQL
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import bisect
+import threading
+from collections import OrderedDict
+from catalog import SchemaCatalog
+from sqlcreator import SqlCreator, quote_identifier
+from tableversion import TableVersions
+import metrics
+
+
+class ValueDictionary(SchemaCatalog):
+    """ Suggest the distinct values of a column starting with a prefix, subclass of SchemaCatalog
+
+    A column with at most max_values distinct values is read once by SELECT DISTINCT and kept as a sorted
+    list, a prefix is then found by binary search without touching MySQL
+    A column with more values is searched by SELECT DISTINCT ... LIKE 'prefix%' LIMIT, which uses an index
+    starting with the column if there is one, and the answer of every prefix is cached
+    Everything cached for a table is dropped when its version changes
+
+    Attributions:
+    max_values: the largest number of distinct values loaded into a dictionary
+    _max_entries: the number of dictionaries and prefix answers kept in the cache
+    _values: cache keyed by (ip, port, database, table, column, prefix or None for the dictionary),
+            value is (etag, values), values is None for a column too big for a dictionary
+    _value_stats: hit/miss counters of the cache
+
+    """
+    max_values = 10000
+    _max_entries = 256
+    _values = OrderedDict()
+    _values_lock = threading.Lock()
+    _value_stats = {'hits': 0, 'misses': 0}
+
+    def _lookup(self, key, etag, loader):
+        with self._values_lock:
+            cached = self._values.get(key)
+            if cached is not None and cached[0] == etag:
+                self._values.move_to_end(key)
+                self._value_stats['hits'] += 1
+                return cached[1]
+            self._value_stats['misses'] += 1
+        value = loader()
+        with self._values_lock:
+            self._values[key] = (etag, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self._max_entries:
+                self._values.popitem(last=False)
+        return value
+
+    def suggest(self, database_name, table_name, column_name, prefix='', limit=20):
+        """ Interface for reading the distinct values of a column which start with a prefix
+
+        Parameters
+        ----------
+        database_name: String
+            name of an existed database
+        table_name: String
+            name of an existed table of above database
+        column_name: String
+            name of a column of above table
+        prefix: String
+            the typed text, compared case-insensitively, '' returns the first values
+        limit: int
+            the maximum number of values returned
+
+        Returns
+        -------
+        suggestions: dict
+            {"values": ["Alice", "Alan"], "complete": True, "etag": "..."},
+            complete is False if more values start with the prefix
+
+        """
+        if column_name not in self.column_names(database_name, table_name):
+            raise ReferenceError("列'%s'不存在！" % column_name)
+        etag = TableVersions.etag(database_name, table_name, self.update_time(database_name, table_name))
+        base = (self.ip, self.port, database_name, table_name, column_name)
+        dictionary = self._lookup(base + (None,), etag,
+                                  lambda: self._load_dictionary(database_name, table_name, column_name))
+        if dictionary is not None:
+            keys, values = dictionary
+            lowered = prefix.lower()
+            start = bisect.bisect_left(keys, lowered)
+            found = []
+            for index in range(start, len(keys)):
+                if not keys[index].startswith(lowered) or len(found) > limit:
+                    break
+                found.append(values[index])
+        else:
+            found = self._lookup(base + (prefix, limit), etag,
+                                 lambda: self._search(database_name, table_name, column_name, prefix, limit + 1))
+        return {'values': found[:limit], 'complete': len(found) <= limit, 'etag': etag}
+
+    def _load_dictionary(self, database_name, table_name, column_name):
+        column = quote_identifier(column_name)
+        sql = 'SELECT DISTINCT %s AS value FROM %s.%s WHERE %s IS NOT NULL LIMIT %d;' % (
+            column, quote_identifier(database_name), quote_identifier(table_name), column, self.max_values + 1)
+        rows = self.execute_sql(sql).fetchall()
+        if len(rows) > self.max_values:
+            return None
+        pairs = sorted(((str(row['value']).lower(), row['value']) for row in rows), key=lambda pair: pair[0])
+        return [key for key, _ in pairs], [value for _, value in pairs]
+
+    def _search(self, database_name, table_name, column_name, prefix, limit):
+        column = quote_identifier(column_name)
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql = 'SELECT DISTINCT %s AS value FROM %s.%s WHERE %s LIKE %%s ORDER BY %s LIMIT %d;' % (
+            column, quote_identifier(database_name), quote_identifier(table_name), column, column, limit)
+        return [row['value'] for row in self.execute_sql(sql, (pattern,)).fetchall()]
+
+    @classmethod
+    def on_commit(cls, changes):
+        """ commit listener of SqlCreator, drops the values of changed tables to free memory early """
+        with cls._values_lock:
+            for change in changes:
+                for key in list(cls._values):
+                    if key[2] == change['database'] and (change['table'] is None or key[3] == change['table']):
+                        del cls._values[key]
+
+    @classmethod
+    def cache_stats(cls):
+        """ collector of the value cache for metrics.REGISTRY """
+        with cls._values_lock:
+            stats = dict(cls._value_stats)
+            size = len(cls._values)
+        return [
+            ('dmp_value_cache_requests_total', 'counter', 'Column value suggestion cache lookups by result.',
+             [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])]),
+            ('dmp_value_cache_entries', 'gauge', 'Column dictionaries and prefix answers cached.', [({}, size)]),
+        ]
+
+
+metrics.REGISTRY.register_collector(ValueDictionary.cache_stats)
+SqlCreator.add_commit_listener(ValueDictionary.on_commit)
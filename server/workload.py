@@ -0,0 +1,56 @@
+"""
+Interface for collecting the SELECT workload executed through DBConnector
+    The workload is read by the query analyzer to find slow statements and missing indexes
+"""
+#    for Data Manage Platform(TJU CS2018-3)
+import threading
+import time
+
+
+class QueryWorkload:
+    """ Count the SELECT statements executed by DBConnector.execute_sql
+
+    Statements are grouped by their text, parameterized statements by their template with %s placeholders,
+    so every query shape of retrieve_object_sql is one entry no matter which values it was run with
+
+    Attributions:
+    max_entries: the maximum number of distinct statements kept, the least used one is dropped first
+    _entries: a dictionary keyed by statement text, value is a dictionary of its statistics
+
+    """
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, args, seconds, database_name=None):
+        """ record one executed statement, statements other than SELECT are ignored """
+        if not sql.lstrip()[:6].upper() == 'SELECT':
+            return
+        with self._lock:
+            entry = self._entries.get(sql)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    least = min(self._entries, key=lambda k: self._entries[k]['count'])
+                    del self._entries[least]
+                entry = self._entries[sql] = {'sql': sql, 'count': 0, 'total_time': 0.0, 'max_time': 0.0,
+                                              'args': None, 'database': database_name, 'last_seen': 0.0}
+            entry['count'] += 1
+            entry['total_time'] += seconds
+            entry['max_time'] = max(entry['max_time'], seconds)
+            entry['args'] = list(args) if isinstance(args, (list, tuple)) else args
+            entry['last_seen'] = time.time()
+
+    def entries(self, min_count=1):
+        """ Returns copies of the recorded statements executed at least min_count times, most frequent first """
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values() if entry['count'] >= min_count]
+        return sorted(entries, key=lambda entry: entry['count'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+WORKLOAD = QueryWorkload()
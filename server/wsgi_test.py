@@ -3,11 +3,31 @@ from flask import jsonify
 from flask import request
 from flask import Response
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 from connect_database import Oprations_of_Database    #引入我们的数据库操作类
 from dbconn import DBConnector
 from dbconn import DBPrinter
 from sqlcreator import SqlCreator
+from catalog import SchemaCatalog
+from rowcount import RowCounter
+from advisor import QueryAnalyzer
+from tableversion import TableVersions
+from compression import ResponseCompressor
+from changefeed import ChangeBroker
+from columnstats import TableProfiler
+from valuedict import ValueDictionary
+from rollup import RollupManager
+from importjobs import IMPORTS
+import upsert
+import sources
+from importstate import checkpoints
+import metrics
 import json
+import time
+import hashlib
+import os
+import tempfile
+import shutil
 
 #创建数据库操作类实例
 op_mysql = Oprations_of_Database("***","***","***","***")
@@ -18,8 +38,52 @@ db_config = {
     "username" : "root",
     "password" : "123456"
 }
+# 目录导入只允许读取此目录之下的文件
+import_root = os.environ.get('DMP_IMPORT_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imports'))
 app = Flask(__name__)
 CORS(app)
+compressor = ResponseCompressor(min_size=1024, levels={'gzip': 6, 'br': 4, 'zstd': 3})
+
+
+# 请求指标中间件
+@app.before_request
+def metrics_before_request():
+    request.metrics_start = time.perf_counter()
+    metrics.begin_request()
+    metrics.REQUESTS_IN_FLIGHT.inc()
+
+
+@app.after_request
+def metrics_after_request(response):
+    start = getattr(request, 'metrics_start', None)
+    if start is None:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, (route, request.method, response.status_code))
+    if not response.is_streamed:
+        metrics.RESPONSE_SIZE.observe(response.calculate_content_length() or 0, (route, request.method))
+    db_time, serialize_time = metrics.request_times()
+    metrics.REQUEST_DB_TIME.observe(db_time, (route,))
+    metrics.REQUEST_SERIALIZE_TIME.observe(serialize_time, (route,))
+    return response
+
+
+@app.teardown_request
+def metrics_teardown_request(error=None):
+    if getattr(request, 'metrics_start', None) is not None:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+
+
+# 响应压缩，注册在指标中间件之后，先于它执行，所以指标记录的是压缩后的大小
+@app.after_request
+def compress_after_request(response):
+    return compressor.compress_response(response, request.headers.get('Accept-Encoding', ''))
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # 路由
 @app.route('/')    
 def first():        # 视图函数
@@ -41,6 +105,11 @@ def login():        # 视图函数 从request中接收到的值是bytes 字节
         op_mysql.Password = Password
         isLogin = op_mysql.build_connection()
         if isLogin is True:
+            db_config["ip"] = IP
+            db_config["port"] = port
+            db_config["username"] = Username
+            db_config["password"] = Password
+            SchemaCatalog.invalidate()
             response.data = "登陆成功"
             response.status_code = 200
         else:
@@ -51,21 +120,253 @@ def login():        # 视图函数 从request中接收到的值是bytes 字节
     else:
         return 'way -> OPTIONS'
 
+def conditional_response(response, etag=None, last_modified=None):
+    # 带校验器的响应，客户端用If-None-Match重新验证，未修改时返回304
+    if etag is None:
+        response.add_etag()
+    else:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def not_modified(etag, last_modified=None):
+    response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def open_catalog():
+    SchemaCatalog.init_config(db_config)
+    catalog = SchemaCatalog()
+    catalog.connect_db()
+    return catalog
+
 @app.route('/main_page/select-database',methods=['GET'])
 def get_database_list():
-    database_list = op_mysql.find_all_database()
-    result = [{'database_name': item[0]} for item in database_list]
-    return jsonify(result)
+    catalog = open_catalog()
+    result = catalog.databases(refresh=request.args.get('refresh') == '1')
+    catalog.close_db()
+    return conditional_response(jsonify(result))
 
 @app.route('/data_home',methods=['GET'])
 def get_tables():
     if request.method == 'GET' and request.args.get('name','FLASK') != 'FLASK':
         name_selected = request.args.get('name')
-        flag_select_db = op_mysql.select_database(name_selected)
-        show_tables = op_mysql.get_all_tables()
-        result = [item[0] for item in show_tables]
+        catalog = open_catalog()
+        result = list(catalog.schema(name_selected, refresh=request.args.get('refresh') == '1'))
+        catalog.close_db()
 
-        return jsonify(result)
+        return conditional_response(jsonify(result))
+
+@app.route('/data_home/catalog',methods=['GET'])
+def get_catalog():
+    if request.method == 'GET' and request.args.get('name','FLASK') != 'FLASK':
+        name_selected = request.args.get('name')
+        catalog = open_catalog()
+        tables = catalog.schema(name_selected, refresh=request.args.get('refresh') == '1')
+        catalog.close_db()
+        with metrics.serialize_timer():
+            response = jsonify({'database': name_selected, 'tables': list(tables.values())})
+        return conditional_response(response)
+
+
+@app.route('/data_home/row_count', methods=['GET'])
+def get_row_count():
+    if(request.method == 'GET' and request.args.get('db_selected', 'FLASK') != 'FLASK' and request.args.get('table_selected', 'FLASK') != 'FLASK'):
+        db_selected = request.args.get('db_selected')
+        table_selected = request.args.get('table_selected')
+        RowCounter.init_config(db_config)
+        counter = RowCounter()
+        counter.connect_db()
+        try:
+            ret = counter.count(db_selected, table_selected, wait=request.args.get('wait') == '1')
+        except ValueError as error_info:
+            return Response(str(error_info), status=400)
+        finally:
+            counter.close_db()
+        return jsonify(ret)
+
+
+@app.route('/data_home/profile', methods=['GET'])
+def get_table_profile():
+    if(request.method == 'GET' and request.args.get('db_selected', 'FLASK') != 'FLASK' and request.args.get('table_selected', 'FLASK') != 'FLASK'):
+        db_selected = request.args.get('db_selected')
+        table_selected = request.args.get('table_selected')
+        try:
+            top_k = min(max(int(request.args.get('top_k', 10)), 1), 100)
+            bins = min(max(int(request.args.get('bins', 20)), 1), 200)
+        except ValueError:
+            return Response("top_k和bins应为整数", status=400)
+        TableProfiler.init_config(db_config)
+        profiler = TableProfiler()
+        profiler.connect_db()
+        # 同一版本的表直接返回缓存的统计结果
+        ret = profiler.profile(db_selected, table_selected, top_k, bins, refresh=request.args.get('refresh') == '1')
+        profiler.close_db()
+        with metrics.serialize_timer():
+            response = jsonify(ret)
+        return conditional_response(response, ret['etag'] + '-%d-%d' % (top_k, bins))
+
+
+@app.route('/data_home/column_values', methods=['GET'])
+def get_column_values():
+    if(request.method == 'GET' and request.args.get('db_selected', 'FLASK') != 'FLASK' and request.args.get('table_selected', 'FLASK') != 'FLASK'
+       and request.args.get('column', 'FLASK') != 'FLASK'):
+        db_selected = request.args.get('db_selected')
+        table_selected = request.args.get('table_selected')
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+        except ValueError:
+            return Response("limit应为整数", status=400)
+        ValueDictionary.init_config(db_config)
+        dictionary = ValueDictionary()
+        dictionary.connect_db()
+        ret = dictionary.suggest(db_selected, table_selected, request.args.get('column'),
+                                 request.args.get('prefix', ''), limit)
+        dictionary.close_db()
+        return conditional_response(jsonify(ret))
+
+
+@app.route('/data_home/rollup', methods=['GET', 'POST'])
+def table_rollup():
+    if(request.args.get('db_selected', 'FLASK') != 'FLASK' and request.args.get('table_selected', 'FLASK') != 'FLASK'):
+        db_selected = request.args.get('db_selected')
+        table_selected = request.args.get('table_selected')
+        RollupManager.init_config(db_config)
+        manager = RollupManager()
+        manager.connect_db()
+        if request.method == 'POST':
+            # 未指定分组列时按log_labels的时间分桶和维度创建默认汇总表
+            body = request.get_json(silent=True) or {}
+            if body.get('rebuild'):
+                ret = {'rebuilt': manager.rebuild(db_selected, table_selected)}
+            else:
+                ret = {'created': manager.create(db_selected, table_selected, body.get('columns'))}
+            manager.close_db()
+            return jsonify(ret)
+        group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+        try:
+            filters = json.loads(request.args.get('filters', '{}'))
+        except ValueError:
+            filters = None
+        if not isinstance(filters, dict):
+            manager.close_db()
+            return Response("filters应为JSON对象", status=400)
+        ret = manager.count(db_selected, table_selected, group_by, filters)
+        manager.close_db()
+        with metrics.serialize_timer():
+            response = jsonify(ret)
+        return conditional_response(response)
+
+
+@app.route('/data_home/advisor', methods=['GET', 'POST'])
+def index_advisor():
+    try:
+        min_count = int(request.args.get('min_count', 2))
+    except ValueError:
+        return Response("min_count应为整数", status=400)
+    QueryAnalyzer.init_config(db_config)
+    analyzer = QueryAnalyzer()
+    analyzer.connect_db()
+    reports = analyzer.analyze_workload(1)
+    recommendations = analyzer.recommend_indexes(min_count, reports)
+    ret = {'queries': reports, 'recommendations': recommendations}
+    if request.method == 'POST':
+        # 只创建请求中指定的索引，未指定时创建所有推荐的索引
+        selected = request.get_json(silent=True) or {}
+        names = selected.get('indexes')
+        if names is not None:
+            recommendations = [item for item in recommendations if item['name'] in names]
+        ret['status'] = analyzer.create_indexes(recommendations)
+    analyzer.close_db()
+    return jsonify(ret)
+
+
+@app.route('/data_home/changes', methods=['GET'])
+def table_changes():
+    if(request.method == 'GET' and request.args.get('db_selected', 'FLASK') != 'FLASK' and request.args.get('table_selected', 'FLASK') != 'FLASK'):
+        db_selected = request.args.get('db_selected')
+        table_selected = request.args.get('table_selected')
+        response = Response(ChangeBroker.stream(db_selected, table_selected), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+@app.route('/data_home/data_range', methods=['GET'])
+def get_table_range():
+    if(request.method == 'GET' and request.args.get('db_selected', 'FLASK') != 'FLASK' and request.args.get('table_selected', 'FLASK') != 'FLASK'):
+        db_selected = request.args.get('db_selected')
+        table_selected = request.args.get('table_selected')
+        try:
+            offset = max(int(request.args.get('offset', 0)), 0)
+            limit = min(max(int(request.args.get('limit', 200)), 1), 1000)
+            after = json.loads(request.args.get('after')) if request.args.get('after') else None
+        except ValueError:
+            return Response("参数格式错误", status=400)
+        if after is not None and not isinstance(after, dict):
+            return Response("参数格式错误", status=400)
+        RowCounter.init_config(db_config)
+        counter = RowCounter()
+        counter.connect_db()
+        update_time = counter.update_time(db_selected, table_selected)
+        etag = TableVersions.etag(db_selected, table_selected, update_time) + '-' + \
+            hashlib.sha1(request.query_string).hexdigest()[:8]
+        if request.if_none_match.contains_weak(etag):
+            counter.close_db()
+            return not_modified(etag, update_time)
+
+        table = counter.table(db_selected, table_selected)
+        if table is None:
+            counter.close_db()
+            return Response("数据表不存在", status=404)
+        key_fields = table['primary_key']
+        spec = {'Fields': [], 'Limit': limit}
+        if key_fields:
+            spec['OrderBy'] = key_fields
+        if request.args.get('search') and request.args.get('search_col'):
+            if request.args.get('search_col') not in [column['name'] for column in table['columns']]:
+                counter.close_db()
+                return Response("搜索列不存在", status=400)
+            # 按子串匹配，与原先表格内的筛选一致
+            spec['Where'] = [{'Field': request.args.get('search_col'), 'Op': 'CONTAINS',
+                              'Value': request.args.get('search')}]
+        # 顺序滚动时客户端给出上一窗口最后一行的主键，用键集分页代替大偏移量
+        if after is not None and key_fields:
+            spec['After'] = after
+        else:
+            spec['Start'] = offset
+
+        SqlCreator.init_config(db_config)
+        sc = SqlCreator()
+        sc.connect_db()
+        try:
+            _, rows = sc.retrieve_object_sql(json.dumps(spec), db_selected, table_selected)
+            if 'Where' in spec:
+                total = count_matches(sc, spec, db_selected, table_selected)
+            else:
+                total = counter.count(db_selected, table_selected)
+        except (ValueError, TypeError) as error_info:
+            return Response("参数格式错误：%s" % error_info, status=400)
+        finally:
+            sc.close_db()
+            counter.close_db()
+
+        ret = {'cols': [{"prop": column['name'], "label": column['name']} for column in table['columns']],
+               'key': key_fields, 'offset': offset, 'rows': list(rows), 'total': total}
+        with metrics.serialize_timer():
+            response = jsonify(ret)
+        return conditional_response(response, etag, update_time)
+
+def count_matches(sc, spec, db_selected, table_selected, cap=100000):
+    # 带过滤条件时最多数到cap行，超过时返回估计值
+    sql, args = sc.compile_retrieve_sql({'Fields': [], 'Where': spec['Where'], 'Limit': cap}, db_selected, table_selected)
+    total = sc.execute_sql('SELECT COUNT(*) AS total FROM (%s) AS matched;' % sql.rstrip(';'), args).fetchone()['total']
+    return {'count': int(total), 'exact': int(total) < cap, 'computed_at': time.time()}
 
 
 @app.route('/data_home/data_query', methods=['GET'])
@@ -74,27 +375,29 @@ def get_tables_details():
         db_selected = request.args.get('db_selected')
         table_selected = request.args.get('table_selected')
         db_config["database"] = db_selected
-        DBConnector.init_config(db_config)
-        db_printer = DBPrinter()
-        db_printer.print_databases()
-        descriptions = json.loads(db_printer.print_columns(db_selected, table_selected))
-        data = json.loads(db_printer.print_table(db_selected, table_selected))
+        catalog = open_catalog()
+        update_time = catalog.update_time(db_selected, table_selected)
+        etag = TableVersions.etag(db_selected, table_selected, update_time)
+        if request.if_none_match.contains_weak(etag):
+            catalog.close_db()
+            return not_modified(etag, update_time)
+        descriptions = catalog.column_names(db_selected, table_selected)
+        tableData = list(catalog.table_rows(db_selected, table_selected).fetchall())
+        catalog.close_db()
         cols = []
-        for item in descriptions['Fields']:
+        for item in descriptions:
             cols.append({"prop" : item, "label" : item})
-        tableData = []
-        for key in data:
-            tableData.append(data[key])
         fields = []
-        for item in descriptions['Fields']:
+        for item in descriptions:
             fields.append({item : item})
         ret = {}
         ret['cols'] = cols
         ret['tableData'] = tableData
         ret['fields'] = fields
-        print(ret)
-        
-        return jsonify(ret)
+
+        with metrics.serialize_timer():
+            response = jsonify(ret)
+        return conditional_response(response, etag, update_time)
 
 @app.route('/data_update',methods=['POST','OPTIONS'])    
 def update():        # 视图函数 从request中接收到的值是bytes 字节码，需要decode('utf8')用utf-8解码
@@ -116,6 +419,7 @@ def update():        # 视图函数 从request中接收到的值是bytes 字节
         print(json.dumps(containt['json']))
         print(sc.update_object_sql(json.dumps(containt['json']), containt['info']['db'], containt['info']['table']))
         print(sc.commit_all())
+        sc.close_db()
         response.data = "成功"
         response.status_code = 200
         return response
@@ -143,6 +447,7 @@ def delete():        # 视图函数 从request中接收到的值是bytes 字节
         print(json.dumps(containt['json']))
         print(sc.delete_object_sql(json.dumps(containt['json']), containt['info']['db'], containt['info']['table']))
         print(sc.commit_all())
+        sc.close_db()
         response.data = "成功"
         response.status_code = 200
         return response
@@ -170,6 +475,7 @@ def add():        # 视图函数 从request中接收到的值是bytes 字节码
         print(json.dumps(containt['json']))
         print(sc.create_object_sql(json.dumps(containt['json']), containt['info']['db'], containt['info']['table']))
         print(sc.commit_all())
+        sc.close_db()
         response.data = "成功"
         response.status_code = 200
         return response
@@ -178,5 +484,130 @@ def add():        # 视图函数 从request中接收到的值是bytes 字节码
         return 'way -> OPTIONS'
 
 
+def upload_name(filename):
+    # 上传文件名只保留安全的字符，中文文件名等被清空时按原扩展名命名为upload
+    name = secure_filename(filename)
+    extension, compression = sources.split_name(filename.replace('\\', '/'))[1:]
+    suffix = (extension or '') + (compression or '')
+    if not name or not name.lower().endswith(suffix):
+        name = secure_filename('upload' + suffix) or 'upload'
+    return name
+
+
+@app.route('/import/jobs', methods=['GET', 'POST'])
+def import_jobs():
+    if request.method == 'POST':
+        # 上传文件后立即返回任务编号，导入在后台进行，客户端轮询或订阅进度
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return Response("缺少导入文件", status=400)
+        options = {}
+        for name in ('key_number', 'sheet_seq', 'processes'):
+            if request.form.get(name) is not None:
+                try:
+                    options[name] = int(request.form.get(name))
+                except ValueError:
+                    return Response("%s应为整数" % name, status=400)
+        for name in ('bulk', 'ordered', 'skip_unchanged'):
+            if request.form.get(name) is not None:
+                options[name] = request.form.get(name) != '0'
+        if request.form.get('mode') is not None:
+            if request.form.get('mode') not in upsert.MODES:
+                return Response("不支持的导入模式", status=400)
+            options['mode'] = request.form.get('mode')
+        if request.form.get('indexes'):
+            # 例如 [["stype"], {"Columns": ["device", "time"], "Unique": true}]
+            try:
+                options['indexes'] = json.loads(request.form.get('indexes'))
+            except ValueError:
+                return Response("索引格式错误", status=400)
+        # 每个任务的上传文件在各自的临时目录中，任务结束时删除
+        upload_dir = tempfile.mkdtemp(prefix='dmp-import-')
+        path = os.path.join(upload_dir, upload_name(upload.filename))
+        upload.save(path)
+        try:
+            # 同一文件之前未完成的导入默认从最后提交的批次之后继续
+            job = IMPORTS.submit(db_config, request.form.get('kind', 'csv'), path,
+                                 request.form.get('database'), request.form.get('table'), options,
+                                 resume=request.form.get('resume', '1') != '0', cleanup=upload_dir)
+        except TypeError as error_info:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            return Response(str(error_info), status=400)
+        return jsonify(job.snapshot()), 202
+    return jsonify(IMPORTS.jobs())
+
+
+def valid_rules(rules):
+    # 例如 [{"Pattern": "sales_*.csv", "Database": "shop", "Table": "sales", "Sheet": 0}]
+    if not isinstance(rules, list):
+        return False
+    for rule in rules:
+        if not isinstance(rule, dict) or not isinstance(rule.get('Pattern'), str) \
+                or not isinstance(rule.get('Table'), str):
+            return False
+        if not isinstance(rule.get('Database', ''), str) or type(rule.get('Sheet', 0)) != int:
+            return False
+    return True
+
+
+@app.route('/import/directory', methods=['POST'])
+def import_directory():
+    # 导入服务器上一个目录中的全部文件，已完整导入过的文件（按内容哈希）会被跳过
+    params = request.get_json(silent=True) or {}
+    if not params.get('directory'):
+        return Response("缺少导入目录", status=400)
+    # 不接受manifest_path，不允许客户端指定服务器上写入的文件，清单可在任务结果中读取
+    options = dict((name, params[name]) for name in ('pattern', 'rules', 'workers', 'connection_budget',
+                                                      'mode', 'skip_unchanged')
+                   if params.get(name) is not None)
+    if options.get('mode', 'insert') not in upsert.MODES:
+        return Response("不支持的导入模式", status=400)
+    for name in ('workers', 'connection_budget'):
+        if name in options and (type(options[name]) != int or options[name] < 1):
+            return Response("%s应为正整数" % name, status=400)
+    if 'skip_unchanged' in options and not isinstance(options['skip_unchanged'], bool):
+        return Response("skip_unchanged应为布尔值", status=400)
+    if 'rules' in options and not valid_rules(options['rules']):
+        return Response("导入规则格式错误", status=400)
+    pattern = options.get('pattern', '*.csv')
+    if not isinstance(pattern, str) or os.path.isabs(pattern) or '..' in pattern.replace('\\', '/').split('/'):
+        return Response("文件匹配模式应为导入目录中的相对路径", status=400)
+    # 相对路径从导入根目录开始，解析符号链接后必须仍在导入根目录之下
+    root = os.path.realpath(import_root)
+    directory = os.path.realpath(os.path.join(root, str(params['directory'])))
+    if os.path.commonpath([root, directory]) != root:
+        return Response("导入目录不在允许的范围内", status=403)
+    if not os.path.isdir(directory):
+        return Response("导入目录不存在", status=400)
+    job = IMPORTS.submit(db_config, 'directory', directory, params.get('database'), None, options)
+    return jsonify(job.snapshot()), 202
+
+
+@app.route('/import/checkpoints', methods=['GET'])
+def import_checkpoints():
+    return jsonify(checkpoints().unfinished())
+
+
+@app.route('/import/jobs/<job_id>', methods=['GET', 'DELETE'])
+def import_job(job_id):
+    if request.method == 'DELETE':
+        job = IMPORTS.cancel(job_id)
+    else:
+        job = IMPORTS.get(job_id)
+    if job is None:
+        return Response("导入任务不存在", status=404)
+    return jsonify(job.snapshot())
+
+
+@app.route('/import/jobs/<job_id>/events', methods=['GET'])
+def import_job_events(job_id):
+    if IMPORTS.get(job_id) is None:
+        return Response("导入任务不存在", status=404)
+    response = Response(IMPORTS.stream(job_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 if __name__ == '__main__' :
-    app.run(host="127.0.0.1",port= 8080,debug=True)
\ No newline at end of file
+    app.run(host="127.0.0.1",port= 8080,debug=True,threaded=True)
\ No newline at end of file